@@ -5,8 +5,10 @@ VERSÃO PostgreSQL
 """
 
 import os
+import threading
+from collections import OrderedDict
 import dash
-from dash import dcc, html, Input, Output, State, dash_table, callback_context, no_update, ALL
+from dash import dcc, html, Input, Output, State, dash_table, callback_context, no_update, ALL, Patch
 import dash_bootstrap_components as dbc
 from dotenv import load_dotenv
 
@@ -14,9 +16,12 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Importar módulos do banco de dados
-from database import init_db
+from database import init_db, db
 from data_processor_postgres import PoolDataProcessor
-import pandas as pd
+from audit import audit_log, history_page
+from search_flight import search_flight
+from metrics import metrics, cache_metrics
+from table_render import TABLE_COLUMN_FIELDS, BR_DATE_FORMAT, ISO_DATE_FORMAT, format_dates, table_columns
 
 # Inicializar banco de dados
 init_db()
@@ -39,33 +44,91 @@ server = app.server
 data_processor = PoolDataProcessor()
 # NÃO carregar dados na inicialização - lazy loading para economizar memória
 
-# Opções para selects (cache)
-_cached_options = {}
+# Métricas dos callbacks, pool e caches em /metrics (texto do Prometheus)
+metrics.init_app(server)
+metrics.register_collector(lambda: cache_metrics({
+    'snapshot': (data_processor.snapshot_stats['hits'], data_processor.snapshot_stats['reloads']),
+    'kpis': (data_processor.kpi_stats['hits'], data_processor.kpi_stats['misses']),
+    'results': (data_processor.result_cache.stats['hits'], data_processor.result_cache.stats['misses']),
+    'callbacks': (callback_memo_stats['hits'], callback_memo_stats['misses']),
+}))
+metrics.register_collector(lambda: [
+    ('app_result_cache_evictions_total', 'counter', 'Visões removidas do cache de seleções (LRU)',
+     [({}, data_processor.result_cache.stats['evictions'])]),
+    ('app_result_cache_entries', 'gauge', 'Visões no cache de seleções', [({}, len(data_processor.result_cache))]),
+])
+metrics.register_collector(lambda: [
+    ('app_audit_records_total', 'counter', 'Registros de auditoria por etapa da gravação',
+     [({'stage': stage}, audit_log.stats[stage]) for stage in ('queued', 'written', 'dropped')]),
+    ('app_audit_batches_total', 'counter', 'Lotes de auditoria gravados e com falha',
+     [({'outcome': 'written'}, audit_log.stats['batches']),
+      ({'outcome': 'failed'}, audit_log.stats['failures'])]),
+    ('app_audit_queue_size', 'gauge', 'Registros de auditoria aguardando gravação', [({}, audit_log.pending())]),
+])
+metrics.register_collector(lambda: [
+    ('app_search_requests_total', 'counter', 'Buscas recebidas e descartadas por serem substituídas',
+     [({'outcome': 'received'}, search_flight.stats['requests']),
+      ({'outcome': 'dropped'}, search_flight.stats['dropped'])]),
+])
+metrics.register_collector(lambda: [
+    ('app_table_rows_total', 'counter', 'Linhas da tabela servidas do cache de renderização ou renderizadas',
+     [({'source': 'cache'}, data_processor.render_stats['cached_rows']),
+      ({'source': 'rendered'}, data_processor.render_stats['rendered_rows'])]),
+])
+
+
+# Memo dos callbacks: (callback, entradas, versão dos dados) → saídas
+CALLBACK_MEMO_SIZE = int(os.getenv("CALLBACK_MEMO_SIZE", 128))
+_callback_memo = OrderedDict()
+_callback_memo_lock = threading.Lock()
+callback_memo_stats = {'hits': 0, 'misses': 0}
+
+def memoized(name, key, compute):
+    """
+    Retorna o resultado memoizado de `compute()` para (name, key)
+    
+    `key` deve incluir data_processor.cache_version quando o resultado
+    depende dos dados; entradas antigas saem por LRU.
+    """
+    memo_key = (name, key)
+    with _callback_memo_lock:
+        if memo_key in _callback_memo:
+            _callback_memo.move_to_end(memo_key)
+            callback_memo_stats['hits'] += 1
+            return _callback_memo[memo_key]
+        callback_memo_stats['misses'] += 1
+    
+    value = compute()
+    with _callback_memo_lock:
+        _callback_memo[memo_key] = value
+        while len(_callback_memo) > CALLBACK_MEMO_SIZE:
+            _callback_memo.popitem(last=False)
+    return value
 
 def clear_cached_options():
-    """Limpa o cache de opções para forçar reload"""
-    global _cached_options
-    _cached_options = {}
-
-def get_status_options(force_reload=False):
-    """Lazy loading de opções de status"""
-    if force_reload or 'status' not in _cached_options:
-        _cached_options['status'] = [{"label": s, "value": s} for s in data_processor.get_statuses()]
-    return _cached_options['status']
-
-def get_tech_options(force_reload=False):
-    """Lazy loading de opções de técnicos"""
-    if force_reload or 'tech' not in _cached_options:
+    """Limpa o memo dos callbacks (inclui as opções) para forçar reload"""
+    with _callback_memo_lock:
+        _callback_memo.clear()
+
+def get_status_options():
+    """Opções de status (memoizadas pela versão dos dados)"""
+    return memoized('status-options', data_processor.cache_version, lambda: [
+        {"label": s, "value": s} for s in data_processor.get_statuses()
+    ])
+
+def get_tech_options():
+    """Opções de técnicos (memoizadas pela versão dos dados)"""
+    def build():
         tech_names = data_processor.get_technicians()
         print(f"🔍 DEBUG: Piscineiros encontrados: {tech_names}")  # DEBUG
-        _cached_options['tech'] = {
+        return {
             'edit': ([{"label": "Sem Piscineiro", "value": "Não atribuído"}] +
                     [{"label": f"🏊 {t}", "value": t} for t in tech_names]),
             'filter': ([{"label": "Todos os Piscineiros", "value": "Todos"},
                        {"label": "Sem Piscineiro", "value": "Não atribuído"}] +
                       [{"label": f"🏊 {t}", "value": t} for t in tech_names])
         }
-    return _cached_options['tech']
+    return memoized('tech-options', data_processor.cache_version, build)
 
 STATUS_OPTIONS = []  # Inicializar vazio, será preenchido no primeiro uso
 TECH_EDIT_OPTIONS = []  # Lazy loading
@@ -77,6 +140,34 @@ CHARGE_METHOD_OPTIONS = [
     {"label": "N/A", "value": "N/A"}
 ]
 
+# Inputs que mudam o conjunto filtrado ou a ordem (voltam a tabela para a página 1)
+RESET_PAGE_PROPS = {
+    "status-filter.value",
+    "tech-filter.value",
+    "last-change-filter.value",
+    "next-change-filter.value",
+    "search-seq-store.data",
+    "customers-table.sort_by"
+}
+
+# Histórico de auditoria: rótulos das ações e dos campos (colunas do banco)
+AUDIT_ACTION_LABELS = {"create": "Criação", "update": "Alteração", "delete": "Exclusão"}
+AUDIT_FIELD_LABELS = {
+    "nome": "Nome",
+    "status": "Status",
+    "piscineiro": "Piscineiro",
+    "valor_rota": "Valor Rota",
+    "tipo_filtro": "Tipo Filtro",
+    "valor_filtro": "Valor Filtro",
+    "ultima_troca": "Última Troca",
+    "proxima_troca": "Próxima Troca"
+}
+
+# Busca: espera (ms) após a última tecla antes de enviar ao servidor.
+# Buscas substituídas por uma mais nova do mesmo navegador são descartadas
+# em qualquer worker (search_flight, sequência compartilhada pelo banco)
+SEARCH_DEBOUNCE_MS = int(os.getenv("SEARCH_DEBOUNCE_MS", 300))
+
 # ===== LAYOUT DO DASHBOARD =====
 app.layout = dbc.Container([
     # Header com logo e botão Novo Cliente
@@ -88,6 +179,12 @@ app.layout = dbc.Container([
             ], width=8),
             dbc.Col([
                 html.Div([
+                    dbc.Button(
+                        [html.I(className="fas fa-history me-2"), "Histórico"],
+                        id="btn-history",
+                        color="secondary",
+                        className="btn-export me-2"
+                    ),
                     dbc.Button(
                         [html.I(className="fas fa-download me-2"), "Exportar CSV"],
                         id="btn-export",
@@ -163,6 +260,7 @@ app.layout = dbc.Container([
                     id="search-input",
                     type="text",
                     placeholder="Buscar cliente...",
+                    debounce=SEARCH_DEBOUNCE_MS,  # envia só depois que o usuário para de digitar
                     style={'paddingLeft': '2.5rem'}
                 )
             ], style={'position': 'relative'})
@@ -240,6 +338,33 @@ app.layout = dbc.Container([
             )
         ], md=2)
     ], className="mb-3"),
+    
+    # Edição em massa: aparece quando há clientes selecionados (em qualquer página)
+    html.Div([
+        html.Span(id="bulk-selection-count", className="me-3"),
+        dbc.Button(
+            [html.I(className="fas fa-users-cog me-2"), "Editar selecionados"],
+            id="btn-bulk-edit",
+            color="primary",
+            size="sm",
+            className="me-2"
+        ),
+        dbc.Button(
+            [html.I(className="fas fa-check-double me-2"), "Selecionar todos os filtrados"],
+            id="btn-bulk-select-all",
+            color="secondary",
+            outline=True,
+            size="sm",
+            className="me-2"
+        ),
+        dbc.Button(
+            "Limpar seleção",
+            id="btn-bulk-clear",
+            color="link",
+            size="sm"
+        )
+    ], id="bulk-edit-bar", className="mb-3", style={'display': 'none'}),
+    
     # Tabela de Clientes com botões de ação
     dcc.Loading(
         id="loading-table",
@@ -248,11 +373,11 @@ app.layout = dbc.Container([
             html.Div(id="table-with-actions", children=[
                 dash_table.DataTable(
                     id="customers-table",
-                    columns=[],
+                    columns=table_columns(),
                     data=[],
                     markdown_options={'html': True},
                     selected_rows=[],
-                    row_selectable='single',
+                    row_selectable='multi',
                     style_table={
                         'overflowX': 'auto',
                         'minWidth': '100%'
@@ -318,10 +443,12 @@ app.layout = dbc.Container([
                 },
                 style_as_list_view=True,
                 page_size=12,
-                page_action="native",
+                page_action="custom",
                 page_current=0,
-                sort_action="native",
-                sort_mode="multi"
+                page_count=0,
+                sort_action="custom",
+                sort_mode="multi",
+                sort_by=[]
             ),
             html.Div(id="action-buttons-container")
             ])
@@ -429,15 +556,139 @@ app.layout = dbc.Container([
             ])
         ]),
         dbc.ModalFooter([
+            dbc.Button(
+                [html.I(className="fas fa-history me-2"), "Histórico"],
+                id="btn-customer-history",
+                className="me-auto",
+                color="link"
+            ),
             dbc.Button("Cancelar", id="btn-cancel", className="me-2", color="secondary"),
             dbc.Button("Salvar", id="save-button", color="primary")
         ])
     ], id="modal-edit", is_open=False, size="xl"),
     
+    # Modal de edição em massa (campos em branco não são alterados)
+    dbc.Modal([
+        dbc.ModalHeader(dbc.ModalTitle(id="bulk-modal-title")),
+        dbc.ModalBody([
+            html.P("Preencha só os campos que devem mudar em todos os clientes selecionados.",
+                   className="text-muted"),
+            dbc.Row([
+                dbc.Col([
+                    html.Label("Status", className="form-label"),
+                    dcc.Dropdown(
+                        id="bulk-status",
+                        options=[],
+                        placeholder="Manter",
+                        style={'fontSize': '15px'}
+                    )
+                ], md=6),
+                dbc.Col([
+                    html.Label("Piscineiro", className="form-label"),
+                    dcc.Dropdown(
+                        id="bulk-tech",
+                        options=[],
+                        placeholder="Manter",
+                        style={'fontSize': '15px'}
+                    )
+                ], md=6)
+            ], className="mb-3"),
+            dbc.Row([
+                dbc.Col([
+                    html.Label("Última Troca (Filtro)", className="form-label"),
+                    dbc.Input(
+                        id="bulk-ultima-troca",
+                        type="date",
+                        className="date-input-custom"
+                    )
+                ], md=6),
+                dbc.Col([
+                    html.Label("Próxima Troca (Filtro)", className="form-label"),
+                    dbc.Input(
+                        id="bulk-proxima-troca",
+                        type="date",
+                        className="date-input-custom"
+                    )
+                ], md=6)
+            ])
+        ]),
+        dbc.ModalFooter([
+            dbc.Button("Cancelar", id="bulk-cancel", className="me-2", color="secondary"),
+            dbc.Button("Aplicar", id="bulk-apply-button", color="primary")
+        ])
+    ], id="modal-bulk-edit", is_open=False, size="lg"),
+    
+    # Modal do histórico de auditoria (geral ou de um cliente), paginado por cursor
+    dbc.Modal([
+        dbc.ModalHeader(dbc.ModalTitle(id="history-modal-title")),
+        dbc.ModalBody([
+            dbc.Row([
+                dbc.Col([
+                    dcc.Dropdown(
+                        id="history-acao",
+                        options=[{"label": label, "value": value} for value, label in AUDIT_ACTION_LABELS.items()],
+                        placeholder="Todas as ações"
+                    )
+                ], md=3),
+                dbc.Col([
+                    dcc.Dropdown(
+                        id="history-campo",
+                        options=[{"label": label, "value": value} for value, label in AUDIT_FIELD_LABELS.items()],
+                        placeholder="Todos os campos"
+                    )
+                ], md=3),
+                dbc.Col([
+                    dcc.DatePickerRange(
+                        id="history-dates",
+                        display_format="DD/MM/YYYY",
+                        start_date_placeholder_text="De",
+                        end_date_placeholder_text="Até",
+                        clearable=True
+                    )
+                ], md=6)
+            ], className="mb-3"),
+            dash_table.DataTable(
+                id="history-table",
+                columns=[{"name": name, "id": name} for name in
+                         ("DATA", "CLIENTE", "AÇÃO", "CAMPO", "ANTERIOR", "NOVO", "USUÁRIO")],
+                data=[],
+                style_table={'overflowX': 'auto'},
+                style_header={
+                    'backgroundColor': '#f8fafc',
+                    'color': '#475569',
+                    'fontWeight': '600',
+                    'fontSize': '12px',
+                    'textTransform': 'uppercase'
+                },
+                style_cell={
+                    'textAlign': 'left',
+                    'padding': '10px 12px',
+                    'fontSize': '13px',
+                    'fontFamily': 'Inter, sans-serif',
+                    'whiteSpace': 'normal',
+                    'height': 'auto'
+                },
+                style_as_list_view=True
+            ),
+            html.Div(id="history-empty", className="text-muted mt-3")
+        ]),
+        dbc.ModalFooter([
+            html.Span(id="history-page-label", className="me-auto text-muted"),
+            dbc.Button("Anterior", id="history-prev", className="me-2", color="secondary", disabled=True),
+            dbc.Button("Próxima", id="history-next", className="me-2", color="secondary", disabled=True),
+            dbc.Button("Fechar", id="history-close", color="primary")
+        ])
+    ], id="modal-history", is_open=False, size="xl", scrollable=True),
+    
     # Stores
+    dcc.Store(id="client-id-store"),       # id do navegador (gerado no cliente)
+    dcc.Store(id="search-seq-store", data=0),  # sequência das buscas deste navegador
     dcc.Store(id="selected-customer-store"),
     dcc.Store(id="edit-mode-store"),
     dcc.Store(id="refresh-trigger", data=0),
+    dcc.Store(id="bulk-selection-store", data=[]),  # ids selecionados (todas as páginas)
+    dcc.Store(id="history-customer-store"),  # cliente do histórico (None = todos)
+    dcc.Store(id="history-cursor-store"),    # cursores das páginas visitadas do histórico
     dcc.Download(id="export-download"),
     html.Div(id="save-feedback")
     
@@ -445,162 +696,275 @@ app.layout = dbc.Container([
 
 
 # ===== CALLBACKS =====
+# Cada parte do dashboard depende só das entradas que a afetam:
+# paginar/ordenar/buscar não recalcula KPIs nem opções dos filtros
 
-# Atualizar KPIs, tabela e botões de ação
+# KPIs (uma única query de agregação, com cache pela versão dos dados)
 @app.callback(
     [Output("kpi-revenue", "children"),
      Output("kpi-active-customers", "children"),
-     Output("kpi-future-maintenance", "children"),
-     Output("customers-table", "data"),
-     Output("customers-table", "columns"),
-     Output("action-buttons-container", "children"),
-     Output("status-filter", "options"),
+     Output("kpi-future-maintenance", "children")],
+    [Input("refresh-trigger", "data")]
+)
+@metrics.instrument_callback
+@db.unit_of_work
+def update_kpis(refresh_trigger):
+    kpis = data_processor.get_kpis()
+    return (
+        f"${kpis['monthly_revenue']:,.2f}",
+        f"{kpis['active_customers']}",
+        f"{kpis['future_maintenance']}"
+    )
+
+
+# Opções dos filtros e dos modais de edição
+@app.callback(
+    [Output("status-filter", "options"),
      Output("tech-filter", "options"),
      Output("edit-status", "options"),
-     Output("edit-tech", "options")],
+     Output("edit-tech", "options"),
+     Output("bulk-status", "options"),
+     Output("bulk-tech", "options")],
+    [Input("refresh-trigger", "data")]
+)
+@metrics.instrument_callback
+@db.unit_of_work
+def update_filter_options(refresh_trigger):
+    status_opts = get_status_options()
+    tech_opts = get_tech_options()
+    return (
+        [{"label": "Todos os Status", "value": "Todos"}] + status_opts,  # status-filter options
+        tech_opts['filter'],  # tech-filter options
+        status_opts,          # edit-status options
+        tech_opts['edit'],    # edit-tech options
+        status_opts,          # bulk-status options
+        tech_opts['edit']     # bulk-tech options
+    )
+
+
+# Página atual da tabela (filtrada, ordenada e já renderizada)
+@app.callback(
+    [Output("customers-table", "data"),
+     Output("customers-table", "page_count"),
+     Output("customers-table", "page_current")],
     [Input("status-filter", "value"),
      Input("tech-filter", "value"),
      Input("last-change-filter", "value"),
      Input("next-change-filter", "value"),
-     Input("search-input", "value"),
+     Input("search-seq-store", "data"),
      Input("refresh-trigger", "data"),
      Input("customers-table", "page_current"),
      Input("customers-table", "page_size"),
-     Input("customers-table", "sort_by")]
+     Input("customers-table", "sort_by")],
+    [State("search-input", "value"),
+     State("client-id-store", "data")]
 )
-def update_dashboard(status_filter, tech_filter, last_change_month, next_change_month, search_text, refresh_trigger, page_current, page_size, sort_by):
-    # Garantir que dados estejam carregados
-    data_processor.load_extra_data()
-    
-    # Popular opções dos dropdowns (forçar reload se refresh_trigger mudou)
-    force_reload = refresh_trigger and refresh_trigger > 0
-    status_opts = get_status_options(force_reload=force_reload)
-    tech_opts = get_tech_options(force_reload=force_reload)
-    status_filter_opts = [{"label": "Todos os Status", "value": "Todos"}] + status_opts
-    tech_filter_opts = tech_opts['filter']
-    tech_edit_opts = tech_opts['edit']
-    
-    # KPIs
-    monthly_revenue = data_processor.get_monthly_revenue()
-    active_customers = data_processor.get_active_customers_count()
-    future_maintenance = data_processor.get_future_maintenance_count()
-    
-    # Filtrar dados
-    filtered_df = data_processor.get_filtered_data(
-        status_filter, 
-        tech_filter, 
-        last_change_month=last_change_month, 
-        next_change_month=next_change_month
-    )
-    
-    # Busca por texto
-    if search_text and search_text.strip():
-        filtered_df = filtered_df[
-            filtered_df['Name'].str.contains(search_text, case=False, na=False)
-        ]
-    
-    # Preparar dados para tabela (NOVA ESTRUTURA: sem Método/Auto Pay, com Tipo/Valor Filtro)
-    table_df = filtered_df[['Name', 'Status', 'Route Tech', 'Ultima Troca', 'Proxima Troca', 'Tipo Filtro', 'Valor Filtro']].copy()
-
-    # Guardar valores brutos para uso no modal
-    table_df['STATUS_RAW'] = table_df['Status']
-    table_df['PISCINEIRO_RAW'] = table_df['Route Tech']
-    table_df['TIPO_FILTRO_RAW'] = table_df['Tipo Filtro']
-    table_df['VALOR_FILTRO_RAW'] = table_df['Valor Filtro']
-    table_df['ULTIMA_RAW'] = table_df['Ultima Troca']
-    table_df['PROXIMA_RAW'] = table_df['Proxima Troca']
-    
-    # Renomear colunas
-    table_df = table_df.rename(columns={
-        'Name': 'CLIENTE',
-        'Status': 'STATUS',
-        'Route Tech': 'PISCINEIRO',
-        'Ultima Troca': 'ÚLTIMA TROCA',
-        'Proxima Troca': 'PRÓXIMA TROCA',
-        'Tipo Filtro': 'TIPO FILTRO',
-        'Valor Filtro': 'VALOR FILTRO'
-    })
-    
-    # Formatar status com badges HTML
-    def format_status(status):
-        if 'Active (routed)' in str(status):
-            return '<span class="badge-status badge-ativo">✓ Ativo</span>'
-        elif 'Active (no route)' in str(status):
-            return '<span class="badge-status badge-ativo-sem-rota">○ Ativo (sem rota)</span>'
-        elif 'Inactive' in str(status):
-            return '<span class="badge-status badge-inativo">✕ Inativo</span>'
-        elif 'Lead' in str(status):
-            return '<span class="badge-status badge-lead">⚬ Lead</span>'
-        return str(status)
+@metrics.instrument_callback
+@db.unit_of_work
+def update_table(status_filter, tech_filter, last_change_month, next_change_month, search_seq, refresh_trigger, page_current, page_size, sort_by,
+                 search_text=None, client_id=None):
+    # Busca nova deste navegador: termina sem resposta se outra mais nova já
+    # chegou a qualquer worker (antes e depois de calcular a página)
+    triggered = {t["prop_id"] for t in callback_context.triggered}
+    searching = client_id is not None and "search-seq-store.data" in triggered
+    if searching and search_flight.begin(client_id, search_seq or 0):
+        return no_update, no_update, no_update
     
-    table_df['STATUS'] = table_df['STATUS'].apply(format_status)
-    
-    # Formatar valor do filtro
-    table_df['VALOR FILTRO'] = table_df['VALOR FILTRO'].apply(
-        lambda x: f'<span class="valor-mensal">R$ {x:.2f}</span>' if pd.notna(x) and x > 0 else '<span class="valor-na">—</span>'
-    )
-    
-    # Formatar tipo de filtro
-    table_df['TIPO FILTRO'] = table_df['TIPO FILTRO'].apply(
-        lambda x: '<span class="metodo-badge">🔷 ' + str(x) + '</span>' if pd.notna(x) and str(x) != '' else '<span class="metodo-na">—</span>'
-    )
-    
-    # Preencher valores vazios
-    table_df['PISCINEIRO'] = table_df['PISCINEIRO'].fillna('—')
-    table_df['ÚLTIMA TROCA'] = table_df['ÚLTIMA TROCA'].apply(lambda x: x if x else 'Não agendado')
-    table_df['PRÓXIMA TROCA'] = table_df['PRÓXIMA TROCA'].apply(lambda x: x if x else 'Não agendado')
-    
-    # Adicionar índice oculto para rastreamento
-    table_df['INDEX_HIDDEN'] = range(len(table_df))
-    
-    # Preparar dados da tabela
-    table_data = table_df.to_dict('records')
-    table_columns = [
-        ({"name": col, "id": col, "presentation": "markdown"} 
-         if col in ['STATUS', 'VALOR FILTRO', 'TIPO FILTRO'] 
-         else {"name": col, "id": col})
-        for col in table_df.columns if not col.endswith('_RAW') and col != 'INDEX_HIDDEN'
-    ]
-    
-    # Calcular linhas da página atual
     if page_current is None:
         page_current = 0
     if page_size is None:
         page_size = 12
     
-    start_idx = page_current * page_size
-    end_idx = min(start_idx + page_size, len(table_data))
+    # Voltar para a primeira página quando filtros/busca/ordenação mudarem
+    if triggered & RESET_PAGE_PROPS:
+        page_current = 0
+    
+    # Ordenação da tabela (colunas da tabela → colunas do DataFrame)
+    sort_fields = tuple(
+        (TABLE_COLUMN_FIELDS[item['column_id']], item['direction'])
+        for item in (sort_by or []) if item.get('column_id') in TABLE_COLUMN_FIELDS
+    )
     
-    # Criar botões de ação apenas para as linhas visíveis na página atual
-    # Garantir que criamos exatamente page_size botões ou menos na última página
-    num_buttons = min(page_size, len(table_data) - start_idx)
-    visible_rows = table_data[start_idx:end_idx]
+    filters = dict(
+        status_filter=status_filter,
+        tech_filter=tech_filter,
+        last_change_month=last_change_month,
+        next_change_month=next_change_month,
+        search_text=search_text,
+        sort_by=list(sort_fields),
+        page_size=page_size
+    )
+    
+    def build_page():
+        # Filtrar, ordenar e paginar (apenas as linhas visíveis saem do processador)
+        current = page_current
+        page_df, total_rows = data_processor.get_page(page_current=current, **filters)
+        page_count = max((total_rows + page_size - 1) // page_size, 1)
+        if current >= page_count:
+            current = page_count - 1
+            page_df, total_rows = data_processor.get_page(page_current=current, **filters)
+        
+        # Células já renderizadas (badges, valores e datas) vêm do cache do processador
+        # Cada linha leva só as células exibidas + "id" (Cliente.id); os valores
+        # brutos do modal são buscados pelo id quando ele abre
+        return data_processor.render_page(page_df).to_dict('records'), page_count, current
     
-    action_buttons = html.Div([
+    key = (status_filter, tech_filter, last_change_month, next_change_month, search_text,
+           sort_fields, page_current, page_size, data_processor.cache_version)
+    result = memoized('table', key, build_page)
+    # Resultado de uma busca substituída durante o cálculo não é serializado nem enviado
+    if searching and search_flight.is_stale(client_id, search_seq or 0):
+        return no_update, no_update, no_update
+    return result
+
+
+# Cada navegador recebe um id próprio (single-flight da busca é por navegador)
+app.clientside_callback(
+    """
+    function(_) {
+        if (window.crypto && window.crypto.randomUUID) {
+            return window.crypto.randomUUID();
+        }
+        return Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+    """,
+    Output("client-id-store", "data"),
+    Input("client-id-store", "id")
+)
+
+
+# Numera as buscas no navegador (sem ida ao servidor); a tabela usa a sequência
+# para descartar buscas já substituídas, em qualquer worker
+app.clientside_callback(
+    """
+    function(value, seq) {
+        return (seq || 0) + 1;
+    }
+    """,
+    Output("search-seq-store", "data"),
+    Input("search-input", "value"),
+    State("search-seq-store", "data"),
+    prevent_initial_call=True
+)
+
+
+# Seleção da página → ids selecionados (mantém os de outras páginas)
+app.clientside_callback(
+    """
+    function(selectedRows, data, selectedIds) {
+        const rows = data || [];
+        const pageIds = new Set(rows.map(row => row.id));
+        const kept = (selectedIds || []).filter(id => !pageIds.has(id));
+        const picked = (selectedRows || [])
+            .filter(index => index < rows.length)
+            .map(index => rows[index].id);
+        return kept.concat(picked);
+    }
+    """,
+    Output("bulk-selection-store", "data"),
+    Input("customers-table", "selected_rows"),
+    State("customers-table", "data"),
+    State("bulk-selection-store", "data"),
+    prevent_initial_call=True
+)
+
+
+# A seleção da tabela é por posição na página: remarcar os ids selecionados
+# sempre que as linhas mudam (troca de página, filtro, ordenação ou refresh)
+app.clientside_callback(
+    """
+    function(data, selectedIds) {
+        const selected = new Set(selectedIds || []);
+        const rows = [];
+        (data || []).forEach((row, index) => {
+            if (selected.has(row.id)) {
+                rows.push(index);
+            }
+        });
+        return rows;
+    }
+    """,
+    Output("customers-table", "selected_rows"),
+    Input("customers-table", "data"),
+    State("bulk-selection-store", "data"),
+    prevent_initial_call=True
+)
+
+
+# Barra de edição em massa segue a seleção (sem ida ao servidor)
+app.clientside_callback(
+    """
+    function(ids) {
+        const count = (ids || []).length;
+        if (!count) {
+            return [{display: 'none'}, ''];
+        }
+        return [{display: 'flex', alignItems: 'center'}, count + ' cliente(s) selecionado(s)'];
+    }
+    """,
+    Output("bulk-edit-bar", "style"),
+    Output("bulk-selection-count", "children"),
+    Input("bulk-selection-store", "data")
+)
+
+
+# Limpar a seleção (todas as páginas)
+app.clientside_callback(
+    """
+    function(n) {
+        return [[], []];
+    }
+    """,
+    Output("bulk-selection-store", "data", allow_duplicate=True),
+    Output("customers-table", "selected_rows", allow_duplicate=True),
+    Input("btn-bulk-clear", "n_clicks"),
+    prevent_initial_call=True
+)
+
+
+# Selecionar todos os clientes que casam com os filtros atuais (não só a página)
+@app.callback(
+    [Output("bulk-selection-store", "data", allow_duplicate=True),
+     Output("customers-table", "selected_rows", allow_duplicate=True)],
+    [Input("btn-bulk-select-all", "n_clicks")],
+    [State("status-filter", "value"),
+     State("tech-filter", "value"),
+     State("last-change-filter", "value"),
+     State("next-change-filter", "value"),
+     State("search-input", "value"),
+     State("customers-table", "data")],
+    prevent_initial_call=True
+)
+@metrics.instrument_callback
+@db.unit_of_work
+def select_all_filtered(n_clicks, status_filter, tech_filter, last_change_month, next_change_month,
+                        search_text, page_rows):
+    selected_ids = data_processor.get_filtered_ids(
+        status_filter, tech_filter, last_change_month, next_change_month, search_text
+    )
+    return selected_ids, list(range(len(page_rows or [])))
+
+
+# Botões de ação para as linhas visíveis (índice = Cliente.id)
+@app.callback(
+    Output("action-buttons-container", "children"),
+    [Input("customers-table", "derived_viewport_row_ids")]
+)
+@metrics.instrument_callback
+def update_action_buttons(row_ids):
+    # Só depende dos ids visíveis: não consulta o banco
+    return memoized('action-buttons', tuple(row_ids or ()), lambda: html.Div([
         html.Div([
             dbc.Button(
                 [html.I(className="fas fa-edit me-2"), "Editar"],
-                id={"type": "edit-btn", "index": row['INDEX_HIDDEN']},
+                id={"type": "edit-btn", "index": row_id},
                 color="primary",
                 size="sm",
                 className="action-btn-edit"
             )
         ], className="action-btn-row")
-        for row in visible_rows
-    ], className="action-buttons-wrapper", id="action-buttons-list")
-    
-    return (
-        f"${monthly_revenue:,.2f}",
-        f"{active_customers}",
-        f"{future_maintenance}",
-        table_data,
-        table_columns,
-        action_buttons,
-        status_filter_opts,  # status-filter options
-        tech_filter_opts,    # tech-filter options
-        status_opts,         # edit-status options
-        tech_edit_opts       # edit-tech options
-    )
+        for row_id in (row_ids or [])
+    ], className="action-buttons-wrapper", id="action-buttons-list"))
 
 
 # Exportar CSV do resultado filtrado
@@ -613,27 +977,28 @@ def update_dashboard(status_filter, tech_filter, last_change_month, next_change_
      State("next-change-filter", "value"),
      State("search-input", "value")]
 )
+@metrics.instrument_callback
+@db.unit_of_work
 def export_csv(n_clicks, status_filter, tech_filter, last_change_month, next_change_month, search_text):
     if not n_clicks:
         return no_update
 
-    data_processor.load_extra_data()
-    data_processor.load_data()
+    # No modo sql a exportação vem direto do banco (build_filtered_query), sem
+    # carregar o snapshot; no modo snapshot, da visão filtrada em memória
     filtered_df = data_processor.get_filtered_data(
         status_filter, 
         tech_filter, 
         last_change_month=last_change_month, 
-        next_change_month=next_change_month
+        next_change_month=next_change_month,
+        search_text=search_text
     )
 
-    if search_text and search_text.strip():
-        filtered_df = filtered_df[
-            filtered_df['Name'].str.contains(search_text, case=False, na=False)
-        ]
-
     export_cols = ['Name', 'Status', 'Route Tech', 'Tipo Filtro', 'Valor Filtro', 'Ultima Troca', 'Proxima Troca']
     existing_cols = [c for c in export_cols if c in filtered_df.columns]
     df_export = filtered_df[existing_cols].copy()
+    for col in ('Ultima Troca', 'Proxima Troca'):
+        if col in df_export.columns:
+            df_export[col] = format_dates(df_export[col], BR_DATE_FORMAT, '')
 
     return dcc.send_data_frame(df_export.to_csv, "clientes_filtrados.csv", index=False)
 
@@ -655,13 +1020,14 @@ def export_csv(n_clicks, status_filter, tech_filter, last_change_month, next_cha
      Input("btn-novo-cliente", "n_clicks"),
      Input("btn-cancel", "n_clicks"),
      Input("refresh-trigger", "data")],
-    [State("customers-table", "data"),
-     State("modal-edit", "is_open"),
+    [State("modal-edit", "is_open"),
      State("selected-customer-store", "data"),
      State("edit-mode-store", "data")],
     prevent_initial_call=True
 )
-def toggle_modal(edit_btn_clicks, btn_new, btn_cancel, refresh_trigger, table_data, is_open, selected_customer, edit_mode):
+@metrics.instrument_callback
+@db.unit_of_work
+def toggle_modal(edit_btn_clicks, btn_new, btn_cancel, refresh_trigger, is_open, selected_customer, edit_mode):
     ctx = callback_context
     if not ctx.triggered:
         return no_update
@@ -701,37 +1067,25 @@ def toggle_modal(edit_btn_clicks, btn_new, btn_cancel, refresh_trigger, table_da
     if "edit-btn" in trigger_id:
         import json
         trigger_dict = json.loads(trigger_id.split(".")[0])
-        row_idx = trigger_dict.get("index")
+        customer_id = trigger_dict.get("index")
         
-        if row_idx is not None and row_idx < len(table_data):
-            row = table_data[row_idx]
-            auto_raw = str(row.get("AUTO_RAW", "")).lower()
-            auto_val = ["yes"] if auto_raw in ["yes", "sim", "y"] else []
-            
-            # Converter datas DD/MM/YYYY para YYYY-MM-DD (formato do DatePicker)
-            def convert_date_to_iso(date_str):
-                if not date_str or date_str == "Não agendado":
-                    return None
-                try:
-                    from datetime import datetime
-                    dt = datetime.strptime(date_str, "%d/%m/%Y")
-                    return dt.strftime("%Y-%m-%d")
-                except:
-                    return None
-            
-            ultima_date = convert_date_to_iso(row.get("ULTIMA_RAW", ""))
-            proxima_date = convert_date_to_iso(row.get("PROXIMA_RAW", ""))
+        # Valores brutos buscados pela chave primária (snapshot em memória)
+        customer = data_processor.get_customer(customer_id)
+        if customer:
+            # Input date usa YYYY-MM-DD
+            ultima_date = customer['Ultima Troca'].strftime(ISO_DATE_FORMAT) if customer['Ultima Troca'] else None
+            proxima_date = customer['Proxima Troca'].strftime(ISO_DATE_FORMAT) if customer['Proxima Troca'] else None
             
             return (
                 True,
-                row.get("CLIENTE"),
+                customer['ID'],
                 "edit",
                 f"Editar Cliente",
-                row.get("CLIENTE", ""),
-                row.get("STATUS_RAW"),
-                row.get("PISCINEIRO_RAW"),
-                row.get("TIPO_FILTRO_RAW"),
-                row.get("VALOR_FILTRO_RAW", 0.00),
+                customer['Name'],
+                customer['Status'],
+                customer['Route Tech'],
+                customer['Tipo Filtro'],
+                customer['Valor Filtro'],
                 ultima_date,
                 proxima_date
             )
@@ -740,10 +1094,16 @@ def toggle_modal(edit_btn_clicks, btn_new, btn_cancel, refresh_trigger, table_da
     return no_update
 
 
-# Salvar alterações e disparar refresh automático
+# Salvar alterações: edição devolve um Patch da linha alterada; criação
+# (ou linha que entra/sai do filtro ou muda de posição) dispara refresh completo
 @app.callback(
     [Output("save-feedback", "children"),
-     Output("refresh-trigger", "data")],
+     Output("refresh-trigger", "data"),
+     Output("customers-table", "data", allow_duplicate=True),
+     Output("kpi-revenue", "children", allow_duplicate=True),
+     Output("kpi-active-customers", "children", allow_duplicate=True),
+     Output("kpi-future-maintenance", "children", allow_duplicate=True),
+     Output("modal-edit", "is_open", allow_duplicate=True)],
     [Input("save-button", "n_clicks")],
     [State("selected-customer-store", "data"),
      State("edit-mode-store", "data"),
@@ -754,23 +1114,33 @@ def toggle_modal(edit_btn_clicks, btn_new, btn_cancel, refresh_trigger, table_da
      State("edit-valor-filtro", "value"),
      State("edit-ultima-troca", "value"),
      State("edit-proxima-troca", "value"),
-     State("refresh-trigger", "data")],
+     State("refresh-trigger", "data"),
+     State("status-filter", "value"),
+     State("tech-filter", "value"),
+     State("last-change-filter", "value"),
+     State("next-change-filter", "value"),
+     State("search-input", "value"),
+     State("customers-table", "sort_by"),
+     State("customers-table", "derived_viewport_row_ids")],
     prevent_initial_call=True
 )
-def save_customer_data(n_clicks, customer_name, edit_mode, name, status, tech, tipo_filtro, valor_filtro, ultima_troca, proxima_troca, refresh_trigger):
+@metrics.instrument_callback
+@db.unit_of_work
+def save_customer_data(n_clicks, customer_id, edit_mode, name, status, tech, tipo_filtro, valor_filtro, ultima_troca, proxima_troca, refresh_trigger,
+                       status_filter, tech_filter, last_change_month, next_change_month, search_text, sort_by, viewport_ids):
     import logging
     logger = logging.getLogger(__name__)
-    logger.info(f"💾 Salvando: {customer_name}")
+    logger.info(f"💾 Salvando: id={customer_id}")
 
     def error_toast(msg):
-        return dbc.Toast(
+        return (dbc.Toast(
             msg,
             header="Erro",
             icon="danger",
             duration=3500,
             is_open=True,
             style={"position": "fixed", "top": 20, "right": 20, "zIndex": 9999}
-        ), (refresh_trigger or 0)
+        ),) + (no_update,) * 6
 
     name = (name or "").strip()
     if not name:
@@ -787,25 +1157,31 @@ def save_customer_data(n_clicks, customer_name, edit_mode, name, status, tech, t
     if valor_filtro < 0:
         return error_toast("Valor do filtro não pode ser negativo.")
 
-    # Converter datas do formato ISO (YYYY-MM-DD) para DD/MM/YYYY
-    def convert_iso_to_br(date_str):
-        if not date_str:
-            return ''
-        try:
-            from datetime import datetime
-            dt = datetime.fromisoformat(date_str)
-            return dt.strftime("%d/%m/%Y")
-        except:
-            return ''
+    # Datas chegam em ISO (YYYY-MM-DD) e são interpretadas pelo processador
+    ultima_valid = ultima_troca or ''
+    proxima_valid = proxima_troca or ''
 
-    ultima_valid = convert_iso_to_br(ultima_troca)
-    proxima_valid = convert_iso_to_br(proxima_troca)
+    toast = dbc.Toast(
+        "✓ Salvo!",
+        header="Sucesso",
+        icon="success",
+        duration=1500,
+        is_open=True,
+        style={"position": "fixed", "top": 20, "right": 20, "zIndex": 9999}
+    )
+
+    # Valores atuais do cliente em edição (o store guarda o Cliente.id)
+    customer = None
+    if edit_mode != "create" and customer_id is not None:
+        customer = data_processor.get_customer(customer_id)
+        if not customer:
+            return error_toast("Cliente não encontrado.")
 
     # Verificar duplicidade sem recarregar todos os dados
-    if edit_mode == "create" or not customer_name:
+    if customer is None:
         if data_processor.name_exists(name):
             return error_toast("Já existe um cliente com esse nome.")
-        data_processor.add_customer({
+        added = data_processor.add_customer({
             'Name': name,
             'Status': status,
             'Route Tech': tech,
@@ -814,40 +1190,237 @@ def save_customer_data(n_clicks, customer_name, edit_mode, name, status, tech, t
             'Ultima Troca': ultima_valid,
             'Proxima Troca': proxima_valid
         })
-    else:
-        # Renomear se necessário
-        if name != customer_name and data_processor.name_exists(name):
-            return error_toast("Já existe um cliente com esse nome.")
-        if name != customer_name:
-            data_processor.rename_customer(customer_name, name)
-            customer_name = name
-        
-        # Atualizar todos os campos em uma única transação (BATCH UPDATE - MUITO MAIS RÁPIDO)
-        updates = {
-            "Status": status,
-            "Route Tech": tech,
-            "Tipo Filtro": tipo_filtro,
-            "Valor Filtro": valor_filtro,
-            "Ultima Troca": ultima_valid,
-            "Proxima Troca": proxima_valid
+        if not added:
+            return error_toast("Não foi possível salvar o cliente.")
+
+        # Linha nova: posição depende dos filtros e da ordenação → refresh completo
+        return toast, (refresh_trigger or 0) + 1, no_update, no_update, no_update, no_update, False
+
+    # KPIs antes da escrita (ajustados depois pela diferença do cliente)
+    kpis = data_processor.get_kpis()
+
+    if name != customer['Name'] and data_processor.name_exists(name, exclude_id=customer_id):
+        return error_toast("Já existe um cliente com esse nome.")
+
+    # Todos os campos (inclusive o nome) em um único UPDATE pela chave primária
+    updates = {
+        "Name": name,
+        "Status": status,
+        "Route Tech": tech,
+        "Tipo Filtro": tipo_filtro,
+        "Valor Filtro": valor_filtro,
+        "Ultima Troca": ultima_valid,
+        "Proxima Troca": proxima_valid
+    }
+
+    result = data_processor.update_customer_batch(customer_id, updates)
+    if not result:
+        return error_toast("Não foi possível salvar o cliente.")
+    logger.info(f"✅ Salvo: {name} ({len(updates)} campos)")
+
+    # Diferença pelos valores lidos sob o lock da linha (o snapshot pode estar atrasado)
+    before, updated = result
+    kpis = data_processor.adjust_kpis(kpis, before=before, after=updated)
+
+    # Refresh completo se a linha entrou/saiu do filtro ou pode mudar de posição
+    changed_fields = {field for field in updated if updated[field] != before[field]}
+    sort_fields = {TABLE_COLUMN_FIELDS.get(item.get('column_id')) for item in (sort_by or [])}
+    filters = dict(
+        status_filter=status_filter,
+        tech_filter=tech_filter,
+        last_change_month=last_change_month,
+        next_change_month=next_change_month,
+        search_text=search_text
+    )
+    if (not viewport_ids or customer_id not in viewport_ids
+            or changed_fields & sort_fields
+            or not data_processor.customer_matches(updated, **filters)):
+        return toast, (refresh_trigger or 0) + 1, no_update, no_update, no_update, no_update, False
+
+    # Apenas a linha editada e os KPIs vão para o navegador
+    table_patch = Patch()
+    table_patch[viewport_ids.index(customer_id)] = data_processor.render_customer(updated)
+
+    return (
+        toast,
+        no_update,
+        table_patch,
+        f"${kpis['monthly_revenue']:,.2f}",
+        f"{kpis['active_customers']}",
+        f"{kpis['future_maintenance']}",
+        False
+    )
+
+
+
+# Abrir/fechar o modal de edição em massa (campos começam em branco = manter)
+@app.callback(
+    [Output("modal-bulk-edit", "is_open"),
+     Output("bulk-modal-title", "children"),
+     Output("bulk-status", "value"),
+     Output("bulk-tech", "value"),
+     Output("bulk-ultima-troca", "value"),
+     Output("bulk-proxima-troca", "value")],
+    [Input("btn-bulk-edit", "n_clicks"),
+     Input("bulk-cancel", "n_clicks")],
+    [State("bulk-selection-store", "data")],
+    prevent_initial_call=True
+)
+@metrics.instrument_callback
+def toggle_bulk_modal(open_clicks, cancel_clicks, selected_ids):
+    trigger_id = callback_context.triggered[0]["prop_id"] if callback_context.triggered else ""
+    if "btn-bulk-edit" in trigger_id and selected_ids:
+        return True, f"Editar {len(selected_ids)} cliente(s)", None, None, None, None
+    return False, no_update, no_update, no_update, no_update, no_update
+
+
+# Aplicar a edição em massa: um UPDATE para todos os selecionados + refresh
+@app.callback(
+    [Output("save-feedback", "children", allow_duplicate=True),
+     Output("refresh-trigger", "data", allow_duplicate=True),
+     Output("modal-bulk-edit", "is_open", allow_duplicate=True),
+     Output("bulk-selection-store", "data", allow_duplicate=True)],
+    [Input("bulk-apply-button", "n_clicks")],
+    [State("bulk-selection-store", "data"),
+     State("bulk-status", "value"),
+     State("bulk-tech", "value"),
+     State("bulk-ultima-troca", "value"),
+     State("bulk-proxima-troca", "value"),
+     State("refresh-trigger", "data")],
+    prevent_initial_call=True
+)
+@metrics.instrument_callback
+@db.unit_of_work
+def apply_bulk_edit(n_clicks, selected_ids, status, tech, ultima_troca, proxima_troca, refresh_trigger):
+    def feedback(msg, header="Sucesso", icon="success"):
+        return dbc.Toast(
+            msg,
+            header=header,
+            icon=icon,
+            duration=2500,
+            is_open=True,
+            style={"position": "fixed", "top": 20, "right": 20, "zIndex": 9999}
+        )
+
+    changes = {
+        field: value
+        for field, value in (
+            ("Status", status),
+            ("Route Tech", tech),
+            ("Ultima Troca", ultima_troca),
+            ("Proxima Troca", proxima_troca)
+        )
+        if value
+    }
+    if not selected_ids:
+        return feedback("Nenhum cliente selecionado.", "Erro", "danger"), no_update, no_update, no_update
+    if not changes:
+        return feedback("Preencha ao menos um campo.", "Erro", "danger"), no_update, no_update, no_update
+
+    updated = data_processor.bulk_update(selected_ids, changes)
+    if not updated:
+        return feedback("Não foi possível atualizar os clientes.", "Erro", "danger"), no_update, no_update, no_update
+
+    # Linhas podem entrar/sair do filtro ou mudar de posição → refresh completo
+    return feedback(f"✓ {len(updated)} cliente(s) atualizado(s)"), (refresh_trigger or 0) + 1, False, []
+
+
+
+# Abrir/fechar o histórico: geral (cabeçalho) ou do cliente em edição
+@app.callback(
+    [Output("modal-history", "is_open"),
+     Output("history-customer-store", "data"),
+     Output("history-modal-title", "children")],
+    [Input("btn-history", "n_clicks"),
+     Input("btn-customer-history", "n_clicks"),
+     Input("history-close", "n_clicks")],
+    [State("selected-customer-store", "data"),
+     State("edit-name", "value")],
+    prevent_initial_call=True
+)
+@metrics.instrument_callback
+def toggle_history_modal(history_clicks, customer_clicks, close_clicks, customer_id, customer_name):
+    trigger_id = callback_context.triggered[0]["prop_id"] if callback_context.triggered else ""
+    if "btn-history" in trigger_id:
+        return True, None, "Histórico de alterações"
+    if "btn-customer-history" in trigger_id and customer_id:
+        return True, customer_id, f"Histórico de {customer_name or 'cliente'}"
+    if "history-close" in trigger_id:
+        return False, no_update, no_update
+    return no_update, no_update, no_update
+
+
+def _history_rows(changes):
+    """Linhas da tabela do histórico (expand_changes → colunas exibidas)"""
+    return [
+        {
+            "DATA": change['timestamp'].strftime('%d/%m/%Y %H:%M:%S') if change['timestamp'] else "",
+            "CLIENTE": change['nome_cliente'] or "",
+            "AÇÃO": AUDIT_ACTION_LABELS.get(change['acao'], change['acao']),
+            "CAMPO": AUDIT_FIELD_LABELS.get(change['campo'], change['campo'] or ""),
+            "ANTERIOR": change['valor_anterior'] or "",
+            "NOVO": change['valor_novo'] or "",
+            "USUÁRIO": change['usuario'] or ""
         }
-        
-        result = data_processor.update_customer_batch(customer_name, updates)
-        logger.info(f"✅ Salvo: {customer_name} ({len(updates)} campos)")
+        for change in changes
+    ]
 
-    toast = dbc.Toast(
-        "✓ Salvo!",
-        header="Sucesso",
-        icon="success",
-        duration=1500,
-        is_open=True,
-        style={"position": "fixed", "top": 20, "right": 20, "zIndex": 9999}
+
+# Página do histórico: filtros voltam à primeira página; Próxima/Anterior
+# andam pelos cursores (timestamp, id) guardados no navegador
+@app.callback(
+    [Output("history-table", "data"),
+     Output("history-cursor-store", "data"),
+     Output("history-prev", "disabled"),
+     Output("history-next", "disabled"),
+     Output("history-page-label", "children"),
+     Output("history-empty", "children")],
+    [Input("modal-history", "is_open"),
+     Input("history-customer-store", "data"),
+     Input("history-acao", "value"),
+     Input("history-campo", "value"),
+     Input("history-dates", "start_date"),
+     Input("history-dates", "end_date"),
+     Input("history-prev", "n_clicks"),
+     Input("history-next", "n_clicks")],
+    [State("history-cursor-store", "data")],
+    prevent_initial_call=True
+)
+@metrics.instrument_callback
+@db.unit_of_work
+def update_history_table(is_open, customer_id, acao, campo, start_date, end_date, prev_clicks, next_clicks, cursors):
+    if not is_open:
+        return no_update, no_update, no_update, no_update, no_update, no_update
+    
+    # cursors: [cursor de cada página visitada..., cursor da próxima]
+    triggered = {t["prop_id"] for t in callback_context.triggered}
+    cursors = cursors or [None, None]
+    if "history-next.n_clicks" in triggered and cursors[-1] is not None:
+        pages = cursors
+    elif "history-prev.n_clicks" in triggered and len(cursors) > 2:
+        pages = cursors[:-2]
+    else:
+        pages = [None]
+    
+    changes, next_cursor = history_page(
+        cliente_id=customer_id,
+        acao=acao,
+        campo=campo,
+        start=start_date,
+        end=end_date,
+        after=pages[-1]
     )
+    cursors = pages + [next_cursor]
+    page = len(pages)
     
-    # Incrementar trigger para forçar atualização da tabela
-    new_trigger = (refresh_trigger or 0) + 1
-
-    return toast, new_trigger
+    return (
+        _history_rows(changes),
+        cursors,
+        page == 1,
+        next_cursor is None,
+        f"Página {page}",
+        "" if changes else "Nenhuma alteração encontrada."
+    )
 
 
 if __name__ == "__main__":
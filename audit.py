@@ -0,0 +1,414 @@
+"""
+Gravação da auditoria (tabela auditoria)
+
+Dois modos (AUDIT_MODE):
+- async (padrão): os registros entram em uma fila em memória depois do
+  commit da transação que os gerou e uma thread grava em lote, com um
+  único INSERT de várias linhas por lote (AUDIT_BATCH_SIZE) ou a cada
+  AUDIT_FLUSH_INTERVAL segundos. A fila é esvaziada no encerramento
+  do processo (atexit).
+- sync: o INSERT é executado na transação de quem chamou (commit ou
+  rollback junto com a alteração).
+
+Usage:
+    from audit import audit_log
+
+    with db.get_session() as session:
+        ...
+        audit_log.record('update', cliente_id=1, nome_cliente='João',
+                         changes={'status': ('Ativo', 'Inativo')})
+
+    historico = customer_history(1)  # uma linha por campo alterado
+    pagina, cursor = history_page(acao='update', campo='status')
+    seguinte, cursor = history_page(acao='update', campo='status', after=cursor)
+"""
+import os
+import time
+import atexit
+import threading
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from sqlalchemy import insert, select, or_, and_, tuple_
+from database import db
+from models import Auditoria, AuditoriaCampo
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Alterações por página do histórico
+HISTORY_PAGE_SIZE = int(os.getenv('AUDIT_HISTORY_PAGE_SIZE', 50))
+
+AUDIT_COLUMNS = ('cliente_id', 'nome_cliente', 'acao', 'campo_alterado',
+                 'valor_anterior', 'valor_novo', 'alteracoes', 'usuario', 'timestamp')
+
+
+def _json_value(value):
+    """Valor do diff em JSON: Decimal vira texto ('12.50') e datas viram ISO"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+class AuditWriter:
+    """Fila de registros de auditoria com gravação em lote (ou direta no modo sync)"""
+
+    MODES = ('async', 'sync')
+
+    def __init__(self, database, mode=None, batch_size=None, flush_interval=None, max_queue=None):
+        """
+        Args:
+            database: Database usado para sessões (sync) e conexões (async)
+            mode: 'async' ou 'sync' (se None, usa AUDIT_MODE)
+            batch_size: Linhas por INSERT (se None, usa AUDIT_BATCH_SIZE)
+            flush_interval: Segundos máximos na fila (se None, usa AUDIT_FLUSH_INTERVAL)
+            max_queue: Limite da fila quando o banco falha (se None, usa AUDIT_MAX_QUEUE)
+        """
+        self.database = database
+        self.mode = (mode or os.getenv('AUDIT_MODE', 'async')).lower()
+        if self.mode not in self.MODES:
+            logger.warning(f"⚠️ AUDIT_MODE '{self.mode}' inválido; usando 'async'")
+            self.mode = 'async'
+        self.batch_size = int(batch_size or os.getenv('AUDIT_BATCH_SIZE', 500))
+        self.flush_interval = float(flush_interval or os.getenv('AUDIT_FLUSH_INTERVAL', 1.0))
+        self.max_queue = int(max_queue or os.getenv('AUDIT_MAX_QUEUE', 100_000))
+
+        self.stats = {'queued': 0, 'written': 0, 'batches': 0, 'failures': 0, 'dropped': 0}
+        self._reset_state()
+
+        # Gunicorn faz fork: o filho começa com fila vazia e sem thread
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_state)
+        atexit.register(self.close)
+
+    def _reset_state(self):
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()  # um lote gravando por vez (thread ou flush manual)
+        self._thread = None
+        self._closed = False
+        for key in self.stats:
+            self.stats[key] = 0
+
+    @staticmethod
+    def changeset(acao, cliente_id=None, nome_cliente=None, changes=None, usuario='Sistema'):
+        """
+        Linha de auditoria de uma alteração: uma linha com o diff de todos os campos
+
+        Args:
+            acao: 'create', 'update', 'delete'
+            changes: {campo: (anterior, novo)} (na inclusão, anterior é None)
+        """
+        changes = changes or {}
+        return {
+            'cliente_id': cliente_id,
+            'nome_cliente': nome_cliente,
+            'acao': acao,
+            # Lista dos campos para filtrar sem abrir o JSON (só em alterações)
+            'campo_alterado': ','.join(sorted(changes)) if acao == 'update' and changes else None,
+            'alteracoes': {campo: [_json_value(old), _json_value(new)] for campo, (old, new) in changes.items()} or None,
+            'usuario': usuario
+        }
+
+    def record(self, acao, cliente_id=None, nome_cliente=None, changes=None, usuario='Sistema'):
+        """Registra uma alteração (ver changeset)"""
+        self.record_many([self.changeset(acao, cliente_id, nome_cliente, changes, usuario)])
+
+    def record_many(self, records):
+        """
+        Registra várias linhas de uma vez
+
+        O timestamp é o da alteração, não o da gravação do lote.
+
+        Args:
+            records: Dicts com as colunas de AUDIT_COLUMNS (as ausentes ficam None;
+                usuario 'Sistema' e timestamp atual se não informados)
+        """
+        now = datetime.now(timezone.utc)
+        rows = []
+        for record in records:
+            row = {column: record.get(column) for column in AUDIT_COLUMNS}
+            row['usuario'] = row['usuario'] or 'Sistema'
+            row['timestamp'] = row['timestamp'] or now
+            rows.append(row)
+        if not rows:
+            return
+
+        if self.mode == 'sync':
+            # Mesma sessão/transação de quem chamou (get_session é reentrante),
+            # em um SAVEPOINT: falha na auditoria não desfaz a alteração
+            with self.database.get_session() as session:
+                try:
+                    with session.begin_nested():
+                        for start in range(0, len(rows), self.batch_size):
+                            insert_audit_rows(session.connection(), rows[start:start + self.batch_size])
+                except Exception as e:
+                    self.stats['failures'] += 1
+                    logger.error(f"❌ Erro ao gravar auditoria ({len(rows)} registros): {e}")
+                    return
+            self.database.on_commit(lambda: self._count_written(len(rows)))
+            return
+
+        # Só entra na fila se a alteração for confirmada (rollback descarta)
+        self.database.on_commit(lambda: self._enqueue(rows))
+
+    def _count_written(self, count):
+        self.stats['written'] += count
+
+    def _enqueue(self, rows):
+        with self._condition:
+            self._queue.extend(rows)
+            self.stats['queued'] += len(rows)
+            closed = self._closed
+            if not closed:
+                self._ensure_thread()
+                if len(self._queue) >= self.batch_size:
+                    self._condition.notify()
+        if closed:
+            # Depois do encerramento não há thread: gravar direto
+            self.flush()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Laço da thread: grava quando o lote enche ou o intervalo expira"""
+        while True:
+            with self._condition:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and len(self._queue) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                closed = self._closed
+
+            if not self.flush() and not closed:
+                # Banco indisponível: esperar o próximo intervalo antes de tentar de novo
+                time.sleep(self.flush_interval)
+            if closed:
+                return
+
+    def _take_batch(self):
+        with self._condition:
+            count = min(len(self._queue), self.batch_size)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _requeue(self, batch):
+        """Devolve um lote que falhou ao início da fila (descartando o excedente mais antigo)"""
+        with self._condition:
+            self._queue.extendleft(reversed(batch))
+            overflow = len(self._queue) - self.max_queue
+            for _ in range(max(overflow, 0)):
+                self._queue.popleft()
+            if overflow > 0:
+                self.stats['dropped'] += overflow
+                logger.error(f"❌ Fila de auditoria cheia: {overflow} registros descartados")
+
+    def flush(self):
+        """
+        Grava tudo o que está na fila (um INSERT de várias linhas por lote)
+
+        Returns:
+            bool: False se algum lote falhou (o lote volta para a fila)
+        """
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    return True
+                try:
+                    # Conexão própria: não interfere na sessão da thread atual
+                    with self.database.engine.begin() as conn:
+                        insert_audit_rows(conn, batch)
+                except Exception as e:
+                    self.stats['failures'] += 1
+                    logger.error(f"❌ Erro ao gravar lote de auditoria ({len(batch)} registros): {e}")
+                    self._requeue(batch)
+                    return False
+                self.stats['written'] += len(batch)
+                self.stats['batches'] += 1
+
+    def pending(self):
+        """Registros na fila aguardando gravação"""
+        return len(self._queue)
+
+    def close(self):
+        """Encerra a thread e grava o que restou na fila (registrado no atexit)"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=max(self.flush_interval, 1.0) + 5.0)
+        if self._queue and self.flush():
+            logger.info("📝 Fila de auditoria gravada no encerramento")
+
+
+def insert_audit_rows(conn, rows):
+    """
+    INSERT das linhas da auditoria e dos seus campos (auditoria_campos)
+
+    Com RETURNING em lote (PostgreSQL, SQLite) o INSERT continua sendo de
+    várias linhas e os ids voltam na ordem das linhas; sem ele (MySQL) cada
+    linha é inserida separadamente para obter o seu id.
+    """
+    if conn.dialect.insert_executemany_returning_sort_by_parameter_order:
+        ids = conn.execute(
+            insert(Auditoria).returning(Auditoria.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+    else:
+        ids = [conn.execute(insert(Auditoria).values(row)).inserted_primary_key[0] for row in rows]
+
+    fields = [
+        {'auditoria_id': auditoria_id, 'campo': campo, 'timestamp': row['timestamp']}
+        for auditoria_id, row in zip(ids, rows)
+        for campo in (row.get('campo_alterado') or '').split(',') if campo
+    ]
+    if fields:
+        conn.execute(insert(AuditoriaCampo), fields)
+
+
+# Instância global da auditoria
+audit_log = AuditWriter(db)
+
+
+def _day_start(day):
+    """date ou 'YYYY-MM-DD' → início do dia em UTC (timestamps da auditoria são UTC)"""
+    if isinstance(day, str):
+        day = date.fromisoformat(day[:10])
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def _as_utc(timestamp):
+    """
+    Timestamp lido do banco → datetime com fuso UTC
+
+    SQLite (e MySQL DATETIME) devolvem sem fuso o horário UTC gravado;
+    PostgreSQL devolve timestamptz no fuso da sessão.
+    """
+    if timestamp is None:
+        return None
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def expand_changes(row):
+    """
+    Linha da auditoria → uma linha por campo alterado
+
+    Lê o formato de diff (alteracoes) e o antigo (campo_alterado,
+    valor_anterior, valor_novo). Valores vêm como texto, como no formato antigo.
+
+    Args:
+        row: Mapping com as colunas da tabela auditoria
+
+    Returns:
+        Lista de dicts {id, cliente_id, nome_cliente, acao, campo, valor_anterior,
+        valor_novo, usuario, timestamp} (ao menos um por linha, com campo None
+        quando a ação não altera campos)
+    """
+    base = {
+        'id': row['id'],
+        'cliente_id': row['cliente_id'],
+        'nome_cliente': row['nome_cliente'],
+        'acao': row['acao'],
+        'usuario': row['usuario'],
+        'timestamp': _as_utc(row['timestamp'])
+    }
+
+    def text(value):
+        return None if value is None else str(value)
+
+    changes = row['alteracoes']
+    if not changes:
+        return [dict(base, campo=row['campo_alterado'], valor_anterior=row['valor_anterior'],
+                     valor_novo=row['valor_novo'])]
+    return [
+        dict(base, campo=campo, valor_anterior=text(old), valor_novo=text(new))
+        for campo, (old, new) in changes.items()
+    ]
+
+
+def history_page(cliente_id=None, acao=None, campo=None, start=None, end=None, after=None,
+                 limit=HISTORY_PAGE_SIZE):
+    """
+    Uma página do histórico (mais recente primeiro) com paginação por chave
+
+    A página seguinte começa depois do cursor (timestamp, id) da última linha
+    desta: cada página lê só as suas linhas pelos índices compostos
+    (timestamp, id), (acao, timestamp, id) e (cliente_id, timestamp), sem
+    OFFSET e sem COUNT. Com `campo`, a página vem de auditoria_campos pelo
+    índice (campo, timestamp, auditoria_id).
+
+    Args:
+        cliente_id: Só as alterações deste cliente (None = todos)
+        acao: 'create', 'update', 'delete' (None = todas)
+        campo: Só alterações que mudaram este campo (ex.: 'status')
+        start, end: Datas (date ou 'YYYY-MM-DD') inclusivas, em dias UTC
+        after: Cursor devolvido pela página anterior
+        limit: Alterações (linhas da tabela) por página
+
+    Returns:
+        (lista de expand_changes com timestamp em UTC, cursor da próxima página ou None)
+    """
+    # Registros ainda na fila também fazem parte do histórico
+    if audit_log.mode == 'async':
+        audit_log.flush()
+
+    table = Auditoria.__table__
+    query = select(table)
+    # Colunas da ordenação/cursor: as da auditoria ou, com campo, as de auditoria_campos
+    order_timestamp, order_id = table.c.timestamp, table.c.id
+    if campo:
+        fields = AuditoriaCampo.__table__
+        query = query.join(fields, fields.c.auditoria_id == table.c.id).where(fields.c.campo == campo)
+        order_timestamp, order_id = fields.c.timestamp, fields.c.auditoria_id
+    if cliente_id is not None:
+        query = query.where(table.c.cliente_id == cliente_id)
+    if acao:
+        query = query.where(table.c.acao == acao)
+    if start:
+        query = query.where(order_timestamp >= _day_start(start))
+    if end:
+        query = query.where(order_timestamp < _day_start(end) + timedelta(days=1))
+
+    with db.get_session() as session:
+        if after is not None:
+            timestamp, row_id = _as_utc(datetime.fromisoformat(after[0])), after[1]
+            if session.get_bind().dialect.name == 'mysql':
+                # MySQL não usa índice em comparação de tuplas
+                query = query.where(or_(order_timestamp < timestamp,
+                                        and_(order_timestamp == timestamp, order_id < row_id)))
+            else:
+                query = query.where(tuple_(order_timestamp, order_id) < tuple_(timestamp, row_id))
+
+        # Uma linha a mais indica se existe próxima página
+        rows = session.execute(
+            query.order_by(order_timestamp.desc(), order_id.desc()).limit(limit + 1)
+        ).mappings().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (_as_utc(rows[-1]['timestamp']).isoformat(), rows[-1]['id'])
+
+    changes = [change for row in rows for change in expand_changes(row)]
+    if campo:
+        changes = [change for change in changes if change['campo'] == campo]
+    return changes, next_cursor
+
+
+def customer_history(cliente_id, limit=100):
+    """
+    Histórico de um cliente por campo (mais recente primeiro)
+
+    Usa o índice (cliente_id, timestamp); `limit` conta alterações (linhas
+    da tabela), não campos.
+    """
+    return history_page(cliente_id=cliente_id, limit=limit)[0]
@@ -0,0 +1,6 @@
+"""
+Benchmarks do dashboard L'Acqua Azzurra
+
+- synthetic: gera bases sintéticas de clientes/auditoria com as distribuições do CSV
+- run_benchmarks: mede os caminhos críticos (processador e callback do dashboard)
+"""
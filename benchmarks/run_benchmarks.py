@@ -0,0 +1,293 @@
+"""
+Benchmarks dos caminhos críticos do dashboard
+
+Para cada tamanho de base, gera (ou reaproveita) uma base sintética e executa
+as medições em um processo separado: o módulo `database` cria a conexão global
+a partir de DATABASE_URL no import, e o processo novo também isola a medição
+de memória.
+
+Uso:
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --sizes 1000 10000 --repeat 20
+    python -m benchmarks.run_benchmarks --sizes 1000 --compare benchmarks/results/anterior.json
+    python -m benchmarks.run_benchmarks --postgres-url postgresql://localhost/bench  # tabelas são recriadas!
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+DATA_DIR = os.path.join(BENCH_DIR, 'data')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+
+# ===== MEDIÇÃO (executado no processo worker) =====
+
+def _percentile(values, pct):
+    """Percentil por interpolação linear (values já ordenados)"""
+    if len(values) == 1:
+        return values[0]
+    pos = (len(values) - 1) * pct / 100
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+def measure(fn, repeat, setup=None):
+    """
+    Executa `fn` `repeat` vezes e mais uma vez sob tracemalloc
+
+    Returns:
+        dict com latências (ms) e pico de memória alocada (MB)
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # Memória medida à parte: tracemalloc distorce o tempo
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'runs': repeat,
+        'mean_ms': statistics.fmean(timings),
+        'min_ms': timings[0],
+        'p50_ms': _percentile(timings, 50),
+        'p90_ms': _percentile(timings, 90),
+        'p99_ms': _percentile(timings, 99),
+        'max_ms': timings[-1],
+        'peak_mb': peak / (1024 * 1024),
+    }
+
+
+def _fake_callback_context(*prop_ids):
+    """Simula o contexto de um callback Dash para chamar a função diretamente"""
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+    context_value.set(AttributeDict(
+        triggered_inputs=[{'prop_id': prop_id, 'value': 1} for prop_id in prop_ids]
+    ))
+
+
+def run_worker(repeat, seed=7):
+    """Executa todas as medições contra o banco de DATABASE_URL"""
+    import logging
+    logging.disable(logging.INFO)
+
+    # Import do app cria tabelas (se faltarem), o Dash e o processador global
+    import app as dashboard
+    from data_processor_postgres import PoolDataProcessor
+
+    dp = dashboard.data_processor
+    dp.load_data()
+    sql_dp = PoolDataProcessor(query_mode='sql')
+
+    rnd = random.Random(seed)
+    customer_ids = [int(customer_id) for customer_id in dp.df['ID']]
+    techs = dp.get_technicians() or ['Não atribuído']
+    statuses = ['Active (routed)', 'Active (no route)', 'Lead']
+
+    filters = dict(status_filter='Active (routed)', tech_filter=techs[0],
+                   next_change_month=str(datetime.now().month), search_text='silva')
+
+    def update_batch():
+        dp.update_customer_batch(rnd.choice(customer_ids), {
+            'Status': rnd.choice(statuses),
+            'Route Tech': rnd.choice(techs),
+            'Valor Filtro': rnd.choice([0, 120, 150]),
+            'Ultima Troca': '2025-01-15',
+            'Proxima Troca': '2025-04-15'
+        })
+
+    def bulk_update():
+        dp.bulk_update(rnd.sample(customer_ids, min(50, len(customer_ids))), {
+            'Status': rnd.choice(statuses),
+            'Route Tech': rnd.choice(techs),
+            'Proxima Troca': '2025-04-15'
+        })
+
+    def table_first_page():
+        _fake_callback_context('status-filter.value')
+        dashboard.update_table('Todos', 'Todos', 'Todos', 'Todos', 0, 0, 0, 12, [])
+
+    def table_page_change():
+        _fake_callback_context('customers-table.page_current')
+        dashboard.update_table('Todos', 'Todos', 'Todos', 'Todos', 0, 0, 5, 12,
+                               [{'column_id': 'PRÓXIMA TROCA', 'direction': 'desc'}])
+
+    def table_search():
+        _fake_callback_context('search-seq-store.data')
+        dashboard.update_table('Todos', 'Todos', 'Todos', 'Todos', 1, 0, 0, 12, [], 'silva')
+
+    benchmarks = [
+        ('load_data', dp.load_data, None),
+        ('get_filtered_data[todos]', dp.get_filtered_data, dp.result_cache.clear),
+        ('get_filtered_data[filtros]', lambda: dp.get_filtered_data(**filters), dp.result_cache.clear),
+        ('get_filtered_data[cache]', lambda: dp.get_filtered_data(**filters), None),
+        ('get_filtered_data[sql]', lambda: sql_dp.get_filtered_data(**filters), None),
+        ('get_kpis[frio]', dp.get_kpis, dp.invalidate_snapshot),
+        ('get_kpis[cache]', dp.get_kpis, None),
+        ('update_customer_batch', update_batch, None),
+        ('bulk_update[50]', bulk_update, None),
+        ('update_table[inicial]', table_first_page, dashboard.clear_cached_options),
+        ('update_table[pagina]', table_page_change, dashboard.clear_cached_options),
+        ('update_table[busca]', table_search, dashboard.clear_cached_options),
+        ('update_table[memo]', table_page_change, None),
+        ('update_kpis', lambda: dashboard.update_kpis(0), None),
+        ('update_filter_options', lambda: dashboard.update_filter_options(0), None),
+    ]
+
+    results = {}
+    for name, fn, setup in benchmarks:
+        results[name] = measure(fn, repeat, setup)
+    return results
+
+
+# ===== ORQUESTRAÇÃO =====
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return None
+
+
+def _metadata():
+    import pandas
+    import sqlalchemy
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pandas': pandas.__version__,
+        'sqlalchemy': sqlalchemy.__version__,
+    }
+
+
+def _run_in_subprocess(database_url, repeat):
+    """Executa o worker em um processo novo e retorna o JSON de resultados"""
+    env = dict(os.environ, DATABASE_URL=database_url)
+    completed = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.run_benchmarks', '--worker', '--repeat', str(repeat)],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Worker falhou:\n{completed.stderr[-4000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _sqlite_database(size, reuse):
+    """Gera (ou reaproveita) a base semente e devolve uma cópia descartável para a execução"""
+    from benchmarks.synthetic import generate
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    seed_path = os.path.join(DATA_DIR, f'bench_{size}.db')
+    run_path = os.path.join(DATA_DIR, f'bench_{size}.run.db')
+
+    if not (reuse and os.path.exists(seed_path)):
+        print(f"🧪 Gerando base sintética com {size} clientes...")
+        generate(f'sqlite:///{seed_path}', size)
+
+    # Benchmarks de escrita alteram a base: trabalhar sempre em uma cópia
+    shutil.copyfile(seed_path, run_path)
+    return f'sqlite:///{run_path}'
+
+
+def run_all(sizes, repeat, reuse, postgres_url=None):
+    results = {'meta': _metadata(), 'repeat': repeat, 'results': {}}
+
+    for size in sizes:
+        targets = [('sqlite', _sqlite_database(size, reuse))]
+        if postgres_url:
+            from benchmarks.synthetic import generate
+            print(f"🧪 Gerando {size} clientes no PostgreSQL (tabelas recriadas)...")
+            generate(postgres_url, size)
+            targets.append(('postgresql', postgres_url))
+
+        for backend, url in targets:
+            print(f"⏱️  {backend} / {size} clientes...")
+            results['results'].setdefault(backend, {})[str(size)] = _run_in_subprocess(url, repeat)
+
+    return results
+
+
+def print_report(results, baseline=None):
+    """Tabela de latências (e variação do p50 em relação a uma execução anterior)"""
+    header = f"{'backend':<11}{'clientes':>9}  {'benchmark':<28}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'pico MB':>10}"
+    if baseline:
+        header += f"{'Δ p50':>9}"
+    print(header)
+    print('-' * len(header))
+
+    for backend, by_size in results['results'].items():
+        for size, benches in by_size.items():
+            for name, stats in benches.items():
+                line = (f"{backend:<11}{size:>9}  {name:<28}{stats['p50_ms']:>10.2f}"
+                        f"{stats['p90_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['peak_mb']:>10.2f}")
+                if baseline:
+                    old = baseline.get('results', {}).get(backend, {}).get(size, {}).get(name)
+                    if old and old['p50_ms'] > 0:
+                        line += f"{(stats['p50_ms'] / old['p50_ms'] - 1) * 100:>+8.0f}%"
+                print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks do dashboard L\'Acqua Azzurra')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Tamanhos de base (clientes)')
+    parser.add_argument('--repeat', type=int, default=10, help='Execuções por benchmark')
+    parser.add_argument('--output', help='Arquivo JSON de resultados (padrão: benchmarks/results/)')
+    parser.add_argument('--compare', help='JSON de uma execução anterior para comparar')
+    parser.add_argument('--regenerate', action='store_true', help='Gerar bases novamente mesmo se existirem')
+    parser.add_argument('--postgres-url', help='PostgreSQL local opcional (AS TABELAS SÃO RECRIADAS)')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.repeat)))
+        return
+
+    results = run_all(args.sizes, args.repeat, reuse=not args.regenerate, postgres_url=args.postgres_url)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    print_report(results, baseline)
+    print(f"\n💾 Resultados salvos em {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Gerador de dados sintéticos para benchmarks
+
+As distribuições de status, piscineiros e valores seguem o CSV original;
+datas de troca e tipos de filtro seguem o uso atual do dashboard.
+
+Uso:
+    python -m benchmarks.synthetic --rows 10000 --database-url sqlite:///bench_10k.db
+"""
+import argparse
+import os
+import random
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import create_engine, insert
+
+from models import Base, Cliente
+from audit import AuditWriter, insert_audit_rows
+
+CSV_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "L'Acqua Azzurra Pools Customer report-171125135257 - Sheet.csv"
+)
+
+# Mesmas opções do dropdown "Tipo de Filtro" do app ('' = não informado)
+FILTER_TYPES = [
+    'Hayward C750', 'Hayward C900', 'Hayward C1100', 'Hayward C1200', 'Hayward C1750',
+    'Hayward C100s', 'Hayward C150s', 'Hayward C200s',
+    'Pentair Cc100', 'Pentair Cc150', 'Pentair Cc200',
+    'Jandy Cs100', 'Jandy Cs150', 'Jandy Cs200', 'Jandy Cs250', ''
+]
+
+FIRST_NAMES = [
+    'João', 'José', 'Ana', 'Maria', 'Aaron', 'Adrienne', 'Bruno', 'Carla', 'Daniel',
+    'Érica', 'Fábio', 'Gustavo', 'Helena', 'Inês', 'Jennifer', 'Lucas', 'Mônica', 'Otávio'
+]
+LAST_NAMES = [
+    'Silva', 'Santos', 'Oliveira', 'Souza', 'Conceição', 'Araújo', 'Robichaud', 'Williams',
+    'Smith', 'Johnson', 'Gonçalves', 'Magalhães', 'Brown', 'Lopez', 'Nuñez', 'Müller'
+]
+
+CHUNK_SIZE = 10000
+
+# Fração das auditorias no formato antigo (um campo por linha, sem alteracoes)
+LEGACY_AUDIT_FRACTION = 0.2
+
+
+class CustomerDistribution:
+    """Distribuições empíricas extraídas do CSV de clientes"""
+
+    def __init__(self, csv_path=CSV_PATH):
+        df = pd.read_csv(csv_path)
+
+        status_counts = df['Status'].value_counts()
+        self.statuses = list(status_counts.index)
+        self.status_weights = list(status_counts.values)
+
+        techs = df['Route Tech'].fillna('Não atribuído').str.strip()
+        tech_counts = techs.value_counts()
+        self.techs = list(tech_counts.index)
+        self.tech_weights = list(tech_counts.values)
+
+        self.prices = [float(p) for p in df['Route Price'].dropna()]
+
+    def sample(self, rnd, index, today):
+        """Gera um cliente sintético (dict com colunas da tabela clientes)"""
+        name = f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)} {index:07d}"
+
+        ultima = None
+        proxima = None
+        if rnd.random() < 0.8:
+            ultima = today - timedelta(days=rnd.randint(0, 365))
+            if rnd.random() < 0.9:
+                proxima = ultima + timedelta(days=rnd.choice([60, 90, 120, 180]))
+
+        tipo = rnd.choice(FILTER_TYPES)
+        return {
+            'nome': name,
+            'status': rnd.choices(self.statuses, self.status_weights)[0],
+            'piscineiro': rnd.choices(self.techs, self.tech_weights)[0],
+            'valor_rota': 0,
+            'tipo_filtro': tipo or None,
+            'valor_filtro': rnd.choice(self.prices) if tipo else 0,
+            'ultima_troca': ultima,
+            'proxima_troca': proxima,
+        }
+
+    def sample_value(self, rnd, campo, today):
+        """Valor sintético de um campo da auditoria"""
+        if campo == 'status':
+            return rnd.choices(self.statuses, self.status_weights)[0]
+        if campo == 'piscineiro':
+            return rnd.choices(self.techs, self.tech_weights)[0]
+        if campo == 'tipo_filtro':
+            return rnd.choice(FILTER_TYPES) or None
+        if campo == 'valor_filtro':
+            return rnd.choice(self.prices)
+        return today - timedelta(days=rnd.randint(-180, 365))
+
+    def sample_change(self, rnd, campo, today):
+        """(anterior, novo) de um campo, com valores diferentes sempre que possível"""
+        old = self.sample_value(rnd, campo, today)
+        for _ in range(10):
+            new = self.sample_value(rnd, campo, today)
+            if new != old:
+                break
+        return old, new
+
+
+def generate(database_url, rows, audit_per_customer=3, seed=42, recreate=True,
+             legacy_fraction=LEGACY_AUDIT_FRACTION):
+    """
+    Cria as tabelas e insere `rows` clientes e ~`rows * audit_per_customer` auditorias
+
+    As auditorias seguem o formato atual (uma linha por alteração com o diff
+    em alteracoes, ver AuditWriter.changeset); `legacy_fraction` delas fica
+    no formato antigo (um campo por linha), como em bancos já existentes.
+
+    Args:
+        database_url: URL do banco de destino (as tabelas são recriadas se recreate=True)
+        rows: Quantidade de clientes
+        audit_per_customer: Média de registros de auditoria por cliente
+        seed: Semente do gerador (bases reprodutíveis)
+        legacy_fraction: Fração das auditorias no formato antigo
+    """
+    rnd = random.Random(seed)
+    dist = CustomerDistribution()
+    today = date.today()
+    engine = create_engine(database_url)
+
+    if recreate:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    fields = ['status', 'piscineiro', 'tipo_filtro', 'valor_filtro', 'ultima_troca', 'proxima_troca']
+    now = datetime.now()
+
+    with engine.begin() as conn:
+        for start in range(0, rows, CHUNK_SIZE):
+            batch = [dist.sample(rnd, i, today) for i in range(start, min(start + CHUNK_SIZE, rows))]
+            conn.execute(insert(Cliente), batch)
+
+        audits = []
+        for i in range(int(rows * audit_per_customer)):
+            cliente_id = rnd.randint(1, rows)
+            timestamp = now - timedelta(minutes=rnd.randint(0, 525600))
+            if rnd.random() < legacy_fraction:
+                campo = rnd.choice(fields)
+                old, new = dist.sample_change(rnd, campo, today)
+                audits.append({
+                    'cliente_id': cliente_id,
+                    'nome_cliente': f"cliente {cliente_id}",
+                    'acao': 'update',
+                    'campo_alterado': campo,
+                    'valor_anterior': None if old is None else str(old),
+                    'valor_novo': None if new is None else str(new),
+                    'alteracoes': None,
+                    'usuario': 'Sistema',
+                    'timestamp': timestamp,
+                })
+            else:
+                changes = {
+                    campo: dist.sample_change(rnd, campo, today)
+                    for campo in rnd.sample(fields, rnd.choice([1, 1, 1, 2, 2, 3]))
+                }
+                audit = AuditWriter.changeset('update', cliente_id, f"cliente {cliente_id}", changes)
+                audit.update(valor_anterior=None, valor_novo=None, timestamp=timestamp)
+                audits.append(audit)
+            if len(audits) >= CHUNK_SIZE:
+                insert_audit_rows(conn, audits)
+                audits = []
+        if audits:
+            insert_audit_rows(conn, audits)
+
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera base sintética de clientes/auditoria')
+    parser.add_argument('--rows', type=int, required=True, help='Quantidade de clientes')
+    parser.add_argument('--database-url', required=True, help='Banco de destino (tabelas são recriadas)')
+    parser.add_argument('--audit-per-customer', type=float, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--legacy-fraction', type=float, default=LEGACY_AUDIT_FRACTION,
+                        help='Fração das auditorias no formato antigo (um campo por linha)')
+    args = parser.parse_args()
+
+    generate(args.database_url, args.rows, args.audit_per_customer, args.seed,
+             legacy_fraction=args.legacy_fraction)
+    print(f"✅ {args.rows} clientes gerados em {args.database_url}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,71 +2,322 @@
 Módulo para processamento de dados do dashboard L'Acqua Azzurra Pools
 VERSÃO PostgreSQL - Substitui CSV/JSON por banco de dados
 """
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 from datetime import datetime, date
-from decimal import Decimal
-from sqlalchemy import func, or_, and_, extract
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import func, and_, extract, case, select, update, text as sql_text
 from database import db
-from models import Cliente, Auditoria
+from models import Cliente, VersaoDados
+from audit import audit_log
+from table_render import ROW_ID_COLUMN, render_rows
+from search_index import NameSearchIndex, normalize_text, strip_accents
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class SelectionCache:
+    """
+    LRU das seleções de linhas (posições no snapshot) por visão filtrada/ordenada
+    
+    Limitado pelo número de visões e pelo total de posições guardadas.
+    """
+    
+    def __init__(self, max_entries=64, max_rows=5_000_000):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+    
+    def get(self, key):
+        """Posições da visão (array somente leitura) ou None"""
+        with self._lock:
+            positions = self._entries.get(key)
+            if positions is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return positions
+    
+    def put(self, key, positions):
+        positions = np.asarray(positions, dtype=np.int32)
+        if len(positions) > self.max_rows:
+            return positions
+        positions.setflags(write=False)
+        
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._rows -= len(previous)
+            self._entries[key] = positions
+            self._rows += len(positions)
+            
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                _, evicted = self._entries.popitem(last=False)
+                self._rows -= len(evicted)
+                self.stats['evictions'] += 1
+        return positions
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+    
+    def __len__(self):
+        return len(self._entries)
+
+
 class PoolDataProcessor:
     """Processador de dados com PostgreSQL como backend"""
     
-    def __init__(self, csv_path=None):
+    QUERY_MODES = ('snapshot', 'sql')
+    
+    # Colunas com poucos valores distintos (armazenadas como Categorical)
+    CATEGORICAL_COLUMNS = ('Status', 'Route Tech', 'Tipo Filtro')
+    
+    def __init__(self, csv_path=None, version_check_interval=None, query_mode=None):
         """
         Inicializa o processador de dados
         
         Args:
             csv_path: Caminho do CSV (mantido para compatibilidade, mas não usado)
+            version_check_interval: Segundos entre verificações da versão dos dados
+                (se None, usa DATA_VERSION_CHECK_INTERVAL ou 2 segundos)
+            query_mode: 'snapshot' filtra o DataFrame em memória; 'sql' envia
+                filtros e busca para o banco (se None, usa DATA_QUERY_MODE)
         """
         self.csv_path = csv_path  # Mantido para compatibilidade
         self.df = None
-        logger.info("✅ PoolDataProcessor inicializado (modo PostgreSQL)")
+        
+        if query_mode is None:
+            query_mode = os.getenv('DATA_QUERY_MODE', 'snapshot').lower()
+        if query_mode not in self.QUERY_MODES:
+            raise ValueError(f"query_mode inválido: {query_mode} (use {self.QUERY_MODES})")
+        self.query_mode = query_mode
+        
+        # Snapshot em memória: só recarrega quando a versão dos dados mudar
+        if version_check_interval is None:
+            version_check_interval = float(os.getenv('DATA_VERSION_CHECK_INTERVAL', '2'))
+        self.version_check_interval = version_check_interval
+        self._data_version = None    # versão do snapshot em memória
+        self._db_version = None      # última versão lida do banco
+        self._version_checked_at = 0.0
+        self._write_generation = 0   # escritas/invalidações locais (antes da próxima verificação de versão)
+        self._snapshot_lock = threading.RLock()
+        self.snapshot_stats = {'hits': 0, 'reloads': 0, 'version_checks': 0}
+        
+        # Células da tabela já renderizadas para cada linha do snapshot
+        self._render_cache = None
+        self.render_stats = {'cached_rows': 0, 'rendered_rows': 0}
+        
+        # Cache dos KPIs: (versão dos dados, data de hoje) → valores
+        self._kpi_cache = None
+        self.kpi_stats = {'hits': 0, 'misses': 0}
+        
+        # Seleções (posições no snapshot) de cada visão: filtros + ordenação + versão
+        self.result_cache = SelectionCache(
+            max_entries=int(os.getenv('RESULT_CACHE_SIZE', 64)),
+            max_rows=int(os.getenv('RESULT_CACHE_MAX_ROWS', 5_000_000))
+        )
+        
+        # Índice de busca por nome do snapshot (construído na primeira busca)
+        self._name_index = None      # (DataFrame indexado, NameSearchIndex)
+        self._id_index = None        # (DataFrame indexado, pd.Index dos IDs) → posição por id
+        self._sql_search = None      # índice de busca no banco detectado ('pg_trgm', 'fts5' ou '')
+        
+        logger.info(f"✅ PoolDataProcessor inicializado (modo PostgreSQL, consultas: {query_mode})")
+    
+    @staticmethod
+    def _version_columns():
+        """
+        Versão dos dados: contador versao_dados + total de clientes + última atualização
+        
+        O contador muda a cada transação que grava clientes por este processador
+        (ver _bump_version); total e atualizado_em ainda detectam gravações feitas
+        por fora (scripts). Subqueries separadas: COUNT(*) usa o menor índice e
+        o MAX vem direto do índice de atualizado_em (sem varrer a tabela).
+        """
+        return (
+            select(VersaoDados.versao).where(VersaoDados.id == 1).correlate(None).scalar_subquery(),
+            select(func.count()).select_from(Cliente).correlate(None).scalar_subquery(),
+            select(func.max(Cliente.atualizado_em)).correlate(None).scalar_subquery()
+        )
+    
+    @staticmethod
+    def _make_version(counter, total, last_update):
+        return (counter, total, str(last_update) if last_update else None)
+    
+    @staticmethod
+    def _bump_version(session):
+        """Incrementa o contador de versão na transação atual (bloqueia a linha até o commit)"""
+        result = session.execute(
+            update(VersaoDados).where(VersaoDados.id == 1).values(versao=VersaoDados.versao + 1)
+        )
+        if result.rowcount == 0:
+            # Banco criado antes do contador (create_all_tables cria a linha)
+            session.add(VersaoDados(id=1, versao=1))
+            session.flush()
+    
+    def _query_data_version(self, session):
+        """Versão barata dos dados (uma query de agregação, sem carregar clientes)"""
+        return self._make_version(*session.query(*self._version_columns()).one())
+    
+    def get_data_version(self):
+        """Retorna a versão atual dos dados no banco (sem carregar os clientes)"""
+        with db.get_session() as session:
+            return self._query_data_version(session)
+    
+    def _remember_db_version(self, version):
+        """Registra a versão lida do banco e reinicia o intervalo de verificação"""
+        self._db_version = version
+        self._version_checked_at = time.monotonic()
+    
+    def current_data_version(self):
+        """
+        Versão dos dados no banco, consultada no máximo a cada
+        `version_check_interval` segundos (entre verificações usa a última lida)
+        """
+        with self._snapshot_lock:
+            if (self._db_version is not None
+                    and time.monotonic() - self._version_checked_at < self.version_check_interval):
+                return self._db_version
+            
+            try:
+                self.snapshot_stats['version_checks'] += 1
+                self._remember_db_version(self.get_data_version())
+            except Exception as e:
+                logger.error(f"❌ Erro ao verificar versão dos dados: {e}")
+            return self._db_version
+    
+    @property
+    def data_version(self):
+        """Versão do snapshot atualmente em memória"""
+        return self._data_version
+    
+    @property
+    def cache_version(self):
+        """
+        Chave para caches derivados dos dados: versão no banco + escritas locais
+        
+        O contador de escritas locais muda os caches já antes da próxima
+        verificação de versão no banco (version_check_interval).
+        """
+        return (self.current_data_version(), self._write_generation)
+    
+    def ensure_snapshot(self, force=False):
+        """
+        Garante que o snapshot em memória esteja atualizado
+        
+        O reload completo só acontece quando a versão no banco mudou
+        (ver current_data_version).
+        
+        Returns:
+            DataFrame com todos os clientes
+        """
+        with self._snapshot_lock:
+            if not force and self.df is not None:
+                version = self.current_data_version()
+                if version is None or version == self._data_version:
+                    self.snapshot_stats['hits'] += 1
+                    return self.df
+            
+            self.load_data()
+            return self.df
+    
+    def invalidate_snapshot(self):
+        """Força nova verificação de versão na próxima leitura e descarta caches derivados"""
+        with self._snapshot_lock:
+            self._version_checked_at = 0.0
+            self._write_generation += 1
+            self._kpi_cache = None
+            self.result_cache.clear()
     
     def load_data(self):
-        """Carrega dados do PostgreSQL para DataFrame"""
+        """Carrega dados do PostgreSQL para DataFrame (reload completo)"""
         try:
             with db.get_session() as session:
-                # Carregar todos os clientes
-                clientes = session.query(Cliente).all()
-                
-                # Converter para lista de dicionários
-                data = []
-                for cliente in clientes:
-                    data.append({
-                        'Name': cliente.nome,
-                        'Status': cliente.status,
-                        'Route Tech': cliente.piscineiro or 'Não atribuído',
-                        'Route Price': float(cliente.valor_rota) if cliente.valor_rota else 0.00,
-                        'Tipo Filtro': cliente.tipo_filtro or '',
-                        'Valor Filtro': float(cliente.valor_filtro) if cliente.valor_filtro else 0.00,
-                        'Ultima Troca': cliente.ultima_troca.strftime('%d/%m/%Y') if cliente.ultima_troca else '',
-                        'Proxima Troca': cliente.proxima_troca.strftime('%d/%m/%Y') if cliente.proxima_troca else '',
-                        'ID': cliente.id  # ID do banco para referência
-                    })
-                
-                # Criar DataFrame
-                self.df = pd.DataFrame(data)
+                # Versão lida ANTES dos dados: uma escrita concorrente
+                # apenas provoca um reload extra, nunca um snapshot desatualizado
+                version = self._query_data_version(session)
+                
+                # Carregar todos os clientes (apenas as colunas usadas)
+                rows = session.query(*self._customer_columns()).all()
+                
+                # Criar DataFrame (índice de busca e seleções do snapshot anterior são descartados)
+                self._name_index = None
+                self._id_index = None
+                self.result_cache.clear()
+                self.df = self._rows_to_dataframe(rows)
+                self._render_cache = render_rows(self.df)
+                self.render_stats['rendered_rows'] += len(self.df)
+                self._data_version = version
+                self._remember_db_version(version)
+                self.snapshot_stats['reloads'] += 1
                 
                 logger.info(f"✅ Dados carregados: {len(self.df)} clientes")
                 
         except Exception as e:
             logger.error(f"❌ Erro ao carregar dados: {e}")
             # Fallback para DataFrame vazio
-            self.df = pd.DataFrame(columns=[
-                'Name', 'Status', 'Route Tech', 'Route Price', 
-                'Tipo Filtro', 'Valor Filtro', 'Ultima Troca', 'Proxima Troca', 'ID'
-            ])
+            self.df = self._rows_to_dataframe([])
+            self._render_cache = render_rows(self.df)
+            self._data_version = None
+    
+    @staticmethod
+    def _customer_columns():
+        """Colunas do banco carregadas para o DataFrame"""
+        return (
+            Cliente.id, Cliente.nome, Cliente.status, Cliente.piscineiro,
+            Cliente.valor_rota, Cliente.tipo_filtro, Cliente.valor_filtro,
+            Cliente.ultima_troca, Cliente.proxima_troca
+        )
+    
+    @staticmethod
+    def _rows_to_dataframe(rows):
+        """Converte linhas (na ordem de _customer_columns) para DataFrame"""
+        data = []
+        for row in rows:
+            data.append({
+                'Name': row.nome,
+                'Status': row.status,
+                'Route Tech': row.piscineiro or 'Não atribuído',
+                'Route Price': float(row.valor_rota) if row.valor_rota else 0.00,
+                'Tipo Filtro': row.tipo_filtro or '',
+                'Valor Filtro': float(row.valor_filtro) if row.valor_filtro else 0.00,
+                'Ultima Troca': row.ultima_troca,
+                'Proxima Troca': row.proxima_troca,
+                'ID': row.id  # ID do banco para referência
+            })
+        
+        df = pd.DataFrame(data, columns=[
+            'Name', 'Status', 'Route Tech', 'Route Price',
+            'Tipo Filtro', 'Valor Filtro', 'Ultima Troca', 'Proxima Troca', 'ID'
+        ])
+        
+        # Datas nativas (datetime64[ns], NaT quando vazio): filtro/ordenação vetorizados
+        # A formatação DD/MM/YYYY acontece só na apresentação (app.py)
+        for col in ('Ultima Troca', 'Proxima Troca'):
+            df[col] = pd.to_datetime(df[col]).astype('datetime64[ns]')
+        
+        # Poucos valores distintos repetidos em todas as linhas: Categorical
+        # (códigos inteiros + dicionário compartilhado) economiza memória e
+        # transforma os filtros de igualdade em comparações de inteiros
+        for col in PoolDataProcessor.CATEGORICAL_COLUMNS:
+            df[col] = df[col].astype('category')
+        return df
     
     def load_extra_data(self):
-        """Carrega dados do PostgreSQL se ainda não carregados"""
-        if self.df is None or self.df.empty:
-            self.load_data()
+        """Carrega dados do PostgreSQL se ainda não carregados (ou desatualizados)"""
+        self.ensure_snapshot()
     
     def save_extra_data(self):
         """Compatibilidade - não usado mais (dados estão no PostgreSQL)"""
@@ -97,10 +348,13 @@ class PoolDataProcessor:
         return normalization.get(tech_lower, tech_name)
     
     def _parse_date(self, date_str):
-        """Converte string DD/MM/YYYY para objeto date"""
+        """Converte string DD/MM/YYYY (ou ISO YYYY-MM-DD) para objeto date"""
         if not date_str or pd.isna(date_str):
             return None
         
+        if isinstance(date_str, datetime):  # inclui pd.Timestamp
+            return date_str.date()
+        
         if isinstance(date_str, date):
             return date_str
         
@@ -114,64 +368,327 @@ class PoolDataProcessor:
                     return None
         return None
     
-    def update_customer_data(self, customer_name, field, value):
+    def _extend_categories(self, column, values):
+        """Inclui no Categorical do snapshot os valores ainda ausentes (em ordem alfabética)"""
+        series = self.df[column]
+        missing = set(pd.Series(values).dropna()) - set(series.cat.categories)
+        if missing:
+            # Manter categorias em ordem alfabética (a ordenação da tabela usa essa ordem)
+            self.df[column] = series.cat.set_categories(sorted([*series.cat.categories, *missing]))
+    
+    def _snapshot_positions(self, df, customer_ids):
+        """Posições em `df` (o snapshot) dos ids informados (-1 quando ausente)"""
+        if self._id_index is None or self._id_index[0] is not df:
+            self._id_index = (df, pd.Index(df['ID'].to_numpy()))
+        return self._id_index[1].get_indexer(customer_ids)
+    
+    @staticmethod
+    def _row_customer(row):
+        """Linha do DataFrame → dict no formato de get_customer"""
+        return {
+            'ID': int(row['ID']),
+            'Name': row['Name'],
+            'Status': row['Status'],
+            'Route Tech': row['Route Tech'],
+            'Tipo Filtro': row['Tipo Filtro'],
+            'Valor Filtro': float(row['Valor Filtro']),
+            'Ultima Troca': row['Ultima Troca'].date() if pd.notna(row['Ultima Troca']) else None,
+            'Proxima Troca': row['Proxima Troca'].date() if pd.notna(row['Proxima Troca']) else None
+        }
+    
+    @staticmethod
+    def _db_row_customer(row):
+        """Linha do banco (colunas de _customer_columns, Row ou dict) → dict no formato de get_customer"""
+        values = getattr(row, '_mapping', row)
+        # Mesmos valores padrão de _rows_to_dataframe
+        return {
+            'ID': values['id'],
+            'Name': values['nome'],
+            'Status': values['status'],
+            'Route Tech': values['piscineiro'] or 'Não atribuído',
+            'Tipo Filtro': values['tipo_filtro'] or '',
+            'Valor Filtro': float(values['valor_filtro']) if values['valor_filtro'] else 0.00,
+            'Ultima Troca': values['ultima_troca'],
+            'Proxima Troca': values['proxima_troca']
+        }
+    
+    def _patch_snapshot(self, rows):
+        """
+        Aplica linhas gravadas (na ordem de _customer_columns) no snapshot,
+        no cache de renderização e nos índices de id e de busca
+        
+        Clientes existentes são alterados no lugar; novos vão para o final.
+        Chamado com _snapshot_lock: quem lê linhas do snapshot ou do cache de
+        renderização (fatias, get_customer, render_page) também lê sob o lock.
+        
+        Returns:
+            Lista de (cliente antes ou None, cliente depois) para ajustar KPIs
         """
-        Atualiza dados de um cliente específico no PostgreSQL
+        df = self.df
+        changed = self._rows_to_dataframe(rows)
+        positions = self._snapshot_positions(df, changed['ID'].to_numpy())
+        existing = positions >= 0
+        name_index = self._name_index[1] if self._name_index and self._name_index[0] is df else None
+        
+        updated = changed[existing].copy()
+        labels = df.index[positions[existing]]
+        changes = [(self._row_customer(df.loc[label]), self._row_customer(row))
+                   for label, (_, row) in zip(labels, updated.iterrows())]
+        if len(updated):
+            updated.index = labels
+            for column in updated.columns:
+                if column in self.CATEGORICAL_COLUMNS:
+                    self._extend_categories(column, updated[column])
+                self.df.loc[labels, column] = updated[column].to_numpy()
+            if self._render_cache is not None:
+                self._render_cache.loc[labels] = render_rows(updated)
+            self.render_stats['rendered_rows'] += len(updated)
+            if name_index is not None:
+                for position, name in zip(positions[existing], updated['Name']):
+                    name_index.update(position, name)
+        
+        added = changed[~existing].copy()
+        if len(added):
+            changes += [(None, self._row_customer(row)) for _, row in added.iterrows()]
+            added.index = pd.RangeIndex(len(df), len(df) + len(added))
+            for column in self.CATEGORICAL_COLUMNS:
+                self._extend_categories(column, added[column])
+                added[column] = pd.Categorical(added[column], categories=self.df[column].cat.categories)
+            
+            # Novo DataFrame: índices derivados acompanham a troca
+            id_index = self._id_index[1]
+            self.df = pd.concat([self.df, added])
+            self._id_index = (self.df, id_index.append(pd.Index(added['ID'].to_numpy())))
+            if self._render_cache is not None:
+                self._render_cache = pd.concat([self._render_cache, render_rows(added)])
+            self.render_stats['rendered_rows'] += len(added)
+            if name_index is not None:
+                name_index.append(added['Name'].to_numpy())
+                self._name_index = (self.df, name_index)
+        
+        return changes
+    
+    def _begin_write(self, session):
+        """
+        Estado write-through da transação atual (criado na primeira escrita)
+        
+        Incrementa o contador de versão uma vez por transação, antes de
+        bloquear clientes (ordem de locks igual em todas as escritas). As
+        linhas gravadas são aplicadas no snapshot após o commit (ver
+        _apply_writes) em vez de um reload completo, desde que a versão do
+        banco depois da escrita se explique pelo snapshot + estas escritas.
+        """
+        session.connection()  # inicia a transação (autobegin) para identificá-la
+        transaction = session.get_transaction()
+        
+        key = ('snapshot_writes', id(self))
+        pending = session.info.get(key)
+        if pending is not None and pending['transaction'] is transaction:
+            return pending
+        
+        base = None
+        if self.query_mode == 'snapshot' and self.df is not None:
+            base = self._data_version
+        
+        self._bump_version(session)
+        pending = {'transaction': transaction, 'base': base, 'version': None,
+                   'rows': {}, 'inserted': 0}
+        session.info[key] = pending
+        db.on_commit(lambda: self._apply_writes(pending))
+        # SAVEPOINT desfeito levou junto o incremento: a próxima escrita recomeça
+        db.on_rollback(lambda: session.info.pop(key, None))
+        return pending
+    
+    def _track_write(self, session, pending, rows, inserted=0):
+        """
+        Após a escrita: guarda as linhas como ficaram no banco (na ordem de
+        _customer_columns) e confere, com uma única query, que a versão do
+        banco é a do snapshot + esta transação
+        
+        O contador de versão precisa ser exatamente o do snapshot + 1 (o
+        incremento desta transação); qualquer outro valor significa escrita
+        de outro processo e o snapshot será recarregado. Total de clientes e
+        atualizado_em dos demais clientes cobrem gravações feitas por fora do
+        processador (que não incrementam o contador).
+        """
+        pending['inserted'] += inserted
+        pending['rows'].update((row.id, row) for row in rows)
+        # Linhas desfeitas por um SAVEPOINT não podem ir para o snapshot: recarregar
+        db.on_rollback(lambda: pending.update(base=None))
+        if pending['base'] is None:
+            return
+        
+        # Mais recente entre os OUTROS clientes: não pode passar da versão do snapshot
+        others_update = (
+            select(func.max(Cliente.atualizado_em))
+            .where(Cliente.id.notin_(list(pending['rows'])))
+            .scalar_subquery()
+        )
+        counter, total, last_update, others_update = session.query(*self._version_columns(), others_update).one()
+        base_counter, base_total, base_update = pending['base']
+        if (base_counter is not None and counter == base_counter + 1
+                and total == base_total + pending['inserted']
+                and (others_update is None or (base_update is not None and str(others_update) <= base_update))):
+            pending['version'] = self._make_version(counter, total, last_update)
+        else:
+            # Outro processo escreveu desde o snapshot: será recarregado
+            pending['base'] = None
+    
+    def _apply_writes(self, pending):
+        """
+        Pós-commit: aplica as linhas gravadas no snapshot e nos caches (ou invalida)
+        
+        Sem linhas gravadas (ex.: id inexistente) o incremento do contador foi
+        confirmado mesmo assim: o snapshot só avança para a nova versão.
+        """
+        with self._snapshot_lock:
+            if pending['base'] is None or self.df is None or pending['base'] != self._data_version:
+                self.invalidate_snapshot()
+                return
+            
+            rows = list(pending['rows'].values())
+            changes = self._patch_snapshot(rows) if rows else []
+            version = pending['version']
+            
+            # KPIs em cache ajustados pela diferença dos clientes alterados
+            today = date.today()
+            cached = self._kpi_cache
+            if cached is not None and cached[0] == (pending['base'], today):
+                kpis = cached[1]
+                for before, after in changes:
+                    kpis = self.adjust_kpis(kpis, before, after)
+                self._kpi_cache = ((version, today), kpis)
+            else:
+                self._kpi_cache = None
+            
+            self._data_version = version
+            self._remember_db_version(version)
+            if changes:
+                self._write_generation += 1
+                self.result_cache.clear()
+                logger.info(f"✏️ Snapshot atualizado sem reload: {len(changes)} cliente(s)")
+    
+    def render_page(self, page_df):
+        """
+        Células da tabela para as linhas de `page_df`
+        
+        Linhas vindas do snapshot são servidas do cache de renderização;
+        as demais (modo sql ou snapshot recarregado no meio) são renderizadas na hora.
+        """
+        with self._snapshot_lock:
+            cache = self._render_cache
+            if cache is not None and page_df.index.isin(cache.index).all():
+                rendered = cache.loc[page_df.index]
+                # Conferir que o índice ainda aponta para os mesmos clientes
+                if (rendered[ROW_ID_COLUMN].values == page_df['ID'].values).all():
+                    self.render_stats['cached_rows'] += len(rendered)
+                    return rendered
+        
+        self.render_stats['rendered_rows'] += len(page_df)
+        return render_rows(page_df)
+    
+    # Campos do DataFrame → colunas do banco
+    FIELD_COLUMNS = {
+        'Name': 'nome',
+        'Status': 'status',
+        'Route Tech': 'piscineiro',
+        'Route Price': 'valor_rota',
+        'Tipo Filtro': 'tipo_filtro',
+        'Valor Filtro': 'valor_filtro',
+        'Ultima Troca': 'ultima_troca',
+        'Proxima Troca': 'proxima_troca',
+        'Last Changed': 'ultima_troca',  # Compatibilidade
+        'Next Change': 'proxima_troca'   # Compatibilidade
+    }
+    
+    def _db_values(self, updates):
+        """{campo do DataFrame: valor da UI} → {coluna do banco: valor normalizado}"""
+        values = {}
+        for field, value in updates.items():
+            if field == 'Route Tech':
+                value = self._normalize_tech(value)
+            elif field in ('Route Price', 'Valor Filtro'):
+                # Centavos como no Numeric(10, 2) (o SQLite guardaria o valor sem arredondar)
+                value = Decimal(str(value)).quantize(Decimal('0.01'), ROUND_HALF_UP) if value else Decimal('0.00')
+            elif field in ('Last Changed', 'Next Change', 'Ultima Troca', 'Proxima Troca'):
+                value = self._parse_date(value)
+            values[self.FIELD_COLUMNS.get(field, field.lower().replace(' ', '_'))] = value
+        return values
+    
+    def _update_customer_rows(self, session, customer_ids, values):
+        """
+        UPDATE clientes SET ... WHERE id IN (...) pela chave primária
+        
+        PostgreSQL: um único comando (valores anteriores por subquery FOR UPDATE
+        no FROM, valores gravados por RETURNING). Demais bancos: SELECT pela PK
+        e UPDATE ... RETURNING (ou novo SELECT se o banco não suporta RETURNING
+        no UPDATE, como o MySQL).
+        
+        Returns:
+            Lista de (dict coluna → valor anterior, linha gravada nas colunas de
+            _customer_columns), só para os ids existentes
+        """
+        columns = self._customer_columns()
+        dialect = session.get_bind().dialect
+        
+        if dialect.name == 'postgresql':
+            previous = select(*columns).where(Cliente.id.in_(customer_ids)).with_for_update().subquery('anterior')
+            rows = session.execute(
+                update(Cliente).where(Cliente.id == previous.c.id).values(values)
+                .returning(*columns, *[column.label(f'anterior_{column.key}') for column in previous.c])
+                .execution_options(synchronize_session=False)
+            ).all()
+            return [({column.key: getattr(row, f'anterior_{column.key}') for column in previous.c}, row)
+                    for row in rows]
+        
+        by_ids = select(*columns).where(Cliente.id.in_(customer_ids))
+        old = {row.id: dict(row._mapping) for row in session.execute(by_ids)}
+        if not old:
+            return []
+        
+        statement = (update(Cliente).where(Cliente.id.in_(list(old))).values(values)
+                     .execution_options(synchronize_session=False))
+        if dialect.update_returning:
+            rows = session.execute(statement.returning(*columns)).all()
+        else:
+            session.execute(statement)
+            rows = session.execute(by_ids).all()
+        return [(old[row.id], row) for row in rows]
+    
+    def _update_customer_row(self, session, customer_id, values):
+        """_update_customer_rows de um cliente: (valores anteriores, linha gravada) ou None"""
+        results = self._update_customer_rows(session, [customer_id], values)
+        return results[0] if results else None
+    
+    def update_customer_data(self, customer_id, field, value):
+        """
+        Atualiza um campo de um cliente no PostgreSQL
         
         Args:
-            customer_name: Nome do cliente
+            customer_id: Cliente.id
             field: Campo a ser atualizado
             value: Novo valor
         """
         try:
-            with db.get_session() as session:
-                cliente = session.query(Cliente).filter_by(nome=customer_name).first()
+            with db.get_session(savepoint=True) as session:
+                values = self._db_values({field: value})
+                value = next(iter(values.values()))
                 
-                if not cliente:
-                    logger.warning(f"Cliente '{customer_name}' não encontrado")
+                pending = self._begin_write(session)
+                result = self._update_customer_row(session, customer_id, values)
+                if result is None:
+                    self._track_write(session, pending, [])  # só o incremento do contador
+                    logger.warning(f"Cliente id={customer_id} não encontrado")
                     return False
                 
-                # Mapear campos do DataFrame para modelo
-                field_mapping = {
-                    'Status': 'status',
-                    'Route Tech': 'piscineiro',
-                    'Route Price': 'valor_rota',
-                    'Tipo Filtro': 'tipo_filtro',
-                    'Valor Filtro': 'valor_filtro',
-                    'Ultima Troca': 'ultima_troca',
-                    'Proxima Troca': 'proxima_troca',
-                    'Last Changed': 'ultima_troca',  # Compatibilidade
-                    'Next Change': 'proxima_troca'   # Compatibilidade
-                }
-                
-                db_field = field_mapping.get(field, field.lower().replace(' ', '_'))
-                old_value = getattr(cliente, db_field, None)
-                
-                # Processar valor baseado no campo
-                if field == 'Route Tech':
-                    value = self._normalize_tech(value)
-                elif field in ['Route Price', 'Valor Filtro']:
-                    value = Decimal(str(value)) if value else Decimal('0.00')
-                elif field in ['Last Changed', 'Next Change', 'Ultima Troca', 'Proxima Troca']:
-                    value = self._parse_date(value)
-                
-                # Atualizar campo
-                setattr(cliente, db_field, value)
+                old, row = result
+                self._track_write(session, pending, [row])
                 
                 # Registrar auditoria
-                self.log_action(
-                    'update',
-                    cliente_id=cliente.id,
-                    nome_cliente=cliente.nome,
-                    campo=db_field,
-                    valor_anterior=str(old_value),
-                    valor_novo=str(value)
-                )
+                self.log_action('update', row.id, row.nome, self._changed_fields(old, row, values))
                 
-                session.commit()
-                logger.info(f"✅ Cliente '{customer_name}' atualizado: {field} = {value}")
-                
-                # NÃO recarregar DataFrame aqui - será feito depois de todos os updates
+                # Commit fica com a sessão mais externa (auditoria gravada conforme AUDIT_MODE)
+                logger.info(f"✅ Cliente '{row.nome}' atualizado: {field} = {value}")
                 
                 return True
                 
@@ -179,84 +696,101 @@ class PoolDataProcessor:
             logger.error(f"❌ Erro ao atualizar cliente: {e}")
             return False
     
-    def update_customer_batch(self, customer_name, updates):
+    def update_customer_batch(self, customer_id, updates):
         """
-        Atualiza múltiplos campos de um cliente em uma única transação
-        MUITO MAIS RÁPIDO que update_customer_data múltiplas vezes
+        Atualiza múltiplos campos de um cliente com um único UPDATE pela chave primária
         
         Args:
-            customer_name: Nome do cliente
-            updates: Dict com {campo: valor}
+            customer_id: Cliente.id
+            updates: Dict com {campo: valor} ('Name' renomeia o cliente;
+                a unicidade do nome é conferida por quem chama)
+        
+        Returns:
+            (cliente antes, cliente como ficou gravado) no formato de get_customer,
+            ou None. O "antes" é lido no banco sob o lock da linha (não do snapshot).
         """
         try:
-            with db.get_session() as session:
-                cliente = session.query(Cliente).filter_by(nome=customer_name).first()
+            with db.get_session(savepoint=True) as session:
+                values = self._db_values(updates)
                 
-                if not cliente:
-                    logger.warning(f"Cliente '{customer_name}' não encontrado")
-                    return False
+                pending = self._begin_write(session)
+                result = self._update_customer_row(session, customer_id, values)
+                if result is None:
+                    self._track_write(session, pending, [])  # só o incremento do contador
+                    logger.warning(f"Cliente id={customer_id} não encontrado")
+                    return None
                 
-                cliente_id = cliente.id
-                logger.info(f"✓ Cliente encontrado: ID={cliente_id}")
+                old, row = result
+                # Snapshot recebe os valores gravados após o commit (sem reload completo)
+                self._track_write(session, pending, [row])
                 
-                # Mapear campos
-                field_mapping = {
-                    'Status': 'status',
-                    'Route Tech': 'piscineiro',
-                    'Route Price': 'valor_rota',
-                    'Tipo Filtro': 'tipo_filtro',
-                    'Valor Filtro': 'valor_filtro',
-                    'Ultima Troca': 'ultima_troca',
-                    'Proxima Troca': 'proxima_troca'
-                }
+                # Uma linha de auditoria com o diff de todos os campos alterados
+                self.log_action('update', row.id, row.nome, self._changed_fields(old, row, values))
                 
-                # Coletar valores antigos ANTES de modificar
-                old_values = {}
-                for field in updates.keys():
-                    db_field = field_mapping.get(field, field.lower().replace(' ', '_'))
-                    old_values[db_field] = getattr(cliente, db_field, None)
-                
-                # Aplicar todas as atualizações
-                for field, value in updates.items():
-                    db_field = field_mapping.get(field, field.lower().replace(' ', '_'))
-                    old_value = old_values[db_field]
-                    
-                    # Processar valor
-                    if field == 'Route Tech':
-                        value = self._normalize_tech(value)
-                    elif field in ['Route Price', 'Valor Filtro']:
-                        value = Decimal(str(value)) if value else Decimal('0.00')
-                    elif field in ['Ultima Troca', 'Proxima Troca']:
-                        value = self._parse_date(value)
-                    
-                    # Atualizar
-                    setattr(cliente, db_field, value)
-                
-                # Commit ANTES de log para não perder a sessão
-                session.commit()
-                logger.info(f"✅ Cliente '{customer_name}' atualizado (batch): {len(updates)} campos - COMMIT EXECUTADO")
-                
-                # Atualizar DataFrame em memória para evitar reload completo
-                if self.df is not None:
-                    mask = self.df['Name'] == customer_name
-                    if mask.any():
-                        for field, value in updates.items():
-                            if field in self.df.columns:
-                                self.df.loc[mask, field] = value
-                
-                return True
+                logger.info(f"✅ Cliente '{row.nome}' atualizado (batch): {len(updates)} campos")
+                return self._db_row_customer(old), self._db_row_customer(row)
                 
         except Exception as e:
             logger.error(f"❌ Erro ao atualizar cliente (batch): {e}")
             import traceback
             logger.error(traceback.format_exc())
-            return False
+            return None
+    
+    # Campos que a edição em massa pode alterar (o nome é único por cliente)
+    BULK_FIELDS = ('Status', 'Route Tech', 'Tipo Filtro', 'Valor Filtro', 'Ultima Troca', 'Proxima Troca')
+    
+    def bulk_update(self, customer_ids, changes):
+        """
+        Aplica as mesmas alterações a vários clientes
+        
+        Um único UPDATE ... WHERE id IN (...), um lote de auditoria (uma linha
+        por campo que mudou) e um único patch do snapshot após o commit.
+        
+        Args:
+            customer_ids: Lista de Cliente.id
+            changes: Dict com {campo: valor} (campos de BULK_FIELDS)
+        
+        Returns:
+            Lista dos clientes como ficaram gravados (formato de get_customer)
+        """
+        invalid = set(changes) - set(self.BULK_FIELDS)
+        if invalid:
+            raise ValueError(f"Campos não permitidos na edição em massa: {sorted(invalid)}")
+        
+        customer_ids = sorted({int(customer_id) for customer_id in customer_ids})
+        if not customer_ids or not changes:
+            return []
+        
+        try:
+            with db.get_session(savepoint=True) as session:
+                values = self._db_values(changes)
+                
+                pending = self._begin_write(session)
+                results = self._update_customer_rows(session, customer_ids, values)
+                rows = [row for _, row in results]
+                self._track_write(session, pending, rows)
+                
+                # Uma linha de auditoria por cliente alterado, gravadas em lote
+                changes_log = []
+                for old, row in results:
+                    changed = self._changed_fields(old, row, values)
+                    if changed:
+                        changes_log.append(audit_log.changeset('update', row.id, row.nome, changed))
+                audit_log.record_many(changes_log)
+                
+                logger.info(f"✅ Edição em massa: {len(rows)} clientes, {len(values)} campos "
+                            f"({len(changes_log)} clientes alterados)")
+                return [self._db_row_customer(row) for row in rows]
+                
+        except Exception as e:
+            logger.error(f"❌ Erro na edição em massa: {e}")
+            return []
     
-    def get_customer_extra_data(self, customer_name, field):
+    def get_customer_extra_data(self, customer_id, field):
         """Obtém dados de um cliente (compatibilidade)"""
         try:
             with db.get_session() as session:
-                cliente = session.query(Cliente).filter_by(nome=customer_name).first()
+                cliente = session.get(Cliente, customer_id)
                 
                 if not cliente:
                     return ''
@@ -278,91 +812,405 @@ class PoolDataProcessor:
         except Exception as e:
             logger.error(f"❌ Erro ao obter dados do cliente: {e}")
             return ''
+
+    def get_customer(self, customer_id):
+        """
+        Valores brutos de um cliente pela chave primária (usado pelo modal de edição)
+
+        Servido do snapshot em memória; busca no banco no modo sql ou se o
+        cliente ainda não estiver no snapshot.
+
+        Returns:
+            dict com as colunas do DataFrame (datas como date ou None) ou None
+        """
+        if customer_id is None:
+            return None
+
+        if self.query_mode == 'snapshot':
+            with self._snapshot_lock:
+                df = self.ensure_snapshot()
+                position = self._snapshot_positions(df, [customer_id])[0]
+                if position >= 0:
+                    return self._row_customer(df.iloc[position])
+
+        try:
+            with db.get_session() as session:
+                row = session.query(*self._customer_columns()).filter(Cliente.id == customer_id).first()
+                if not row:
+                    logger.warning(f"Cliente id={customer_id} não encontrado")
+                    return None
+
+                return self._db_row_customer(row)
+        except Exception as e:
+            logger.error(f"❌ Erro ao obter cliente: {e}")
+            return None
+
+    @staticmethod
+    def _customers_to_dataframe(customers):
+        """dicts no formato de get_customer → DataFrame com as colunas do snapshot"""
+        df = pd.DataFrame(list(customers), columns=[
+            'Name', 'Status', 'Route Tech', 'Tipo Filtro', 'Valor Filtro',
+            'Ultima Troca', 'Proxima Troca', 'ID'
+        ])
+        for col in ('Ultima Troca', 'Proxima Troca'):
+            df[col] = pd.to_datetime(df[col]).astype('datetime64[ns]')
+        return df
+
+    def render_customer(self, customer):
+        """Células da tabela (mesmo formato de render_page) de um único cliente"""
+        return render_rows(self._customers_to_dataframe([customer])).to_dict('records')[0]
+
+    def customer_matches(self, customer, status_filter=None, tech_filter=None, last_change_month=None,
+                         next_change_month=None, search_text=None):
+        """Indica se o cliente aparece no resultado dos filtros informados"""
+        return not self._filter_frame(
+            self._customers_to_dataframe([customer]), status_filter, tech_filter,
+            last_change_month, next_change_month, search_text
+        ).empty
+
+    @staticmethod
+    def _is_active_filter(value):
+        """Filtro preenchido e diferente de 'Todos'"""
+        return bool(value) and value != 'Todos'
     
-    def get_filtered_data(self, status_filter=None, tech_filter=None, last_change_month=None, next_change_month=None):
-        """Filtra dados baseado em critérios"""
-        # Recarregar dados do banco
-        self.load_data()
+    @staticmethod
+    def _like_pattern(text):
+        """Monta padrão '%texto%' escapando curingas do LIKE"""
+        escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return f"%{escaped}%"
+    
+    def _detect_sql_search(self):
+        """
+        Índice de busca criado por migrate_search_index.py (detectado uma vez)
+        
+        A consulta roda em uma conexão própria, fora da transação da requisição:
+        uma falha aqui não aborta a transação do callback (PostgreSQL).
+        
+        Returns:
+            'pg_trgm' (PostgreSQL), 'fts5' (SQLite) ou '' (busca com ILIKE)
+        """
+        if self._sql_search is None:
+            dialect = db.engine.dialect.name
+            try:
+                if dialect == 'postgresql':
+                    with db.engine.connect() as conn:
+                        found = conn.execute(sql_text("SELECT to_regprocedure('f_unaccent(text)') IS NOT NULL")).scalar()
+                    self._sql_search = 'pg_trgm' if found else ''
+                elif dialect == 'sqlite':
+                    with db.engine.connect() as conn:
+                        found = conn.execute(sql_text(
+                            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'clientes_busca'"
+                        )).first()
+                    self._sql_search = 'fts5' if found else ''
+                else:
+                    # MySQL: collations utf8mb4 *_ai_ci já ignoram acentos no LIKE
+                    self._sql_search = ''
+            except Exception as e:
+                logger.warning(f"⚠️ Não foi possível detectar índice de busca: {e}")
+                self._sql_search = ''
+            logger.info(f"🔎 Busca no banco: {self._sql_search or 'ILIKE'}")
+        return self._sql_search
+    
+    def _sql_search_clause(self, search_text):
+        """Condição de busca por nome usando o índice disponível no banco"""
+        backend = self._detect_sql_search()
+        
+        if backend == 'pg_trgm':
+            # Mesma expressão do índice GIN: lower(f_unaccent(nome))
+            needle = strip_accents(search_text).lower()
+            return func.lower(func.f_unaccent(Cliente.nome)).like(self._like_pattern(needle), escape='\\')
+        
+        if backend == 'fts5' and len(search_text) >= 3:
+            # Tokenizer trigram: frase entre aspas casa como substring
+            phrase = '"' + search_text.replace('"', '""') + '"'
+            return Cliente.id.in_(
+                sql_text("SELECT rowid FROM clientes_busca WHERE clientes_busca MATCH :busca")
+                .bindparams(busca=phrase)
+            )
+        
+        return Cliente.nome.ilike(self._like_pattern(search_text), escape='\\')
+    
+    # Colunas do DataFrame que podem ser ordenadas → colunas do banco
+    SORT_FIELDS = {
+        'Name': Cliente.nome,
+        'Status': Cliente.status,
+        'Route Tech': Cliente.piscineiro,
+        'Tipo Filtro': Cliente.tipo_filtro,
+        'Valor Filtro': Cliente.valor_filtro,
+        'Ultima Troca': Cliente.ultima_troca,
+        'Proxima Troca': Cliente.proxima_troca,
+    }
+    
+    def _valid_sort(self, sort_by):
+        """Filtra sort_by [(coluna, 'asc'|'desc'), ...] mantendo colunas conhecidas"""
+        return [(col, direction) for col, direction in (sort_by or []) if col in self.SORT_FIELDS]
+    
+    def build_filtered_query(self, session, status_filter=None, tech_filter=None,
+                             last_change_month=None, next_change_month=None, search_text=None,
+                             sort_by=None):
+        """
+        Monta uma única query SQL com todos os filtros do dashboard
+        
+        Status/piscineiro usam o índice idx_status_piscineiro; meses usam
+        extract(month ...) e a busca por nome usa o índice de trigramas
+        (pg_trgm / FTS5) quando existir, senão ILIKE. sort_by
+        [(coluna, direção), ...] vira ORDER BY (com id como desempate).
+        """
+        query = session.query(*self._customer_columns()).filter(Cliente.status != 'Inactive')
+        
+        if self._is_active_filter(status_filter):
+            query = query.filter(Cliente.status == status_filter)
+        
+        if self._is_active_filter(tech_filter):
+            query = query.filter(Cliente.piscineiro == tech_filter)
         
-        df_filtered = self.df.copy()
+        if self._is_active_filter(last_change_month):
+            query = query.filter(extract('month', Cliente.ultima_troca) == int(last_change_month))
+        
+        if self._is_active_filter(next_change_month):
+            query = query.filter(extract('month', Cliente.proxima_troca) == int(next_change_month))
+        
+        if search_text and search_text.strip():
+            query = query.filter(self._sql_search_clause(search_text.strip()))
+        
+        order_by = []
+        for col, direction in self._valid_sort(sort_by):
+            field = self.SORT_FIELDS[col]
+            order_by.append(field.desc() if direction == 'desc' else field.asc())
+        
+        return query.order_by(*order_by, Cliente.id)
+    
+    def get_filtered_data(self, status_filter=None, tech_filter=None, last_change_month=None,
+                          next_change_month=None, search_text=None):
+        """Filtra dados baseado em critérios (no banco ou no snapshot, conforme query_mode)"""
+        if self.query_mode == 'sql':
+            try:
+                with db.get_session() as session:
+                    rows = self.build_filtered_query(
+                        session, status_filter, tech_filter,
+                        last_change_month, next_change_month, search_text
+                    ).all()
+                    return self._rows_to_dataframe(rows)
+            except Exception as e:
+                logger.error(f"❌ Erro ao filtrar no banco: {e}")
+                return self._rows_to_dataframe([])
+        
+        # Usar snapshot em memória (reload só se os dados mudaram no banco)
+        with self._snapshot_lock:
+            df, positions = self._select_view(
+                status_filter, tech_filter, last_change_month, next_change_month, search_text
+            )
+            return df.iloc[positions]
+    
+    def get_filtered_ids(self, status_filter=None, tech_filter=None, last_change_month=None,
+                         next_change_month=None, search_text=None):
+        """Ids (Cliente.id) de todos os clientes que casam com os filtros, em todas as páginas"""
+        if self.query_mode == 'sql':
+            try:
+                with db.get_session() as session:
+                    query = self.build_filtered_query(
+                        session, status_filter, tech_filter,
+                        last_change_month, next_change_month, search_text
+                    )
+                    return [row.id for row in query.with_entities(Cliente.id).order_by(None)]
+            except Exception as e:
+                logger.error(f"❌ Erro ao filtrar no banco: {e}")
+                return []
+    
+        with self._snapshot_lock:
+            df, positions = self._select_view(
+                status_filter, tech_filter, last_change_month, next_change_month, search_text
+            )
+            return [int(customer_id) for customer_id in df['ID'].to_numpy()[positions]]
+    
+    def _view_key(self, status_filter, tech_filter, last_change_month, next_change_month,
+                  search_text, sort_by):
+        """Chave normalizada de uma visão ('Todos'/vazio → None, busca normalizada)"""
+        def active(value):
+            return value if self._is_active_filter(value) else None
+        
+        return (
+            active(status_filter), active(tech_filter),
+            active(last_change_month), active(next_change_month),
+            normalize_text(search_text).strip() if search_text else '',
+            tuple(self._valid_sort(sort_by))
+        )
+    
+    def _select_view(self, status_filter=None, tech_filter=None, last_change_month=None,
+                     next_change_month=None, search_text=None, sort_by=None):
+        """
+        Posições no snapshot das linhas da visão (filtradas e ordenadas)
+        
+        Visões repetidas vêm do result_cache sem filtrar nem ordenar de novo;
+        a chave inclui cache_version, então escritas e reloads invalidam.
+        
+        Returns:
+            (snapshot, array de posições)
+        """
+        with self._snapshot_lock:
+            df = self.ensure_snapshot()
+            key = self._view_key(
+                status_filter, tech_filter, last_change_month, next_change_month, search_text, sort_by
+            ) + (self.cache_version,)
+            
+            positions = self.result_cache.get(key)
+            if positions is None:
+                selected = self._filter_frame(
+                    df, status_filter, tech_filter, last_change_month, next_change_month, search_text
+                )
+                selected = self._sort_frame(selected, sort_by)
+                positions = self.result_cache.put(key, df.index.get_indexer(selected.index))
+            return df, positions
+    
+    def _filter_frame(self, df_filtered, status_filter=None, tech_filter=None, last_change_month=None,
+                      next_change_month=None, search_text=None):
+        """Aplica os filtros do dashboard a um DataFrame em memória"""
+        # Busca por nome (sem acentos e sem diferenciar maiúsculas)
+        if search_text and search_text.strip():
+            if df_filtered is self.df:
+                df_filtered = df_filtered.iloc[self._name_search(df_filtered, search_text)]
+            else:
+                keys = df_filtered['Name'].map(normalize_text)
+                df_filtered = df_filtered[keys.str.contains(normalize_text(search_text).strip(), regex=False)]
         
         # SEMPRE excluir clientes inativos da visualização
         df_filtered = df_filtered[df_filtered['Status'] != 'Inactive']
         
         # Aplicar filtros
-        if status_filter and status_filter != 'Todos':
+        if self._is_active_filter(status_filter):
             df_filtered = df_filtered[df_filtered['Status'] == status_filter]
         
-        if tech_filter and tech_filter != 'Todos':
+        if self._is_active_filter(tech_filter):
             df_filtered = df_filtered[df_filtered['Route Tech'] == tech_filter]
         
         # Filtrar por mês da ÚLTIMA troca
-        if last_change_month and last_change_month != 'Todos':
-            def filter_last_month(date_str):
-                if not date_str:
-                    return False
-                try:
-                    dt = datetime.strptime(date_str, '%d/%m/%Y')
-                    return str(dt.month) == str(last_change_month)
-                except:
-                    return False
-            
-            df_filtered = df_filtered[df_filtered['Ultima Troca'].apply(filter_last_month)]
+        if self._is_active_filter(last_change_month):
+            df_filtered = df_filtered[self._month_mask(df_filtered['Ultima Troca'], last_change_month)]
         
         # Filtrar por mês da PRÓXIMA troca
-        if next_change_month and next_change_month != 'Todos':
-            def filter_next_month(date_str):
-                if not date_str:
-                    return False
-                try:
-                    dt = datetime.strptime(date_str, '%d/%m/%Y')
-                    return str(dt.month) == str(next_change_month)
-                except:
-                    return False
-            
-            df_filtered = df_filtered[df_filtered['Proxima Troca'].apply(filter_next_month)]
+        if self._is_active_filter(next_change_month):
+            df_filtered = df_filtered[self._month_mask(df_filtered['Proxima Troca'], next_change_month)]
         
         return df_filtered
     
+    def _name_search(self, df, search_text):
+        """Posições de `df` (o snapshot) cujo nome contém a busca, pelo índice de trigramas"""
+        with self._snapshot_lock:
+            if self._name_index is None or self._name_index[0] is not df:
+                started = time.perf_counter()
+                self._name_index = (df, NameSearchIndex(df['Name'].to_numpy()))
+                logger.info(f"🔎 Índice de busca construído: {len(df)} nomes em "
+                            f"{(time.perf_counter() - started) * 1000:.0f} ms")
+            index = self._name_index[1]
+        return index.search(search_text)
+    
+    def get_page(self, status_filter=None, tech_filter=None, last_change_month=None,
+                 next_change_month=None, search_text=None, sort_by=None,
+                 page_current=0, page_size=12):
+        """
+        Retorna apenas uma página do resultado filtrado e ordenado
+        
+        Args:
+            sort_by: Lista [(coluna do DataFrame, 'asc'|'desc'), ...]
+            page_current: Página (começando em 0)
+            page_size: Linhas por página
+        
+        Returns:
+            (DataFrame da página, total de linhas filtradas)
+        """
+        page_current = max(int(page_current or 0), 0)
+        page_size = max(int(page_size or 12), 1)
+        offset = page_current * page_size
+        
+        if self.query_mode == 'sql':
+            try:
+                with db.get_session() as session:
+                    query = self.build_filtered_query(
+                        session, status_filter, tech_filter,
+                        last_change_month, next_change_month, search_text, sort_by
+                    )
+                    total = query.order_by(None).count()
+                    rows = query.offset(offset).limit(page_size).all()
+                    return self._rows_to_dataframe(rows), total
+            except Exception as e:
+                logger.error(f"❌ Erro ao paginar no banco: {e}")
+                return self._rows_to_dataframe([]), 0
+        
+        with self._snapshot_lock:
+            df, positions = self._select_view(
+                status_filter, tech_filter, last_change_month, next_change_month, search_text, sort_by
+            )
+            return df.iloc[positions[offset:offset + page_size]], len(positions)
+    
+    def _sort_frame(self, df, sort_by):
+        """Ordenação estável (multi-coluna) do DataFrame em memória"""
+        sort_by = self._valid_sort(sort_by)
+        if not sort_by:
+            return df
+        
+        return df.sort_values(
+            by=[col for col, _ in sort_by],
+            ascending=[direction != 'desc' for _, direction in sort_by],
+            kind='mergesort'
+        )
+    
+    @staticmethod
+    def _month_mask(date_series, month):
+        """Máscara vetorizada: datas cujo mês é `month` (NaT nunca casa)"""
+        return date_series.dt.month == int(month)
+    
+    def _snapshot_values(self, column):
+        """Valores distintos presentes no snapshot (direto das categorias, sem query)"""
+        with self._snapshot_lock:
+            series = self.ensure_snapshot()[column]
+            codes = series.cat.codes.unique()
+            return [series.cat.categories[code] for code in codes if code >= 0]
+    
     def get_statuses(self):
         """Retorna lista de status únicos"""
         try:
+            if self.query_mode == 'snapshot':
+                return sorted([s for s in self._snapshot_values('Status') if s])
+            
             with db.get_session() as session:
                 statuses = session.query(Cliente.status).distinct().all()
                 return sorted([s[0] for s in statuses if s[0]])
         except:
             return ['Ativo', 'Ativo sem Rota', 'Inativo', 'Lead']
     
+    @staticmethod
+    def _split_technicians(values):
+        """Extrai piscineiros individuais (casos com vírgula) e normaliza os nomes"""
+        tech_set = set()
+        for value in values:
+            if not value or value == 'Não atribuído':
+                continue
+            
+            # Se contém vírgula, separar e adicionar individualmente
+            for name in value.split(','):
+                # Normalizar: strip espaços, remover pontos, strip novamente
+                normalized = name.strip().rstrip('.').strip()
+                if normalized:
+                    tech_set.add(normalized)
+        
+        return sorted(tech_set)
+    
     def get_technicians(self):
         """Retorna lista de piscineiros únicos (filtrando múltiplos piscineiros separados por vírgula)"""
         try:
-            with db.get_session() as session:
-                techs = session.query(Cliente.piscineiro).distinct().filter(
-                    Cliente.piscineiro.isnot(None),
-                    Cliente.piscineiro != '',
-                    Cliente.piscineiro != 'Não atribuído'
-                ).all()
-                
-                # Extrair piscineiros individuais (casos com vírgula)
-                tech_set = set()
-                for t in techs:
-                    if t[0]:
-                        # Se contém vírgula, separar e adicionar individualmente
-                        if ',' in t[0]:
-                            for name in t[0].split(','):
-                                # Normalizar: strip espaços, remover pontos, strip novamente
-                                normalized = name.strip().rstrip('.').strip()
-                                if normalized:
-                                    tech_set.add(normalized)
-                        else:
-                            # Normalizar: strip espaços, remover pontos, strip novamente
-                            normalized = t[0].strip().rstrip('.').strip()
-                            if normalized:
-                                tech_set.add(normalized)
-                
-                tech_list = sorted(list(tech_set))
-                logger.info(f"✅ Piscineiros encontrados: {tech_list}")
-                return tech_list
+            if self.query_mode == 'snapshot':
+                tech_list = self._split_technicians(self._snapshot_values('Route Tech'))
+            else:
+                with db.get_session() as session:
+                    techs = session.query(Cliente.piscineiro).distinct().filter(
+                        Cliente.piscineiro.isnot(None),
+                        Cliente.piscineiro != '',
+                        Cliente.piscineiro != 'Não atribuído'
+                    ).all()
+                    tech_list = self._split_technicians(t[0] for t in techs)
+            
+            logger.info(f"✅ Piscineiros encontrados: {tech_list}")
+            return tech_list
         except Exception as e:
             logger.error(f"❌ Erro ao buscar piscineiros: {e}")
             return []
@@ -388,7 +1236,7 @@ class PoolDataProcessor:
     def name_exists(self, name, exclude_id=None):
         """Verifica se um nome de cliente já existe"""
         try:
-            with db.get_session() as session:
+            with db.get_session(savepoint=True) as session:
                 query = session.query(Cliente).filter_by(nome=name)
                 
                 if exclude_id:
@@ -409,13 +1257,14 @@ class PoolDataProcessor:
             bool: True se adicionado com sucesso
         """
         try:
-            with db.get_session() as session:
+            with db.get_session(savepoint=True) as session:
                 # Verificar se nome já existe
                 if self.name_exists(customer_data.get('Name', '')):
                     logger.warning(f"Cliente '{customer_data.get('Name')}' já existe")
                     return False
                 
                 # Criar novo cliente
+                pending = self._begin_write(session)
                 cliente = Cliente(
                     nome=customer_data.get('Name', ''),
                     status=customer_data.get('Status', 'Ativo'),
@@ -428,127 +1277,159 @@ class PoolDataProcessor:
                 )
                 
                 session.add(cliente)
-                session.commit()
+                session.flush()  # Gera o ID para a auditoria
+                row = session.execute(select(*self._customer_columns()).where(Cliente.id == cliente.id)).first()
+                self._track_write(session, pending, [row], inserted=1)
                 
-                # Registrar auditoria
-                self.log_action('create', cliente_id=cliente.id, nome_cliente=cliente.nome)
+                # Registrar auditoria com os valores iniciais
+                initial = {column: (None, value) for column, value in row._mapping.items() if column != 'id' and value is not None}
+                self.log_action('create', row.id, row.nome, initial)
                 
                 logger.info(f"✅ Cliente '{cliente.nome}' adicionado com sucesso")
                 
-                # Recarregar DataFrame
-                self.load_data()
-                
                 return True
                 
         except Exception as e:
             logger.error(f"❌ Erro ao adicionar cliente: {e}")
             return False
     
-    def log_action(self, action, cliente_id=None, nome_cliente=None, campo=None, valor_anterior=None, valor_novo=None):
-        """Registra ação na tabela de auditoria"""
+    @staticmethod
+    def _changed_fields(old, row, columns):
+        """Diff de uma linha gravada: {coluna: (anterior, novo)} só das colunas que mudaram"""
+        return {
+            column: (old[column], getattr(row, column))
+            for column in columns
+            if old[column] != getattr(row, column)
+        }
+    
+    def log_action(self, action, cliente_id=None, nome_cliente=None, changes=None):
+        """
+        Registra ação na auditoria: uma linha com o diff da alteração
+        
+        Gravada em lote após o commit ou na transação de quem chamou (ver audit.py).
+        Alterações sem nenhum campo modificado não são registradas.
+        
+        Args:
+            changes: {campo: (anterior, novo)}
+        """
+        if action == 'update' and not changes:
+            return
         try:
-            with db.get_session() as session:
-                auditoria = Auditoria(
-                    cliente_id=cliente_id,
-                    nome_cliente=nome_cliente,
-                    acao=action,
-                    campo_alterado=campo,
-                    valor_anterior=valor_anterior,
-                    valor_novo=valor_novo,
-                    usuario='Sistema'
-                )
-                
-                session.add(auditoria)
-                session.commit()
-                
+            audit_log.record(action, cliente_id, nome_cliente, changes)
         except Exception as e:
             logger.error(f"❌ Erro ao registrar auditoria: {e}")
     
-    def get_monthly_revenue(self):
-        """Calcula faturamento mensal total baseado em clientes ativos e valor do filtro"""
+    # Status considerados ativos nos KPIs
+    ACTIVE_STATUSES = ('Ativo', 'Active (routed)')
+    
+    def get_kpis(self):
+        """
+        Retorna os três KPIs do dashboard com uma única query de agregação
+        
+        O resultado fica em cache pela versão dos dados e pela data de hoje
+        (a contagem de manutenções futuras vira à meia-noite). Escritas feitas
+        por este processador invalidam o cache.
+        
+        Returns:
+            dict com 'monthly_revenue', 'active_customers' e 'future_maintenance'
+        """
+        today = date.today()
+        version = self.current_data_version()
+        
+        cached = self._kpi_cache
+        if cached is not None and version is not None and cached[0] == (version, today):
+            self.kpi_stats['hits'] += 1
+            return dict(cached[1])
+        
+        self.kpi_stats['misses'] += 1
         try:
             with db.get_session() as session:
-                # Somar valor_filtro de todos os clientes ativos (valor_rota foi zerado)
-                total = session.query(func.sum(Cliente.valor_filtro)).filter(
-                    or_(
-                        Cliente.status == 'Ativo',
-                        Cliente.status == 'Active (routed)'
-                    )
-                ).scalar()
+                is_active = Cliente.status.in_(self.ACTIVE_STATUSES)
+                is_future = and_(Cliente.proxima_troca.isnot(None), Cliente.proxima_troca >= today)
+                
+                # SUM(CASE ...) em vez de COUNT(*) FILTER para funcionar também no MySQL
+                row = session.query(
+                    *self._version_columns(),
+                    func.sum(case((is_active, Cliente.valor_filtro), else_=0)),
+                    func.sum(case((is_active, 1), else_=0)),
+                    func.sum(case((is_future, 1), else_=0))
+                ).one()
                 
-                return float(total) if total else 0.00
+                counter, total, last_update, revenue, active, future = row
+                kpis = {
+                    'monthly_revenue': float(revenue) if revenue else 0.00,
+                    'active_customers': int(active or 0),
+                    'future_maintenance': int(future or 0)
+                }
+                
+                # A query também traz a versão: guardar o cache pela versão lida
+                version = self._make_version(counter, total, last_update)
+                with self._snapshot_lock:
+                    self._remember_db_version(version)
+                    self._kpi_cache = ((version, today), kpis)
+                
+                return dict(kpis)
                 
         except Exception as e:
-            logger.error(f"❌ Erro ao calcular faturamento mensal: {e}")
-            return 0.00
+            logger.error(f"❌ Erro ao calcular KPIs: {e}")
+            return {'monthly_revenue': 0.00, 'active_customers': 0, 'future_maintenance': 0}
+    
+    def adjust_kpis(self, kpis, before=None, after=None):
+        """
+        Ajusta KPIs já calculados pela troca de um cliente (sem nova agregação)
+
+        Args:
+            kpis: dict retornado por get_kpis
+            before: Cliente antes da alteração (None em uma criação)
+            after: Cliente depois da alteração (None em uma exclusão)
+        """
+        today = date.today()
+        adjusted = dict(kpis)
+        for customer, sign in ((before, -1), (after, 1)):
+            if not customer:
+                continue
+            if customer['Status'] in self.ACTIVE_STATUSES:
+                adjusted['monthly_revenue'] += sign * float(customer['Valor Filtro'] or 0)
+                adjusted['active_customers'] += sign
+            if customer['Proxima Troca'] and customer['Proxima Troca'] >= today:
+                adjusted['future_maintenance'] += sign
+        return adjusted
+
+    def get_monthly_revenue(self):
+        """Calcula faturamento mensal total baseado em clientes ativos e valor do filtro"""
+        return self.get_kpis()['monthly_revenue']
     
     def get_active_customers_count(self):
         """Conta total de clientes ativos"""
-        try:
-            with db.get_session() as session:
-                count = session.query(Cliente).filter(
-                    or_(
-                        Cliente.status == 'Ativo',
-                        Cliente.status == 'Active (routed)'
-                    )
-                ).count()
-                
-                return count
-                
-        except Exception as e:
-            logger.error(f"❌ Erro ao contar clientes ativos: {e}")
-            return 0
+        return self.get_kpis()['active_customers']
     
     def get_future_maintenance_count(self):
         """Conta manutenções futuras (clientes com próxima troca agendada)"""
-        try:
-            with db.get_session() as session:
-                from datetime import date
-                
-                count = session.query(Cliente).filter(
-                    Cliente.proxima_troca.isnot(None),
-                    Cliente.proxima_troca >= date.today()
-                ).count()
-                
-                return count
-                
-        except Exception as e:
-            logger.error(f"❌ Erro ao contar manutenções futuras: {e}")
-            return 0
+        return self.get_kpis()['future_maintenance']
     
-    def rename_customer(self, old_name, new_name):
-        """Renomeia um cliente"""
+    def rename_customer(self, customer_id, new_name):
+        """Renomeia um cliente (UPDATE pela chave primária)"""
         try:
-            with db.get_session() as session:
-                cliente = session.query(Cliente).filter_by(nome=old_name).first()
-                
-                if not cliente:
-                    logger.warning(f"Cliente '{old_name}' não encontrado para renomear")
-                    return False
-                
+            with db.get_session(savepoint=True) as session:
                 # Verificar se novo nome já existe
-                if self.name_exists(new_name):
+                if self.name_exists(new_name, exclude_id=customer_id):
                     logger.warning(f"Nome '{new_name}' já existe")
                     return False
                 
-                old_value = cliente.nome
-                cliente.nome = new_name
+                pending = self._begin_write(session)
+                result = self._update_customer_row(session, customer_id, {'nome': new_name})
+                if result is None:
+                    self._track_write(session, pending, [])  # só o incremento do contador
+                    logger.warning(f"Cliente id={customer_id} não encontrado para renomear")
+                    return False
                 
-                # Registrar auditoria
-                self.log_action(
-                    'update',
-                    cliente_id=cliente.id,
-                    nome_cliente=new_name,
-                    campo='nome',
-                    valor_anterior=old_value,
-                    valor_novo=new_name
-                )
+                old, row = result
+                self._track_write(session, pending, [row])
                 
-                session.commit()
-                logger.info(f"✅ Cliente renomeado: '{old_name}' → '{new_name}'")
+                # Registrar auditoria
+                self.log_action('update', row.id, row.nome, self._changed_fields(old, row, ['nome']))
                 
-                # Recarregar DataFrame
-                self.load_data()
+                logger.info(f"✅ Cliente renomeado: '{old['nome']}' → '{new_name}'")
                 
                 return True
                 
@@ -3,12 +3,16 @@ Configuração e gerenciamento do banco de dados
 Suporta: MySQL (Hostinger), PostgreSQL (Render), SQLite (local)
 """
 import os
+import re
+import time
+import functools
+import threading
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.pool import NullPool, QueuePool
 from contextlib import contextmanager
-from models import Base, Cliente, Auditoria
+from models import Base, Cliente, Auditoria, VersaoDados
 import logging
 
 # Carregar variáveis de ambiente
@@ -19,6 +23,150 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _env_bool(name, default):
+    """Lê variável de ambiente booleana (true/false, 1/0, yes/no)"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'sim')
+
+
+class QueryStats:
+    """
+    Estatísticas de SQL agregadas por callback e por fingerprint do statement
+    
+    O callback atual é definido por `track` (usado em Database.unit_of_work);
+    queries fora de um callback ficam em '(sem callback)'.
+    """
+    
+    NO_CALLBACK = '(sem callback)'
+    
+    _WHITESPACE = re.compile(r'\s+')
+    _IN_LIST = re.compile(r'\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*\)')
+    _LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    
+    def __init__(self, slow_query_ms=200, warn_query_count=6):
+        self.slow_query_ms = slow_query_ms
+        self.warn_query_count = warn_query_count
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {}   # callback → fingerprint → totais
+        self._calls = {}   # callback → totais por chamada
+        self.slow_queries = 0
+    
+    @classmethod
+    def fingerprint(cls, statement):
+        """Normaliza o SQL: espaços, literais e listas IN viram marcadores"""
+        normalized = cls._WHITESPACE.sub(' ', statement).strip()
+        normalized = cls._LITERAL.sub('?', normalized)
+        return cls._IN_LIST.sub('(?+)', normalized)
+    
+    @staticmethod
+    def bind_shape(parameters, executemany):
+        """Formato dos parâmetros (nomes/tipos, sem valores) para o log de queries lentas"""
+        if executemany and parameters:
+            return f"{len(parameters)} x {QueryStats.bind_shape(parameters[0], False)}"
+        if isinstance(parameters, dict):
+            return '{' + ', '.join(f"{k}: {type(v).__name__}" for k, v in parameters.items()) + '}'
+        if isinstance(parameters, (list, tuple)):
+            return '(' + ', '.join(type(v).__name__ for v in parameters) + ')'
+        return type(parameters).__name__
+    
+    @contextmanager
+    def track(self, callback_name):
+        """Marca as queries da thread atual como pertencentes a `callback_name`"""
+        if getattr(self._local, 'callback', None) is not None:
+            # Já dentro de um callback: contabilizar no externo
+            yield self._local.invocation
+            return
+        
+        self._local.callback = callback_name
+        self._local.invocation = {'queries': 0, 'db_ms': 0.0}
+        try:
+            yield self._local.invocation
+        finally:
+            invocation = self._local.invocation
+            self._local.callback = None
+            self._local.invocation = None
+            self._record_invocation(callback_name, invocation)
+    
+    def current_invocation(self):
+        """Contadores ({'queries', 'db_ms'}) do callback em execução na thread atual"""
+        return getattr(self._local, 'invocation', None)
+    
+    def record(self, statement, parameters, executemany, duration_ms, rowcount):
+        """Registra um statement executado (chamado pelos eventos do engine)"""
+        callback = getattr(self._local, 'callback', None) or self.NO_CALLBACK
+        key = self.fingerprint(statement)
+        
+        invocation = getattr(self._local, 'invocation', None)
+        if invocation is not None:
+            invocation['queries'] += 1
+            invocation['db_ms'] += duration_ms
+        
+        with self._lock:
+            entry = self._stats.setdefault(callback, {}).setdefault(key, {
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0
+            })
+            entry['count'] += 1
+            entry['total_ms'] += duration_ms
+            entry['max_ms'] = max(entry['max_ms'], duration_ms)
+            if rowcount and rowcount > 0:
+                entry['rows'] += rowcount
+            slow = duration_ms >= self.slow_query_ms
+            if slow:
+                self.slow_queries += 1
+        
+        if slow:
+            logger.warning(
+                f"🐢 Query lenta ({duration_ms:.1f} ms) em {callback}: {key} "
+                f"| binds: {self.bind_shape(parameters, executemany)}"
+            )
+    
+    def _record_invocation(self, callback_name, invocation):
+        """Agrega totais por chamada e alerta quando um callback faz queries demais"""
+        with self._lock:
+            entry = self._calls.setdefault(callback_name, {
+                'count': 0, 'queries': 0, 'max_queries': 0, 'db_ms': 0.0, 'max_db_ms': 0.0
+            })
+            entry['count'] += 1
+            entry['queries'] += invocation['queries']
+            entry['max_queries'] = max(entry['max_queries'], invocation['queries'])
+            entry['db_ms'] += invocation['db_ms']
+            entry['max_db_ms'] = max(entry['max_db_ms'], invocation['db_ms'])
+        
+        if self.warn_query_count and invocation['queries'] >= self.warn_query_count:
+            logger.warning(
+                f"⚠️ {callback_name} executou {invocation['queries']} queries "
+                f"({invocation['db_ms']:.1f} ms) em uma chamada - possível N+1"
+            )
+    
+    def snapshot(self):
+        """
+        Cópia das estatísticas: {callback: {'calls': {...}, 'statements': {fingerprint: {...}}}}
+        
+        'calls' traz número de chamadas, queries e tempo de banco (total e máximo por chamada).
+        """
+        with self._lock:
+            return {
+                callback: {
+                    'calls': dict(self._calls.get(callback, {})),
+                    'statements': {k: dict(v) for k, v in self._stats.get(callback, {}).items()}
+                }
+                for callback in set(self._stats) | set(self._calls)
+            }
+    
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._calls = {}
+            self.slow_queries = 0
+
+
+class TransactionFailed(Exception):
+    """Erro tratado dentro de uma sessão aninhada: a transação inteira foi desfeita"""
+
+
 class Database:
     """Classe para gerenciar conexões e sessões do banco de dados"""
     
@@ -50,29 +198,61 @@ class Database:
         # Configurar engine baseado no tipo de banco
         engine_kwargs = {
             'echo': False,  # True para debug SQL
-            'pool_pre_ping': True,  # Verifica conexões antes de usar
-            'pool_recycle': 3600,  # Reciclar conexões a cada 1 hora
+            'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),  # Verifica conexões antes de usar
+            'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 3600)),  # Reciclar conexões a cada 1 hora
         }
         
+        # Modo do pool: 'queue' (conexões reaproveitadas) ou 'null' (abre/fecha a cada sessão)
+        # MySQL sempre usou pool; PostgreSQL usa NullPool a menos que DB_POOL_MODE=queue
+        default_mode = 'queue' if self.is_mysql else 'null'
+        self.pool_mode = 'default' if self.is_sqlite else os.getenv('DB_POOL_MODE', default_mode).lower()
+        self.pool_prewarm = int(os.getenv('DB_POOL_PREWARM', 0))
+        
+        if not self.is_sqlite:
+            if self.pool_mode == 'queue':
+                engine_kwargs['poolclass'] = QueuePool
+                engine_kwargs['pool_size'] = int(os.getenv('DB_POOL_SIZE', 5))
+                engine_kwargs['max_overflow'] = int(os.getenv('DB_MAX_OVERFLOW', 10))
+                engine_kwargs['pool_timeout'] = int(os.getenv('DB_POOL_TIMEOUT', 30))
+                # LIFO: reutiliza a conexão mais recente e deixa as ociosas expirarem
+                engine_kwargs['pool_use_lifo'] = _env_bool('DB_POOL_USE_LIFO', True)
+            else:
+                engine_kwargs['poolclass'] = NullPool  # Sem pool - abre/fecha imediatamente
+        
         if self.is_mysql:
             # Configuração para MySQL (Hostinger)
-            engine_kwargs['poolclass'] = QueuePool
-            engine_kwargs['pool_size'] = 5
-            engine_kwargs['max_overflow'] = 10
-            engine_kwargs['pool_timeout'] = 30
             engine_kwargs['connect_args'] = {
                 'connect_timeout': 10,
                 'charset': 'utf8mb4'
             }
         elif self.is_postgresql:
             # Configuração para PostgreSQL (Render/outras plataformas)
-            engine_kwargs['poolclass'] = NullPool  # Sem pool - abre/fecha imediatamente
             engine_kwargs['connect_args'] = {
                 'connect_timeout': 10
             }
-        # SQLite não precisa de configurações especiais
         
         self.engine = create_engine(database_url, **engine_kwargs)
+        if self.is_sqlite:
+            self._install_sqlite_hooks()
+        
+        # Contadores do pool (expostos em pool_stats)
+        self._pool_counters = {'connects': 0, 'checkouts': 0, 'checkins': 0}
+        self._install_pool_hooks()
+        
+        # Instrumentação SQL: contagem/tempo por statement e por callback
+        self.query_stats = QueryStats(
+            slow_query_ms=float(os.getenv('DB_SLOW_QUERY_MS', 200)),
+            warn_query_count=int(os.getenv('DB_QUERY_WARN_COUNT', 6))
+        )
+        if _env_bool('DB_QUERY_STATS', True):
+            self._install_query_hooks()
+        
+        # Gunicorn faz fork do processo: o filho não pode herdar sockets do pai
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        
+        # Sessão ativa por thread (ver get_session/unit_of_work)
+        self._scope = threading.local()
         
         # Criar sessão factory
         self.SessionLocal = scoped_session(
@@ -83,7 +263,115 @@ class Database:
             )
         )
         
-        logger.info(f"✅ Banco de dados configurado: {self._mask_url(database_url)}")
+        logger.info(f"✅ Banco de dados configurado: {self._mask_url(database_url)} (pool: {self.pool_mode})")
+    
+    def _install_sqlite_hooks(self):
+        """
+        Transações explícitas no SQLite (necessário para SAVEPOINT)
+        
+        O driver sqlite3 só abre a transação antes de INSERT/UPDATE/DELETE: um
+        SAVEPOINT emitido antes disso abriria a transação sozinho e o seu
+        RELEASE faria commit de tudo. Com o BEGIN emitido pelo SQLAlchemy, o
+        SAVEPOINT fica sempre dentro da transação da sessão.
+        """
+        @event.listens_for(self.engine, 'connect')
+        def _sqlite_connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None  # o driver não emite BEGIN/COMMIT sozinho
+        
+        @event.listens_for(self.engine, 'begin')
+        def _sqlite_begin(conn):
+            # Direto no driver: BEGIN não entra na contagem de queries por callback
+            conn.connection.driver_connection.execute('BEGIN')
+    
+    def _install_pool_hooks(self):
+        """Registra eventos do pool para contar conexões, checkouts e checkins"""
+        counters = self._pool_counters
+        
+        @event.listens_for(self.engine, 'connect')
+        def _on_connect(dbapi_connection, connection_record):
+            counters['connects'] += 1
+        
+        @event.listens_for(self.engine, 'checkout')
+        def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+            counters['checkouts'] += 1
+        
+        @event.listens_for(self.engine, 'checkin')
+        def _on_checkin(dbapi_connection, connection_record):
+            counters['checkins'] += 1
+    
+    def _install_query_hooks(self):
+        """Registra before/after_cursor_execute para medir cada statement"""
+        stats = self.query_stats
+        
+        @event.listens_for(self.engine, 'before_cursor_execute')
+        def _before_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+        
+        @event.listens_for(self.engine, 'after_cursor_execute')
+        def _after_execute(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info['query_start'].pop()
+            duration_ms = (time.perf_counter() - started) * 1000
+            stats.record(statement, parameters, executemany, duration_ms, cursor.rowcount)
+    
+    def _after_fork(self):
+        """
+        Executado no processo filho após fork (workers do Gunicorn)
+        
+        Descarta as conexões herdadas sem fechá-las (elas pertencem ao pai)
+        e, se configurado, pré-aquece o pool do worker em segundo plano.
+        """
+        self._scope = threading.local()
+        self.SessionLocal.remove()
+        self.engine.dispose(close=False)
+        for key in self._pool_counters:
+            self._pool_counters[key] = 0
+        self.query_stats.reset()
+        
+        if self.pool_mode == 'queue' and self.pool_prewarm > 0:
+            threading.Thread(target=self.prewarm, name='db-prewarm', daemon=True).start()
+    
+    def prewarm(self, connections=None):
+        """
+        Abre N conexões antecipadamente e as devolve ao pool
+        
+        Args:
+            connections: Quantidade (se None, usa DB_POOL_PREWARM)
+        """
+        if connections is None:
+            connections = self.pool_prewarm
+        if connections <= 0 or self.pool_mode != 'queue':
+            return 0
+        
+        opened = []
+        try:
+            # Segurar todas ao mesmo tempo para forçar conexões distintas
+            for _ in range(connections):
+                opened.append(self.engine.connect())
+        except Exception as e:
+            logger.warning(f"⚠️ Pré-aquecimento do pool interrompido: {e}")
+        finally:
+            for conn in opened:
+                conn.close()
+        
+        logger.info(f"🔥 Pool pré-aquecido com {len(opened)} conexões")
+        return len(opened)
+    
+    def pool_stats(self):
+        """Retorna estatísticas do pool de conexões"""
+        pool = self.engine.pool
+        stats = {
+            'mode': self.pool_mode,
+            'pool_class': type(pool).__name__,
+            **self._pool_counters
+        }
+        
+        # QueuePool expõe ocupação; NullPool não mantém conexões
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            method = getattr(pool, name, None)
+            if callable(method):
+                stats[name] = method()
+        
+        return stats
     
     def _mask_url(self, url):
         """Mascara senha na URL para logs"""
@@ -97,19 +385,52 @@ class Database:
         return url
     
     def create_all_tables(self):
-        """Cria todas as tabelas no banco de dados"""
+        """
+        Cria todas as tabelas no banco de dados
+        
+        create_all não altera tabelas que já existem: em seguida aplica, na
+        ordem, as migrações idempotentes dos scripts migrate_*.py (coluna
+        auditoria.alteracoes, índices da versão e do histórico). Se
+        auditoria_campos acabou de ser criada, copia os campos alterados
+        das linhas de auditoria existentes.
+        """
         try:
+            audit_fields_missing = not inspect(self.engine).has_table('auditoria_campos')
             Base.metadata.create_all(bind=self.engine)
             logger.info("✅ Tabelas criadas/verificadas com sucesso")
+            self._upgrade_schema(audit_fields_missing)
             
             # Verificar se há dados
             with self.get_session() as session:
+                # Linha única do contador de versão dos dados
+                if session.get(VersaoDados, 1) is None:
+                    session.add(VersaoDados(id=1, versao=0))
                 count = session.query(Cliente).count()
                 logger.info(f"📊 Total de clientes no banco: {count}")
         except Exception as e:
             logger.error(f"❌ Erro ao criar tabelas: {e}")
             raise
     
+    def _upgrade_schema(self, copy_audit_fields_now):
+        """Migrações idempotentes de bancos criados antes das tabelas atuais"""
+        from migrate_version_index import create_version_index
+        from migrate_audit_changeset import upgrade_audit_changeset
+        from migrate_audit_history_index import create_history_indexes
+        from migrate_audit_campos import copy_audit_fields
+        
+        try:
+            with self.engine.connect() as conn:
+                create_version_index(conn)
+                upgrade_audit_changeset(conn)
+                create_history_indexes(conn)
+                if copy_audit_fields_now:
+                    copied = copy_audit_fields(conn)
+                    logger.info(f"✅ auditoria_campos preenchida: {copied} campos")
+        except Exception as e:
+            # Ex.: outro worker aplicando a mesma migração ao mesmo tempo
+            logger.warning(f"⚠️ Migração automática do schema falhou ({e}); "
+                           f"execute os scripts migrate_*.py (ver README)")
+    
     def drop_all_tables(self):
         """Remove todas as tabelas (CUIDADO!)"""
         logger.warning("⚠️ Removendo todas as tabelas do banco de dados...")
@@ -117,24 +438,130 @@ class Database:
         logger.info("✅ Tabelas removidas")
     
     @contextmanager
-    def get_session(self):
+    def get_session(self, savepoint=False):
         """
         Context manager para sessões do banco de dados
         
+        Reentrante: dentro de uma sessão já aberta na mesma thread (ex.: um
+        callback decorado com unit_of_work), chamadas aninhadas reutilizam
+        a mesma sessão e transação. Só a sessão mais externa faz commit,
+        rollback e close.
+        
+        Um erro que atravessa uma sessão aninhada marca a transação como
+        falha, mesmo que quem chamou trate a exceção: a sessão mais externa
+        faz rollback (no PostgreSQL a transação já está abortada), descarta
+        as ações de on_commit e levanta TransactionFailed. Operações que
+        podem falhar sem invalidar a transação usam savepoint=True.
+        
+        Args:
+            savepoint: Dentro de uma sessão já aberta, executa o bloco em um
+                SAVEPOINT: um erro desfaz só o bloco (descarta os on_commit e
+                executa os on_rollback registrados nele) e não marca a
+                transação como falha, então quem chamou pode tratar a exceção
+        
         Usage:
             with db.get_session() as session:
                 clientes = session.query(Cliente).all()
         """
+        active = getattr(self._scope, 'session', None)
+        if active is not None and savepoint:
+            failed = self._scope.failed
+            committed = len(self._scope.on_commit)
+            rolled_back = len(self._scope.on_rollback)
+            try:
+                with active.begin_nested():
+                    yield active
+            except Exception:
+                # O SAVEPOINT desfez o bloco: a transação externa continua válida
+                self._scope.failed = failed
+                del self._scope.on_commit[committed:]
+                callbacks = self._scope.on_rollback[rolled_back:]
+                del self._scope.on_rollback[rolled_back:]
+                self._run_callbacks(reversed(callbacks), "pós-rollback")
+                raise
+            return
+        
+        if active is not None:
+            try:
+                yield active
+            except Exception as e:
+                if self._scope.failed is None:
+                    self._scope.failed = e
+                raise
+            return
+        
         session = self.SessionLocal()
+        self._scope.session = session
+        self._scope.on_commit = []
+        self._scope.on_rollback = []
+        self._scope.failed = None
         try:
             yield session
+            if self._scope.failed is not None:
+                raise TransactionFailed(
+                    f"Transação desfeita: erro em operação aninhada ({self._scope.failed})"
+                ) from self._scope.failed
             session.commit()
+            callbacks = self._scope.on_commit
         except Exception as e:
             session.rollback()
             logger.error(f"❌ Erro na sessão do banco: {e}")
             raise
         finally:
+            self._scope.session = None
+            self._scope.on_commit = []
+            self._scope.on_rollback = []
+            self._scope.failed = None
             session.close()
+        
+        # Executar ações registradas para depois do commit (caches em memória etc.)
+        self._run_callbacks(callbacks, "pós-commit")
+    
+    @staticmethod
+    def _run_callbacks(callbacks, stage):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"❌ Erro em ação {stage}: {e}")
+    
+    def on_commit(self, callback):
+        """
+        Agenda `callback` para depois do commit da sessão atual
+        
+        Descartado se a transação fizer rollback. Fora de uma sessão,
+        executa imediatamente.
+        """
+        if getattr(self._scope, 'session', None) is None:
+            callback()
+        else:
+            self._scope.on_commit.append(callback)
+    
+    def on_rollback(self, callback):
+        """
+        Agenda `callback` para quando o SAVEPOINT atual (get_session(savepoint=True))
+        ou um que o contenha for desfeito
+        
+        Desfaz estado em memória ligado ao que o SAVEPOINT gravou. Um rollback
+        da transação inteira já descarta os on_commit e não executa estes.
+        Fora de uma sessão, não faz nada.
+        """
+        if getattr(self._scope, 'session', None) is not None:
+            self._scope.on_rollback.append(callback)
+    
+    def unit_of_work(self, func):
+        """
+        Decorator: executa a função (ex.: callback Dash) em uma única sessão
+        
+        Todos os acessos ao banco feitos durante a chamada compartilham uma
+        conexão e uma transação, com commit único no final.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.query_stats.track(func.__name__):
+                with self.get_session():
+                    return func(*args, **kwargs)
+        return wrapper
     
     def close(self):
         """Fecha todas as conexões"""
@@ -148,8 +575,9 @@ db = Database()
 
 
 def init_db():
-    """Inicializa o banco de dados (criar tabelas)"""
+    """Inicializa o banco de dados (criar tabelas e pré-aquecer o pool)"""
     db.create_all_tables()
+    db.prewarm()
 
 
 def get_db_session():
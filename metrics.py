@@ -0,0 +1,242 @@
+"""
+Métricas de desempenho do dashboard (formato texto do Prometheus)
+
+Histogramas em memória por processo: com Gunicorn, cada worker expõe os
+próprios números em /metrics.
+
+Usage:
+    @app.callback(...)
+    @metrics.instrument_callback
+    @db.unit_of_work
+    def meu_callback(...):
+        ...
+
+    metrics.init_app(server)
+"""
+import os
+import time
+import bisect
+import functools
+import threading
+from flask import g, has_request_context, Response
+from dash.exceptions import PreventUpdate
+from database import db
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Limites dos buckets (segundos / bytes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    inner = ','.join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for k, v in labels)
+    return '{' + inner + '}'
+
+
+class Histogram:
+    """Histograma cumulativo com labels (equivalente ao histogram do Prometheus)"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # labels → [contagens por bucket..., +Inf], soma
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._series[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: (list(c), s) for k, (c, s) in self._series.items()}
+
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Histogramas dos callbacks + coletores de métricas instantâneas (pool, caches)"""
+
+    def __init__(self):
+        self.callback_seconds = Histogram(
+            'dash_callback_duration_seconds', 'Tempo total de execução do callback', LATENCY_BUCKETS)
+        self.db_seconds = Histogram(
+            'dash_callback_db_seconds', 'Tempo gasto em SQL durante o callback', LATENCY_BUCKETS)
+        self.serialization_seconds = Histogram(
+            'dash_callback_serialization_seconds',
+            'Tempo entre o fim do callback e a resposta pronta (serialização JSON)', LATENCY_BUCKETS)
+        self.response_bytes = Histogram(
+            'dash_callback_response_bytes', 'Tamanho da resposta do callback', BYTES_BUCKETS)
+        self.queries = Histogram(
+            'dash_callback_queries', 'Queries SQL por chamada do callback', (1, 2, 3, 5, 8, 13, 21))
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._collectors = []
+
+    def instrument_callback(self, func):
+        """Decorator: mede tempo total, tempo de banco e queries do callback"""
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            with db.query_stats.track(name) as invocation:
+                try:
+                    return func(*args, **kwargs)
+                except PreventUpdate:
+                    raise
+                except Exception:
+                    with self._lock:
+                        self._errors[name] = self._errors.get(name, 0) + 1
+                    raise
+                finally:
+                    finished = time.perf_counter()
+                    self.callback_seconds.observe(finished - started, callback=name)
+                    self.db_seconds.observe(invocation['db_ms'] / 1000, callback=name)
+                    self.queries.observe(invocation['queries'], callback=name)
+
+                    # Serialização e bytes são medidos no after_request (resposta real do Dash)
+                    if has_request_context():
+                        g.metrics_callback = name
+                        g.metrics_callback_finished = finished
+        return wrapper
+
+    def register_collector(self, collector):
+        """
+        Registra função que devolve métricas instantâneas:
+        lista de (nome, tipo, ajuda, [(labels_dict, valor), ...])
+        """
+        self._collectors.append(collector)
+
+    def _after_request(self, response):
+        name = g.pop('metrics_callback', None)
+        finished = g.pop('metrics_callback_finished', None)
+        if name is not None and not response.direct_passthrough:
+            self.serialization_seconds.observe(time.perf_counter() - finished, callback=name)
+            self.response_bytes.observe(len(response.get_data()), callback=name)
+        return response
+
+    def render(self):
+        """Todas as métricas no formato texto do Prometheus"""
+        lines = []
+        for histogram in (self.callback_seconds, self.db_seconds, self.serialization_seconds,
+                          self.response_bytes, self.queries):
+            lines.extend(histogram.render())
+
+        lines += ["# HELP dash_callback_errors_total Exceções levantadas pelo callback",
+                  "# TYPE dash_callback_errors_total counter"]
+        with self._lock:
+            for name, count in sorted(self._errors.items()):
+                lines.append(f"dash_callback_errors_total{_format_labels((('callback', name),))} {count}")
+
+        for collector in [_database_metrics, _query_metrics] + self._collectors:
+            try:
+                for metric_name, metric_type, help_text, samples in collector():
+                    lines.append(f"# HELP {metric_name} {help_text}")
+                    lines.append(f"# TYPE {metric_name} {metric_type}")
+                    for labels, value in samples:
+                        lines.append(f"{metric_name}{_format_labels(tuple(sorted(labels.items())))} {value}")
+            except Exception as e:
+                logger.error(f"❌ Erro ao coletar métricas: {e}")
+
+        return '\n'.join(lines) + '\n'
+
+    def init_app(self, server, path=None):
+        """Registra a rota de métricas e a medição de resposta no servidor Flask"""
+        path = path or os.getenv('METRICS_PATH', '/metrics')
+        server.after_request(self._after_request)
+        server.add_url_rule(
+            path, 'metrics',
+            lambda: Response(self.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+        )
+        logger.info(f"📈 Métricas disponíveis em {path}")
+
+
+def _database_metrics():
+    """Pool de conexões e queries lentas"""
+    pool = db.pool_stats()
+    labels = {'mode': pool['mode']}
+    metrics = [
+        ('db_pool_connections_total', 'counter', 'Conexões abertas pelo pool', [(labels, pool['connects'])]),
+        ('db_pool_checkouts_total', 'counter', 'Checkouts de conexão', [(labels, pool['checkouts'])]),
+        ('db_slow_queries_total', 'counter', 'Queries acima de DB_SLOW_QUERY_MS',
+         [({}, db.query_stats.slow_queries)]),
+    ]
+    for key in ('size', 'checkedin', 'checkedout', 'overflow'):
+        if key in pool:
+            metrics.append((f'db_pool_{key}', 'gauge', f'Pool de conexões: {key}', [(labels, pool[key])]))
+    return metrics
+
+
+def _query_metrics():
+    """SQL por callback e por statement (db.query_stats.snapshot())"""
+    calls = {name: [] for name in ('calls', 'queries', 'seconds', 'max_queries', 'max_seconds')}
+    statements = {name: [] for name in ('executions', 'seconds', 'max_seconds', 'rows')}
+    for callback, stats in sorted(db.query_stats.snapshot().items()):
+        call = stats['calls']
+        if call:
+            labels = {'callback': callback}
+            calls['calls'].append((labels, call['count']))
+            calls['queries'].append((labels, call['queries']))
+            calls['seconds'].append((labels, call['db_ms'] / 1000))
+            calls['max_queries'].append((labels, call['max_queries']))
+            calls['max_seconds'].append((labels, call['max_db_ms'] / 1000))
+        for statement, entry in sorted(stats['statements'].items()):
+            labels = {'callback': callback, 'statement': statement}
+            statements['executions'].append((labels, entry['count']))
+            statements['seconds'].append((labels, entry['total_ms'] / 1000))
+            statements['max_seconds'].append((labels, entry['max_ms'] / 1000))
+            statements['rows'].append((labels, entry['rows']))
+    return [
+        ('db_callback_calls_total', 'counter', 'Chamadas de callback com SQL rastreado', calls['calls']),
+        ('db_callback_queries_total', 'counter', 'Queries executadas pelo callback', calls['queries']),
+        ('db_callback_query_seconds_total', 'counter', 'Tempo de SQL do callback', calls['seconds']),
+        ('db_callback_max_queries', 'gauge', 'Maior número de queries em uma chamada', calls['max_queries']),
+        ('db_callback_max_query_seconds', 'gauge', 'Maior tempo de SQL em uma chamada', calls['max_seconds']),
+        ('db_statement_executions_total', 'counter', 'Execuções por statement (fingerprint) e callback',
+         statements['executions']),
+        ('db_statement_seconds_total', 'counter', 'Tempo por statement (fingerprint) e callback',
+         statements['seconds']),
+        ('db_statement_max_seconds', 'gauge', 'Maior tempo de uma execução do statement', statements['max_seconds']),
+        ('db_statement_rows_total', 'counter', 'Linhas afetadas/retornadas pelo statement', statements['rows']),
+    ]
+
+
+def cache_metrics(caches):
+    """
+    Monta métricas de hit/miss e razão de acerto
+
+    Args:
+        caches: dict {nome_do_cache: (hits, misses)}
+    """
+    hits = [({'cache': name}, h) for name, (h, _) in caches.items()]
+    misses = [({'cache': name}, m) for name, (_, m) in caches.items()]
+    ratios = [({'cache': name}, (h / (h + m)) if (h + m) else 0.0) for name, (h, m) in caches.items()]
+    return [
+        ('app_cache_hits_total', 'counter', 'Acertos de cache', hits),
+        ('app_cache_misses_total', 'counter', 'Faltas de cache', misses),
+        ('app_cache_hit_ratio', 'gauge', 'Razão de acerto do cache', ratios),
+    ]
+
+
+# Instância global de métricas
+metrics = MetricsRegistry()
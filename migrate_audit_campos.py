@@ -0,0 +1,129 @@
+"""
+Script de Migração: Campos alterados da auditoria em tabela indexada
+
+O filtro por campo do histórico usava LIKE em auditoria.campo_alterado
+('status,tipo_filtro'), sem índice. Agora cada campo alterado é uma linha
+de auditoria_campos (auditoria_id, campo, timestamp) com o índice
+idx_auditoria_campos_campo_timestamp (campo, timestamp, auditoria_id).
+
+- Cria a tabela auditoria_campos e o índice
+- Preenche a tabela a partir de campo_alterado das linhas existentes
+  (formato antigo e de diff), em lotes; pode ser executado de novo
+"""
+import os
+from sqlalchemy import create_engine, select, insert, func
+from dotenv import load_dotenv
+import logging
+
+from models import Auditoria, AuditoriaCampo
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///lacqua_azzurra.db')
+
+BATCH_SIZE = 5000
+
+
+def copy_audit_fields(conn):
+    """Cria auditoria_campos na conexão e copia os campos que faltam; retorna quantos copiou"""
+    audit = Auditoria.__table__
+    fields = AuditoriaCampo.__table__
+
+    fields.create(bind=conn, checkfirst=True)
+    conn.commit()
+
+    # Lotes por id (sem OFFSET); campos já copiados são ignorados
+    last_id = 0
+    copied = 0
+    while True:
+        rows = conn.execute(
+            select(audit.c.id, audit.c.campo_alterado, audit.c.timestamp)
+            .where(audit.c.id > last_id,
+                   audit.c.campo_alterado.isnot(None),
+                   audit.c.timestamp.isnot(None))
+            .order_by(audit.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+
+        existing = set(conn.execute(
+            select(fields.c.auditoria_id, fields.c.campo)
+            .where(fields.c.auditoria_id.between(rows[0].id, rows[-1].id))
+        ).all())
+        batch = [
+            {'auditoria_id': row.id, 'campo': campo, 'timestamp': row.timestamp}
+            for row in rows
+            for campo in row.campo_alterado.split(',')
+            if campo and (row.id, campo) not in existing
+        ]
+        if batch:
+            conn.execute(insert(fields), batch)
+            copied += len(batch)
+        # Commit por lote também libera o snapshot de leitura
+        conn.commit()
+
+        last_id = rows[-1].id
+        logger.info(f"📝 Auditoria até id {last_id}: {copied} campos copiados")
+
+    return copied
+
+
+def migrate_audit_campos():
+    """Cria auditoria_campos e copia os campos alterados já registrados"""
+    try:
+        engine = create_engine(DATABASE_URL, echo=False)
+        fields = AuditoriaCampo.__table__
+
+        with engine.connect() as conn:
+            logger.info(f"🔧 Criando tabela auditoria_campos ({engine.dialect.name})...")
+            copied = copy_audit_fields(conn)
+            logger.info("✅ Tabela auditoria_campos e índice idx_auditoria_campos_campo_timestamp disponíveis")
+
+            total = conn.execute(select(func.count()).select_from(fields)).scalar()
+
+            logger.info("\n" + "="*60)
+            logger.info(f"✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            logger.info(f"📊 Campos copiados nesta execução: {copied}")
+            logger.info(f"📊 Total em auditoria_campos: {total}")
+            logger.info("="*60 + "\n")
+
+            return True
+
+    except Exception as e:
+        logger.error(f"❌ Erro na migração: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n" + "="*60)
+    print("🏷️  CAMPOS DA AUDITORIA INDEXADOS - L'Acqua Azzurra")
+    print("="*60)
+    print("\n📝 Alterações:")
+    print("  ✓ CREATE TABLE auditoria_campos (auditoria_id, campo, timestamp)")
+    print("  ✓ CREATE INDEX idx_auditoria_campos_campo_timestamp (campo, timestamp, auditoria_id)")
+    print("  ✓ Copia os campos de auditoria.campo_alterado para auditoria_campos\n")
+
+    # Aceitar -y como argumento para auto-confirmar
+    if "-y" in sys.argv or "--yes" in sys.argv:
+        resposta = 's'
+    else:
+        resposta = input("⚠️  Deseja continuar? (s/n): ").strip().lower()
+
+    if resposta == 's':
+        sucesso = migrate_audit_campos()
+
+        if sucesso:
+            print("\n✅ Migração concluída! O filtro por campo do histórico usa o índice.\n")
+        else:
+            print("\n❌ Migração falhou. Verifique os logs acima.\n")
+    else:
+        print("\n⏸️  Migração cancelada.\n")
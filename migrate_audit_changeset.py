@@ -0,0 +1,107 @@
+"""
+Script de Migração: Auditoria em formato de diff (uma linha por alteração)
+
+- Adiciona a coluna auditoria.alteracoes (JSON: {campo: [anterior, novo]})
+- Cria o índice idx_auditoria_cliente_timestamp (cliente_id, timestamp)
+- Remove ix_auditoria_cliente_id (coberto pelo índice composto)
+
+As linhas antigas (um campo por linha) continuam como estão: o leitor
+(audit.expand_changes) entende os dois formatos.
+"""
+import os
+from sqlalchemy import create_engine, inspect, text, MetaData, Table
+from dotenv import load_dotenv
+import logging
+
+from models import Auditoria
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///lacqua_azzurra.db')
+
+OLD_INDEX_NAME = 'ix_auditoria_cliente_id'
+
+
+def upgrade_audit_changeset(conn):
+    """Aplica a migração na conexão; pode ser executada de novo"""
+    table = Auditoria.__table__
+    inspector = inspect(conn)
+
+    columns = {column['name'] for column in inspector.get_columns('auditoria')}
+    if 'alteracoes' not in columns:
+        column_type = table.c.alteracoes.type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE auditoria ADD COLUMN alteracoes {column_type}"))
+        conn.commit()
+        logger.info(f"✅ Coluna alteracoes ({column_type}) adicionada")
+
+    composite = next(i for i in table.indexes if i.name == 'idx_auditoria_cliente_timestamp')
+    composite.create(bind=conn, checkfirst=True)
+    conn.commit()
+
+    # O índice composto atende às buscas (e à FK no MySQL) por cliente_id
+    indexes = {index['name'] for index in inspector.get_indexes('auditoria')}
+    if OLD_INDEX_NAME in indexes:
+        # Índice refletido: Index(..., table.c.x) se prenderia ao modelo
+        old_index = next(i for i in Table('auditoria', MetaData(), autoload_with=conn).indexes
+                         if i.name == OLD_INDEX_NAME)
+        old_index.drop(bind=conn)
+        conn.commit()
+        logger.info(f"✅ Índice {OLD_INDEX_NAME} removido")
+
+
+def migrate_audit_changeset():
+    """Atualiza a tabela auditoria para o formato de diff"""
+    try:
+        engine = create_engine(DATABASE_URL, echo=False)
+
+        with engine.connect() as conn:
+            logger.info(f"🔧 Iniciando migração da auditoria ({engine.dialect.name})...")
+            upgrade_audit_changeset(conn)
+            logger.info("✅ Coluna alteracoes e índice idx_auditoria_cliente_timestamp disponíveis")
+
+            total = conn.execute(text("SELECT COUNT(*) FROM auditoria")).scalar()
+
+            logger.info("\n" + "="*60)
+            logger.info(f"✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            logger.info(f"📊 Registros de auditoria existentes: {total}")
+            logger.info("="*60 + "\n")
+
+            return True
+
+    except Exception as e:
+        logger.error(f"❌ Erro na migração: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n" + "="*60)
+    print("📝 AUDITORIA EM FORMATO DE DIFF - L'Acqua Azzurra")
+    print("="*60)
+    print("\n📝 Alterações:")
+    print("  ✓ ADD COLUMN auditoria.alteracoes (JSON)")
+    print("  ✓ CREATE INDEX idx_auditoria_cliente_timestamp (cliente_id, timestamp)")
+    print(f"  ✓ DROP INDEX {OLD_INDEX_NAME} (coberto pelo índice composto)\n")
+
+    # Aceitar -y como argumento para auto-confirmar
+    if "-y" in sys.argv or "--yes" in sys.argv:
+        resposta = 's'
+    else:
+        resposta = input("⚠️  Deseja continuar? (s/n): ").strip().lower()
+
+    if resposta == 's':
+        sucesso = migrate_audit_changeset()
+
+        if sucesso:
+            print("\n✅ Migração concluída! Novas alterações gravam uma linha com o diff de todos os campos.\n")
+        else:
+            print("\n❌ Migração falhou. Verifique os logs acima.\n")
+    else:
+        print("\n⏸️  Migração cancelada.\n")
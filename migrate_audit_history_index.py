@@ -0,0 +1,101 @@
+"""
+Script de Migração: Índices do histórico de auditoria
+
+O histórico do dashboard pagina por (timestamp, id), sem OFFSET:
+- idx_auditoria_timestamp_id (timestamp, id): histórico geral e período
+- idx_auditoria_acao_timestamp (acao, timestamp, id): filtro por ação
+- idx_auditoria_cliente_timestamp (cliente_id, timestamp): histórico do cliente
+  (criado por migrate_audit_changeset.py; recriado aqui se faltar)
+
+Remove ix_auditoria_timestamp (coberto por idx_auditoria_timestamp_id).
+"""
+import os
+from sqlalchemy import create_engine, inspect, text, MetaData, Table
+from dotenv import load_dotenv
+import logging
+
+from models import Auditoria
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///lacqua_azzurra.db')
+
+OLD_INDEX_NAME = 'ix_auditoria_timestamp'
+
+
+def create_history_indexes(conn):
+    """Cria os índices do histórico na conexão; pode ser executada de novo"""
+    table = Auditoria.__table__
+
+    for index in sorted(table.indexes, key=lambda i: i.name):
+        index.create(bind=conn, checkfirst=True)
+        conn.commit()
+
+    indexes = {index['name'] for index in inspect(conn).get_indexes('auditoria')}
+    if OLD_INDEX_NAME in indexes:
+        # Índice refletido: Index(..., table.c.x) se prenderia ao modelo
+        old_index = next(i for i in Table('auditoria', MetaData(), autoload_with=conn).indexes
+                         if i.name == OLD_INDEX_NAME)
+        old_index.drop(bind=conn)
+        conn.commit()
+        logger.info(f"✅ Índice {OLD_INDEX_NAME} removido")
+
+
+def migrate_audit_history_index():
+    """Cria os índices compostos do histórico no banco configurado"""
+    try:
+        engine = create_engine(DATABASE_URL, echo=False)
+
+        with engine.connect() as conn:
+            logger.info(f"🔧 Criando índices do histórico ({engine.dialect.name})...")
+            create_history_indexes(conn)
+            for index in sorted(Auditoria.__table__.indexes, key=lambda i: i.name):
+                logger.info(f"✅ Índice {index.name} disponível")
+
+            total = conn.execute(text("SELECT COUNT(*) FROM auditoria")).scalar()
+
+            logger.info("\n" + "="*60)
+            logger.info(f"✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            logger.info(f"📊 Registros de auditoria indexados: {total}")
+            logger.info("="*60 + "\n")
+
+            return True
+
+    except Exception as e:
+        logger.error(f"❌ Erro na migração: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n" + "="*60)
+    print("🕘 ÍNDICES DO HISTÓRICO DE AUDITORIA - L'Acqua Azzurra")
+    print("="*60)
+    print("\n📝 Alterações:")
+    print("  ✓ CREATE INDEX idx_auditoria_timestamp_id (timestamp, id)")
+    print("  ✓ CREATE INDEX idx_auditoria_acao_timestamp (acao, timestamp, id)")
+    print("  ✓ CREATE INDEX idx_auditoria_cliente_timestamp (cliente_id, timestamp)")
+    print(f"  ✓ DROP INDEX {OLD_INDEX_NAME} (coberto pelo índice composto)\n")
+
+    # Aceitar -y como argumento para auto-confirmar
+    if "-y" in sys.argv or "--yes" in sys.argv:
+        resposta = 's'
+    else:
+        resposta = input("⚠️  Deseja continuar? (s/n): ").strip().lower()
+
+    if resposta == 's':
+        sucesso = migrate_audit_history_index()
+
+        if sucesso:
+            print("\n✅ Migração concluída! O histórico pagina pelos índices compostos.\n")
+        else:
+            print("\n❌ Migração falhou. Verifique os logs acima.\n")
+    else:
+        print("\n⏸️  Migração cancelada.\n")
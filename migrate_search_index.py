@@ -0,0 +1,153 @@
+"""
+Script de Migração: Índice de busca por nome (sem acentos e sem maiúsculas)
+
+PostgreSQL: extensões pg_trgm + unaccent, função imutável f_unaccent e
+índice GIN de trigramas em lower(f_unaccent(nome))
+SQLite: tabela FTS5 clientes_busca (tokenizer trigram) sincronizada por triggers
+MySQL: nada a fazer (collations utf8mb4 *_ai_ci já ignoram acentos no LIKE)
+
+O PoolDataProcessor detecta esses objetos e passa a usá-los na busca do modo sql.
+"""
+import os
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///lacqua_azzurra.db')
+
+
+def _migrate_postgres(conn):
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+    conn.commit()
+    logger.info("✅ Extensões pg_trgm e unaccent disponíveis")
+
+    # unaccent() é STABLE: índices de expressão exigem função IMMUTABLE
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS
+        $func$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $func$
+    """))
+    conn.commit()
+    logger.info("✅ Função f_unaccent criada")
+
+    conn.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_clientes_nome_busca
+        ON clientes USING gin (lower(f_unaccent(nome)) gin_trgm_ops)
+    """))
+    conn.commit()
+    logger.info("✅ Índice GIN idx_clientes_nome_busca criado")
+
+
+def _migrate_sqlite(conn):
+    # remove_diacritics no tokenizer trigram exige SQLite 3.45+
+    try:
+        conn.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS clientes_busca
+            USING fts5(nome, content='clientes', content_rowid='id',
+                       tokenize='trigram remove_diacritics 1')
+        """))
+        conn.commit()
+        logger.info("✅ Tabela FTS5 clientes_busca criada (trigram, sem acentos)")
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"⚠️ SQLite sem remove_diacritics no trigram ({getattr(e, 'orig', e)}); busca no banco diferenciará acentos")
+        conn.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS clientes_busca
+            USING fts5(nome, content='clientes', content_rowid='id', tokenize='trigram')
+        """))
+        conn.commit()
+        logger.info("✅ Tabela FTS5 clientes_busca criada (trigram)")
+
+    # Manter o índice sincronizado com a tabela clientes
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS clientes_busca_ai AFTER INSERT ON clientes BEGIN
+            INSERT INTO clientes_busca(rowid, nome) VALUES (new.id, new.nome);
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS clientes_busca_ad AFTER DELETE ON clientes BEGIN
+            INSERT INTO clientes_busca(clientes_busca, rowid, nome) VALUES ('delete', old.id, old.nome);
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS clientes_busca_au AFTER UPDATE OF nome ON clientes BEGIN
+            INSERT INTO clientes_busca(clientes_busca, rowid, nome) VALUES ('delete', old.id, old.nome);
+            INSERT INTO clientes_busca(rowid, nome) VALUES (new.id, new.nome);
+        END
+    """))
+    conn.commit()
+    logger.info("✅ Triggers de sincronização criados")
+
+    conn.execute(text("INSERT INTO clientes_busca(clientes_busca) VALUES ('rebuild')"))
+    conn.commit()
+    logger.info("✅ Índice FTS5 populado")
+
+
+def migrate_search_index():
+    """Cria o índice de busca por nome no banco configurado"""
+    try:
+        engine = create_engine(DATABASE_URL, echo=False)
+
+        with engine.connect() as conn:
+            logger.info("🔧 Iniciando criação do índice de busca...")
+            dialect = engine.dialect.name
+
+            if dialect == 'postgresql':
+                logger.info("🐘 Banco PostgreSQL detectado")
+                _migrate_postgres(conn)
+            elif dialect == 'sqlite':
+                logger.info("📦 Banco SQLite detectado")
+                _migrate_sqlite(conn)
+            else:
+                logger.info(f"ℹ️ Banco {dialect}: LIKE com collation *_ai_ci já ignora acentos; nada a fazer")
+
+            result = conn.execute(text("SELECT COUNT(*) FROM clientes"))
+            total = result.scalar()
+
+            logger.info("\n" + "="*60)
+            logger.info(f"✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            logger.info(f"📊 Clientes indexados: {total}")
+            logger.info("="*60 + "\n")
+
+            return True
+
+    except Exception as e:
+        logger.error(f"❌ Erro na migração: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n" + "="*60)
+    print("🔎 ÍNDICE DE BUSCA POR NOME - L'Acqua Azzurra")
+    print("="*60)
+    print("\n📝 Alterações:")
+    print("  ✓ PostgreSQL: pg_trgm + unaccent + índice GIN em lower(f_unaccent(nome))")
+    print("  ✓ SQLite: tabela FTS5 clientes_busca (trigram) + triggers\n")
+
+    # Aceitar -y como argumento para auto-confirmar
+    if "-y" in sys.argv or "--yes" in sys.argv:
+        resposta = 's'
+    else:
+        resposta = input("⚠️  Deseja continuar? (s/n): ").strip().lower()
+
+    if resposta == 's':
+        sucesso = migrate_search_index()
+
+        if sucesso:
+            print("\n✅ Migração concluída! A busca no modo sql passa a usar o índice.")
+            print("💡 Reinicie o app para que o índice seja detectado.\n")
+        else:
+            print("\n❌ Migração falhou. Verifique os logs acima.\n")
+    else:
+        print("\n⏸️  Migração cancelada.\n")
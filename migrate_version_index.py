@@ -0,0 +1,84 @@
+"""
+Script de Migração: Índice em clientes.atualizado_em
+
+A versão dos dados (COUNT + MAX(atualizado_em)) é consultada a cada
+verificação do snapshot e a cada escrita. Com o índice, o MAX deixa de
+varrer a tabela inteira. Bancos criados depois desta versão já têm o
+índice (models.py); este script cobre bancos existentes.
+"""
+import os
+from sqlalchemy import create_engine, func, select
+from dotenv import load_dotenv
+import logging
+
+from models import Cliente
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///lacqua_azzurra.db')
+
+INDEX_NAME = 'ix_clientes_atualizado_em'
+
+
+def create_version_index(conn):
+    """Cria o índice de atualizado_em na conexão (se ainda não existir)"""
+    index = next(i for i in Cliente.__table__.indexes if i.name == INDEX_NAME)
+    # checkfirst: funciona também no MySQL (sem CREATE INDEX IF NOT EXISTS)
+    index.create(bind=conn, checkfirst=True)
+    conn.commit()
+
+
+def migrate_version_index():
+    """Cria o índice de atualizado_em no banco configurado (se ainda não existir)"""
+    try:
+        engine = create_engine(DATABASE_URL, echo=False)
+
+        with engine.connect() as conn:
+            logger.info(f"🔧 Criando índice {INDEX_NAME} ({engine.dialect.name})...")
+            create_version_index(conn)
+            logger.info(f"✅ Índice {INDEX_NAME} disponível")
+
+            total = conn.execute(select(func.count()).select_from(Cliente)).scalar()
+
+        logger.info("\n" + "="*60)
+        logger.info(f"✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+        logger.info(f"📊 Clientes indexados: {total}")
+        logger.info("="*60 + "\n")
+
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Erro na migração: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n" + "="*60)
+    print("🕒 ÍNDICE DA VERSÃO DOS DADOS - L'Acqua Azzurra")
+    print("="*60)
+    print("\n📝 Alterações:")
+    print(f"  ✓ CREATE INDEX {INDEX_NAME} ON clientes (atualizado_em)\n")
+
+    # Aceitar -y como argumento para auto-confirmar
+    if "-y" in sys.argv or "--yes" in sys.argv:
+        resposta = 's'
+    else:
+        resposta = input("⚠️  Deseja continuar? (s/n): ").strip().lower()
+
+    if resposta == 's':
+        sucesso = migrate_version_index()
+
+        if sucesso:
+            print("\n✅ Migração concluída! Verificações de versão e escritas ficam mais rápidas.\n")
+        else:
+            print("\n❌ Migração falhou. Verifique os logs acima.\n")
+    else:
+        print("\n⏸️  Migração cancelada.\n")
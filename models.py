@@ -1,8 +1,8 @@
 """
 Models do Banco de Dados - L'Acqua Azzurra
-Tabelas: clientes, auditoria
+Tabelas: clientes, auditoria, auditoria_campos, versao_dados, buscas_clientes
 """
-from sqlalchemy import Column, Integer, String, Numeric, Boolean, Date, DateTime, ForeignKey, Text, Index
+from sqlalchemy import Column, Integer, BigInteger, String, Numeric, Boolean, Date, DateTime, ForeignKey, Text, Index, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -24,7 +24,7 @@ class Cliente(Base):
     ultima_troca = Column(Date)
     proxima_troca = Column(Date, index=True)
     criado_em = Column(DateTime(timezone=True), server_default=func.now())
-    atualizado_em = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    atualizado_em = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)  # versão dos dados
     
     # Índices compostos para queries comuns
     __table_args__ = (
@@ -52,19 +52,51 @@ class Cliente(Base):
         }
 
 
+class VersaoDados(Base):
+    """
+    Contador de versão dos dados de clientes (uma única linha, id=1)
+    
+    Incrementado dentro de toda transação que grava clientes: a versão muda
+    a cada commit, independente da resolução de atualizado_em.
+    """
+    __tablename__ = 'versao_dados'
+    
+    id = Column(Integer, primary_key=True)
+    versao = Column(BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<VersaoDados(versao={self.versao})>"
+
+
 class Auditoria(Base):
-    """Tabela de auditoria para rastrear todas as alterações"""
+    """
+    Tabela de auditoria para rastrear todas as alterações
+    
+    Uma linha por alteração de cliente: `alteracoes` guarda o diff de todos os
+    campos ({campo: [anterior, novo]}) e `campo_alterado` a lista dos campos
+    separados por vírgula (também em auditoria_campos, indexada para o filtro
+    por campo). Linhas antigas (um campo por linha) usam
+    valor_anterior/valor_novo; audit.expand_changes lê os dois formatos.
+    """
     __tablename__ = 'auditoria'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    cliente_id = Column(Integer, ForeignKey('clientes.id', ondelete='SET NULL'), index=True)
+    cliente_id = Column(Integer, ForeignKey('clientes.id', ondelete='SET NULL'))
     nome_cliente = Column(String(255))  # Guardar nome para histórico
     acao = Column(String(50), nullable=False)  # 'create', 'update', 'delete'
     campo_alterado = Column(String(100))
-    valor_anterior = Column(Text)
-    valor_novo = Column(Text)
+    valor_anterior = Column(Text)  # formato antigo (um campo por linha)
+    valor_novo = Column(Text)  # formato antigo (um campo por linha)
+    alteracoes = Column(JSON(none_as_null=True))  # NOVO: {campo: [anterior, novo]}
     usuario = Column(String(100), default='Sistema')
-    timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Histórico paginado por (timestamp, id): geral, por ação e por cliente
+    __table_args__ = (
+        Index('idx_auditoria_timestamp_id', 'timestamp', 'id'),
+        Index('idx_auditoria_acao_timestamp', 'acao', 'timestamp', 'id'),
+        Index('idx_auditoria_cliente_timestamp', 'cliente_id', 'timestamp'),
+    )
     
     def __repr__(self):
         return f"<Auditoria(id={self.id}, acao='{self.acao}', cliente='{self.nome_cliente}')>"
@@ -79,6 +111,46 @@ class Auditoria(Base):
             'campo_alterado': self.campo_alterado,
             'valor_anterior': self.valor_anterior,
             'valor_novo': self.valor_novo,
+            'alteracoes': self.alteracoes,
             'usuario': self.usuario,
             'timestamp': self.timestamp.isoformat() if self.timestamp else None
         }
+
+
+class AuditoriaCampo(Base):
+    """
+    Campos alterados de cada linha da auditoria (uma linha por campo)
+    
+    Permite filtrar o histórico por campo pelo índice (campo, timestamp,
+    auditoria_id), sem LIKE em campo_alterado. timestamp é copiado da
+    linha da auditoria para a paginação por chave usar só este índice.
+    """
+    __tablename__ = 'auditoria_campos'
+    
+    auditoria_id = Column(Integer, ForeignKey('auditoria.id', ondelete='CASCADE'), primary_key=True)
+    campo = Column(String(100), primary_key=True)
+    timestamp = Column(DateTime(timezone=True), nullable=False)
+    
+    __table_args__ = (
+        Index('idx_auditoria_campos_campo_timestamp', 'campo', 'timestamp', 'auditoria_id'),
+    )
+    
+    def __repr__(self):
+        return f"<AuditoriaCampo(auditoria_id={self.auditoria_id}, campo='{self.campo}')>"
+
+
+class BuscaCliente(Base):
+    """
+    Última busca de cada navegador (single-flight da busca)
+    
+    Compartilhada entre os workers: uma busca cuja sequência é menor que a
+    gravada aqui já foi substituída e não precisa ser calculada.
+    """
+    __tablename__ = 'buscas_clientes'
+    
+    client_id = Column(String(64), primary_key=True)
+    seq = Column(Integer, nullable=False)
+    atualizado_em = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
+    
+    def __repr__(self):
+        return f"<BuscaCliente(client_id='{self.client_id}', seq={self.seq})>"
@@ -0,0 +1,105 @@
+"""
+Single-flight da busca de clientes entre workers
+
+Cada navegador numera as suas buscas (search-seq-store) e a sequência mais
+recente de cada um fica no banco (tabela buscas_clientes), visível a todos
+os workers do Gunicorn. Uma busca cuja sequência é menor que a gravada já
+foi substituída: o callback termina sem calcular nem enviar a página.
+
+Usage:
+    from search_flight import search_flight
+
+    if search_flight.begin(client_id, seq):
+        return no_update  # busca mais nova do mesmo navegador já chegou
+    ...
+    if search_flight.is_stale(client_id, seq):
+        return no_update
+"""
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.exc import IntegrityError
+from database import db
+from models import BuscaCliente
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Navegadores sem buscar há mais que isso saem da tabela
+SEARCH_CLIENTS_TTL_HOURS = int(os.getenv('SEARCH_CLIENTS_TTL_HOURS', 24))
+
+
+class SearchFlight:
+    """Sequência da última busca de cada navegador, compartilhada pelo banco"""
+
+    def __init__(self, database):
+        self.database = database
+        self.stats = {'requests': 0, 'dropped': 0}
+        self._stats_lock = threading.Lock()
+
+    def begin(self, client_id, seq):
+        """
+        Registra a busca `seq` do navegador como a mais recente (se for)
+
+        Usa uma conexão própria com commit imediato: os outros workers veem
+        a sequência mesmo com a transação do callback ainda aberta.
+
+        Returns:
+            True se uma busca mais nova do mesmo navegador já chegou
+        """
+        table = BuscaCliente.__table__
+        with self._stats_lock:
+            self.stats['requests'] += 1
+
+        try:
+            with self.database.engine.begin() as conn:
+                updated = conn.execute(
+                    update(table)
+                    .where(table.c.client_id == client_id, table.c.seq < seq)
+                    .values(seq=seq)
+                ).rowcount
+                if updated:
+                    return False
+
+                latest = conn.execute(
+                    select(table.c.seq).where(table.c.client_id == client_id)
+                ).scalar()
+                if latest is None:
+                    # Navegador novo: aproveita para remover os inativos
+                    expired = datetime.now(timezone.utc) - timedelta(hours=SEARCH_CLIENTS_TTL_HOURS)
+                    conn.execute(delete(table).where(table.c.atualizado_em < expired))
+                    conn.execute(insert(table).values(client_id=client_id, seq=seq))
+                    return False
+        except IntegrityError:
+            # Primeira busca do navegador registrada ao mesmo tempo por outro worker
+            return False
+        except Exception as e:
+            # Sem o registro a busca segue normalmente (apenas não é descartada)
+            logger.warning(f"⚠️ Erro ao registrar busca: {e}")
+            return False
+
+        return self._count_stale(latest > seq)
+
+    def is_stale(self, client_id, seq):
+        """Indica (e contabiliza) se uma busca mais nova do mesmo navegador já chegou"""
+        table = BuscaCliente.__table__
+        try:
+            with self.database.engine.connect() as conn:
+                latest = conn.execute(
+                    select(table.c.seq).where(table.c.client_id == client_id)
+                ).scalar()
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao consultar busca: {e}")
+            return False
+        return self._count_stale(latest is not None and latest > seq)
+
+    def _count_stale(self, stale):
+        if stale:
+            with self._stats_lock:
+                self.stats['dropped'] += 1
+        return stale
+
+
+# Instância global do single-flight da busca
+search_flight = SearchFlight(db)
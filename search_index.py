@@ -0,0 +1,180 @@
+"""
+Índice de busca por nome de cliente (sem acento e sem diferenciar maiúsculas)
+
+Construído a partir do snapshot em memória: cada nome vira uma chave
+normalizada e cada trigrama da chave aponta para as linhas que o contêm.
+Uma busca intersecta as listas dos trigramas da consulta e confirma o
+trecho nas poucas candidatas; consultas com menos de 3 caracteres fazem
+varredura linear das chaves.
+"""
+import unicodedata
+import numpy as np
+import pandas as pd
+
+NGRAM = 3
+
+
+def strip_accents(text):
+    """Remove acentos (decomposição NFKD sem as marcas combinantes)"""
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def normalize_text(text):
+    """Chave de busca: sem acentos e casefold ("João" → "joao")"""
+    if text is None or (not isinstance(text, str) and pd.isna(text)):
+        return ''
+    return strip_accents(text).casefold()
+
+
+def _normalize_all(names):
+    """
+    normalize_text em lote: nomes só ASCII usam lower(); os demais são
+    normalizados palavra a palavra com cache (nomes e sobrenomes se repetem)
+    """
+    word_cache = {}
+
+    def normalize_word(word):
+        if word.isascii():
+            return word.lower()
+        key = word_cache.get(word)
+        if key is None:
+            key = word_cache[word] = normalize_text(word)
+        return key
+
+    def normalize_name(name):
+        if not isinstance(name, str):
+            return normalize_text(name)
+        if name.isascii():
+            return name.lower()
+        return ' '.join(map(normalize_word, name.split(' ')))
+
+    return [normalize_name(name) for name in names]
+
+
+def _gram_codes(codepoints):
+    """Trigramas como inteiros: três code points de 21 bits em um int64"""
+    codepoints = codepoints.astype(np.int64)
+    return (codepoints[..., :-2] << 42) | (codepoints[..., 1:-1] << 21) | codepoints[..., 2:]
+
+
+def _key_grams(key):
+    """Conjunto de trigramas (como inteiros) de uma chave normalizada"""
+    if len(key) < NGRAM:
+        return set()
+    codepoints = np.array([key], dtype=f'<U{len(key)}').view(np.uint32)
+    return set(_gram_codes(codepoints).tolist())
+
+
+class NameSearchIndex:
+    """Índice de trigramas sobre as chaves normalizadas dos nomes"""
+
+    BUILD_CHUNK = 100_000  # linhas por bloco na construção (limita a memória temporária)
+
+    def __init__(self, names):
+        """
+        Args:
+            names: Sequência de nomes; as posições retornadas por search()
+                são as posições nessa sequência
+        """
+        self.keys = np.array(_normalize_all(names), dtype=object)
+        self._postings = self._build_postings(self.keys)
+
+    @classmethod
+    def _build_postings(cls, keys):
+        """trigrama → array ordenado (sem repetição) das posições que o contêm"""
+        all_grams, all_rows = [], []
+        key_lengths = np.fromiter(map(len, keys), dtype=np.int64, count=len(keys))
+        for start in range(0, len(keys), cls.BUILD_CHUNK):
+            chunk = keys[start:start + cls.BUILD_CHUNK]
+            lengths = key_lengths[start:start + cls.BUILD_CHUNK]
+            width = int(lengths.max()) if len(lengths) else 0
+            if width < NGRAM:
+                continue
+
+            # Matriz de code points (linhas × largura), zeros à direita
+            codepoints = np.array(chunk, dtype=f'<U{width}').view(np.uint32).reshape(len(chunk), width)
+            grams = _gram_codes(codepoints)
+            valid = np.arange(width - NGRAM + 1) < (lengths - NGRAM + 1)[:, None]
+
+            all_grams.append(grams[valid])
+            all_rows.append(np.nonzero(valid)[0] + start)
+
+        if not all_grams:
+            return {}
+
+        # Trigramas → códigos densos; chave única código * n + linha ordenada
+        # de uma vez (agrupa por trigrama com posições crescentes)
+        codes, uniques = pd.factorize(np.concatenate(all_grams))
+        size = len(keys)
+        pairs = codes.astype(np.int64) * size + np.concatenate(all_rows)
+        pairs.sort()
+
+        # Remover (trigrama, linha) repetidos (trigrama que aparece 2x no mesmo nome)
+        pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]]
+        pair_codes, rows = np.divmod(pairs, size)
+        rows = rows.astype(np.int32)  # metade da memória das listas
+
+        starts = np.flatnonzero(np.r_[True, pair_codes[1:] != pair_codes[:-1]])
+        return dict(zip(uniques[pair_codes[starts]].tolist(), np.split(rows, starts[1:])))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def update(self, position, name):
+        """Troca o nome da linha `position` (só as listas dos trigramas alterados)"""
+        old_key = self.keys[position]
+        new_key = normalize_text(name)
+        if new_key == old_key:
+            return
+
+        old_grams, new_grams = _key_grams(old_key), _key_grams(new_key)
+        for gram in old_grams - new_grams:
+            posting = self._postings[gram]
+            posting = np.delete(posting, np.searchsorted(posting, position))
+            if len(posting):
+                self._postings[gram] = posting
+            else:
+                del self._postings[gram]
+        for gram in new_grams - old_grams:
+            posting = self._postings.get(gram, np.array([], dtype=np.int32))
+            self._postings[gram] = np.insert(posting, np.searchsorted(posting, position), position)
+        self.keys[position] = new_key
+
+    def append(self, names):
+        """Acrescenta nomes nas posições seguintes à última (listas continuam ordenadas)"""
+        start = len(self.keys)
+        keys = _normalize_all(names)
+        self.keys = np.concatenate([self.keys, np.array(keys, dtype=object)])
+        for position, key in enumerate(keys, start):
+            for gram in _key_grams(key):
+                posting = self._postings.get(gram, np.array([], dtype=np.int32))
+                self._postings[gram] = np.append(posting, np.int32(position))
+
+    def search(self, query):
+        """
+        Posições (ordem crescente) cujos nomes contêm `query`
+
+        Returns:
+            numpy array de posições
+        """
+        needle = normalize_text(query).strip()
+        if not needle:
+            return np.arange(len(self.keys))
+
+        if len(needle) < NGRAM:
+            return np.flatnonzero([needle in key for key in self.keys])
+
+        candidates = None
+        # Começar pela lista mais curta reduz o custo das interseções
+        for posting in sorted((self._postings.get(gram) for gram in _key_grams(needle)),
+                              key=lambda p: -1 if p is None else len(p)):
+            if posting is None:
+                return np.array([], dtype=np.int64)
+            candidates = posting if candidates is None else np.intersect1d(candidates, posting, assume_unique=True)
+            if len(candidates) == 0:
+                return candidates
+
+        # Trigramas presentes não garantem o trecho contíguo: confirmar
+        keys = self.keys
+        return candidates[[needle in keys[pos] for pos in candidates]]
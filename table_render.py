@@ -0,0 +1,97 @@
+"""
+Renderização das células da tabela de clientes (badges HTML e textos formatados)
+Usado pelo PoolDataProcessor para manter um cache de linhas já renderizadas
+"""
+import pandas as pd
+
+# Formatos de data (o DataFrame guarda datetime64; formatação só na apresentação)
+BR_DATE_FORMAT = '%d/%m/%Y'
+ISO_DATE_FORMAT = '%Y-%m-%d'
+
+# Colunas da tabela de clientes → colunas do DataFrame do processador
+TABLE_COLUMN_FIELDS = {
+    'CLIENTE': 'Name',
+    'STATUS': 'Status',
+    'PISCINEIRO': 'Route Tech',
+    'ÚLTIMA TROCA': 'Ultima Troca',
+    'PRÓXIMA TROCA': 'Proxima Troca',
+    'TIPO FILTRO': 'Tipo Filtro',
+    'VALOR FILTRO': 'Valor Filtro'
+}
+
+# Colunas exibidas como markdown (HTML liberado em markdown_options)
+MARKDOWN_COLUMNS = ['STATUS', 'VALOR FILTRO', 'TIPO FILTRO']
+
+# Chave de linha da DataTable (Cliente.id; não exibida como coluna)
+ROW_ID_COLUMN = 'id'
+
+
+def format_dates(series, date_format, empty):
+    """Formata uma coluna datetime64 de uma vez (vetorizado); NaT vira `empty`"""
+    formatted = series.dt.strftime(date_format)
+    return formatted.where(series.notna(), empty)
+
+
+def format_status(status):
+    """Badge HTML do status"""
+    if 'Active (routed)' in str(status):
+        return '<span class="badge-status badge-ativo">✓ Ativo</span>'
+    elif 'Active (no route)' in str(status):
+        return '<span class="badge-status badge-ativo-sem-rota">○ Ativo (sem rota)</span>'
+    elif 'Inactive' in str(status):
+        return '<span class="badge-status badge-inativo">✕ Inativo</span>'
+    elif 'Lead' in str(status):
+        return '<span class="badge-status badge-lead">⚬ Lead</span>'
+    return str(status)
+
+
+def format_tipo_filtro(tipo):
+    """Badge HTML do tipo de filtro"""
+    if pd.notna(tipo) and str(tipo) != '':
+        return '<span class="metodo-badge">🔷 ' + str(tipo) + '</span>'
+    return '<span class="metodo-na">—</span>'
+
+
+def _map_values(series, formatter):
+    """Aplica `formatter` uma vez por valor distinto (categorias) em vez de por linha"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        mapping = {category: formatter(category) for category in series.cat.categories}
+        return series.map(mapping).astype(object).fillna(formatter(None))
+    return series.map(formatter)
+
+
+def render_rows(df):
+    """
+    Renderiza as células exibidas das linhas de `df` (mais o id do cliente)
+
+    Os valores brutos do modal de edição não vão para o navegador:
+    são buscados pelo id quando o modal abre.
+
+    Returns:
+        DataFrame com o mesmo índice de `df` e as colunas da tabela
+    """
+    rendered = pd.DataFrame(index=df.index)
+    rendered[ROW_ID_COLUMN] = df['ID']
+    rendered['CLIENTE'] = df['Name']
+    rendered['STATUS'] = _map_values(df['Status'], format_status)
+    rendered['PISCINEIRO'] = df['Route Tech'].astype(object).fillna('—')
+    rendered['ÚLTIMA TROCA'] = format_dates(df['Ultima Troca'], BR_DATE_FORMAT, 'Não agendado')
+    rendered['PRÓXIMA TROCA'] = format_dates(df['Proxima Troca'], BR_DATE_FORMAT, 'Não agendado')
+    rendered['TIPO FILTRO'] = _map_values(df['Tipo Filtro'], format_tipo_filtro)
+
+    valor = df['Valor Filtro']
+    rendered['VALOR FILTRO'] = ('<span class="valor-mensal">R$ ' + valor.map('{:.2f}'.format) + '</span>').where(
+        valor.notna() & (valor > 0), '<span class="valor-na">—</span>'
+    )
+
+    return rendered
+
+
+def table_columns():
+    """Definição das colunas da DataTable"""
+    return [
+        ({"name": col, "id": col, "presentation": "markdown"}
+         if col in MARKDOWN_COLUMNS
+         else {"name": col, "id": col})
+        for col in TABLE_COLUMN_FIELDS
+    ]